@@ -100,6 +100,27 @@ export const userAPI = {
     clearChatHistory: () => api.delete('/chat/clear'),
 };
 
+// 提交图片识别任务并轮询结果，返回与原同步接口相同结构的响应
+const analyzeImageJob = async (data, { interval = 1000, timeout = 120000 } = {}) => {
+    const submitted = await api.post('/orders/analyze-jobs', data);
+    const jobId = submitted.data.data.id;
+    const deadline = Date.now() + timeout;
+    while (Date.now() < deadline) {
+        const response = await api.get(`/orders/analyze-jobs/${jobId}`);
+        const job = response.data.data;
+        if (job.status === 'succeeded') {
+            return { ...response, data: { ...response.data, data: job.result } };
+        }
+        if (job.status === 'failed' || job.status === 'cancelled') {
+            return { ...response, data: { success: false, message: job.error || 'AI识别失败' } };
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+    // 超时后取消仍在排队的任务
+    api.delete(`/orders/analyze-jobs/${jobId}`).catch(() => {});
+    throw new Error('AI识别超时');
+};
+
 export const orderAPI = {
     getOrders: () => api.get('/orders'), 
     createOrder: (data) => api.post('/orders', data), 
@@ -109,7 +130,7 @@ export const orderAPI = {
     deleteOrder: (id) => api.delete(`/orders/${id}`),
     completeOrder: (id) => api.post(`/orders/${id}/complete`),
     
-    analyzeOrderImage: (data) => api.post('/orders/analyze-image', data),
+    analyzeOrderImage: (data) => analyzeImageJob(data),
     uploadOrderImage: (formData) => api.post('/orders/upload_image', formData, {
         headers: {
             'Content-Type': 'multipart/form-data'
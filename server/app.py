@@ -1,13 +1,22 @@
-from flask import Flask, Response, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, redirect, url_for
 from flask_cors import CORS, cross_origin
 from flask_jwt_extended import JWTManager
 from config import Config
 from models import db
+from models.schema import ensure_schema
+from utils.uploads import send_upload
 from models.user import User
-from models.order import Order  
+from models.order import Order, backfill_origin_geohash, reserve_archived_order_ids
 from models.deliverer import Deliverer
 from models.address import Address
 from models.chat_message import ChatMessage  # 添加这行
+from models.place import Place
+from models.order_event import OrderEvent
+from models.order_rollup import OrderRollup, RollupCheckpoint
+from models.analysis_job import AnalysisJob
+from models.ai_cache_entry import AiCacheEntry
+from models.image_variant import ImageVariant
+from models.blob import Blob
 import os
 import traceback
 
@@ -87,6 +96,9 @@ def create_app():
     from routes.chat import chat_bp  # 导入聊天路由
     from routes.riders import riders_bp  # 导入骑手路由
     from routes.messages import messages_bp  # 导入消息路由
+    from routes.metrics import metrics_bp  # 导入运行指标路由
+    from routes.dispatch import dispatch_bp  # 导入派单路由
+    from routes.stats import stats_bp  # 导入统计路由
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(users_bp, url_prefix='/api/users')
@@ -96,11 +108,25 @@ def create_app():
     app.register_blueprint(chat_bp, url_prefix='/api/chat')  # 注册聊天路由
     app.register_blueprint(riders_bp, url_prefix='/api/riders')  # 注册骑手路由
     app.register_blueprint(messages_bp, url_prefix='/api/messages')  # 注册消息路由
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')  # 注册运行指标路由
+    app.register_blueprint(dispatch_bp, url_prefix='/api/dispatch')  # 注册派单路由
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')  # 注册统计路由
 
     @app.route('/static/uploads/<filename>')
     def uploaded_file(filename):
-        upload_folder = app.config.get('UPLOAD_FOLDER')
-        return send_from_directory(upload_folder, filename)
+        from services.image_pipeline import image_pipeline
+        from services.storage import storage, is_content_addressed
+        immutable = is_content_addressed(filename)
+        # ?size= 重定向到不小于该尺寸的缩略图（缩略图有自己的文件名，可长期缓存），
+        # 缩略图尚未生成时返回原图；该地址之后会重定向，不能长期缓存
+        size = request.args.get('size', type=int)
+        if size:
+            thumbnail = image_pipeline.thumbnail_for(filename, size)
+            if thumbnail:
+                return redirect(url_for('uploaded_file', filename=thumbnail))
+            immutable = False
+        # 内容寻址文件位于两级子目录中，旧文件仍在上传目录下平铺
+        return send_upload(filename, storage.path(filename), immutable)
     
     # 添加调试路由
     @app.route('/debug/routes')
@@ -117,6 +143,9 @@ def create_app():
     # 创建数据库表
     with app.app_context():
         db.create_all()
+        ensure_schema(db)
+        backfill_origin_geohash()
+        reserve_archived_order_ids()
         
         # 创建测试用户和配送员
         if not User.query.first():
@@ -130,6 +159,23 @@ def create_app():
             db.session.commit()
             print("已创建测试数据")
     
+    # 启动后台任务
+    from services.background import PeriodicTask
+    from services.dispatch import dispatch_engine
+    PeriodicTask('dispatch', dispatch_engine.interval, dispatch_engine.run_round).start(app)
+    from services.order_archive import order_archiver
+    PeriodicTask('order-archive', order_archiver.interval, order_archiver.run).start(app)
+    from services.order_rollups import order_rollups
+    PeriodicTask('order-rollups', order_rollups.interval, order_rollups.process).start(app)
+    from services.order_events import order_event_hub
+    order_event_hub.start(app)
+    from services.analysis_jobs import analysis_jobs
+    analysis_jobs.start(app)
+    from services.image_pipeline import image_pipeline
+    image_pipeline.start(app)
+    from services.upload_gc import upload_collector
+    PeriodicTask('upload-gc', upload_collector.interval, upload_collector.run).start(app)
+    
     return app
 
 if __name__ == '__main__':
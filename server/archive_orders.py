@@ -0,0 +1,21 @@
+"""
+手动归档订单：把超过保留期的已完成/已取消订单迁入 orders_archive
+
+用法: python archive_orders.py [保留天数]
+"""
+import sys
+
+from app import create_app
+from services.order_archive import order_archiver
+
+app = create_app()
+with app.app_context():
+    retention_days = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    total = 0
+    while True:
+        summary = order_archiver.run(retention_days=retention_days)
+        total += summary['archived']
+        print(f"已归档 {summary['archived']} 个订单，耗时 {summary['duration_ms']}ms")
+        if summary['batches'] < order_archiver.max_batches:
+            break
+    print(f"归档完成，共 {total} 个订单")
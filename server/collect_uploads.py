@@ -0,0 +1,21 @@
+"""
+手动回收上传文件：删除没有订单或用户引用、且超过宽限期的图片
+
+用法: python collect_uploads.py [宽限小时数]
+"""
+import sys
+
+from app import create_app
+from services.upload_gc import upload_collector
+
+app = create_app()
+with app.app_context():
+    grace_hours = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    total = 0
+    while True:
+        summary = upload_collector.run(grace_hours=grace_hours)
+        total += summary['removed']
+        print(f"已删除 {summary['removed']} 个文件，耗时 {summary['duration_ms']}ms")
+        if summary['removed'] < upload_collector.batch_size:
+            break
+    print(f"回收完成，共删除 {total} 个文件")
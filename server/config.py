@@ -13,8 +13,18 @@ class Config:
     JWT_TOKEN_LOCATION = ['headers']
     JWT_HEADER_NAME = 'Authorization'
     JWT_HEADER_TYPE = 'Bearer'
+    JWT_QUERY_STRING_NAME = 'token'  # 仅事件流接口允许通过 ?token= 传递
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 31536000))  # 内容寻址上传文件的客户端缓存时间(秒)
+    UPLOAD_ACCEL_REDIRECT = os.environ.get('UPLOAD_ACCEL_REDIRECT')  # nginx internal location 前缀(如 /protected-uploads/)，设置后由 nginx 发送上传文件
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true')  # 由 Apache/lighttpd 通过 X-Sendfile 发送文件
+    ORDER_BATCH_MAX = int(os.environ.get('ORDER_BATCH_MAX', 200))  # 单次批量创建订单上限
+    NEARBY_MAX_RADIUS = int(os.environ.get('NEARBY_MAX_RADIUS', 5000))  # 附近订单查询最大半径(米)
+    SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', 15))  # 事件流心跳间隔(秒)
+    SSE_MAX_DURATION = float(os.environ.get('SSE_MAX_DURATION', 300))  # 单个事件流最长保持时间(秒)，到期后客户端自动重连
+    SSE_REPLAY_MAX = int(os.environ.get('SSE_REPLAY_MAX', 500))  # 重连时最多补发的事件数
+    STATS_MAX_BUCKETS = int(os.environ.get('STATS_MAX_BUCKETS', 1000))  # 统计接口单次最多返回的时间段数
     BAIDU_AI_APP_ID = os.getenv('BAIDU_AI_APP_ID')
     BAIDU_AI_API_KEY = os.getenv('BAIDU_AI_API_KEY')
     BAIDU_AI_SECRET_KEY = os.getenv('BAIDU_AI_SECRET_KEY')
\ No newline at end of file
@@ -5,9 +5,16 @@ db = SQLAlchemy()
 # 导入所有模型类
 from .user import User
 from .deliverer import Deliverer
-from .order import Order
+from .order import Order, OrderArchive
 from .address import Address
 from .chat_message import ChatMessage
+from .place import Place
+from .order_event import OrderEvent
+from .order_rollup import OrderRollup, RollupCheckpoint
+from .analysis_job import AnalysisJob
+from .ai_cache_entry import AiCacheEntry
+from .image_variant import ImageVariant
+from .blob import Blob
 
 # 确保所有模型都被导出
-__all__ = ['db', 'User', 'Deliverer', 'Order', 'Address', 'ChatMessage']
+__all__ = ['db', 'User', 'Deliverer', 'Order', 'OrderArchive', 'Address', 'ChatMessage', 'Place', 'OrderEvent', 'OrderRollup', 'RollupCheckpoint', 'AnalysisJob', 'AiCacheEntry', 'ImageVariant', 'Blob']
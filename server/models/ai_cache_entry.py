@@ -0,0 +1,22 @@
+from . import db
+from datetime import datetime
+
+class AiCacheEntry(db.Model):
+    """OCR 与 AI 解析结果缓存，按输入内容的 SHA-256 寻址"""
+    __tablename__ = 'ai_cache_entries'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'content_hash', 'provider', 'version', name='uq_ai_cache_entries_key'),
+        # 按最近使用时间淘汰
+        db.Index('ix_ai_cache_entries_last_used', 'last_used_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # ocr, parse
+    content_hash = db.Column(db.String(64), nullable=False)  # 图片字节或识别文本的 SHA-256
+    provider = db.Column(db.String(50), nullable=False)
+    version = db.Column(db.String(64), nullable=False)  # 接口/提示词版本，变更后旧结果不再命中
+    result = db.Column(db.Text, nullable=False)  # JSON
+    size = db.Column(db.Integer, default=0, nullable=False)  # 结果字节数
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,44 @@
+from . import db
+from datetime import datetime
+import json
+import uuid
+
+class AnalysisJob(db.Model):
+    """订单图片识别的后台任务"""
+    __tablename__ = 'analysis_jobs'
+    __table_args__ = (
+        db.Index('ix_analysis_jobs_user_status', 'user_id', 'status'),
+        db.Index('ix_analysis_jobs_status_created', 'status', 'created_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    priority = db.Column(db.Integer, default=1, nullable=False)  # 数值越小越优先
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, succeeded, failed, cancelled
+    result = db.Column(db.Text)  # 识别结果(JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    worker_id = db.Column(db.String(64))  # 正在执行该任务的进程
+    heartbeat_at = db.Column(db.DateTime)  # 执行进程最近一次续约的时间
+    
+    FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+    
+    @property
+    def finished(self):
+        return self.status in self.FINISHED_STATUSES
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'priority': self.priority,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,16 @@
+from . import db
+from datetime import datetime
+
+class Blob(db.Model):
+    """内容寻址存储中的上传文件，引用计数在垃圾回收的标记阶段重新计算"""
+    __tablename__ = 'blobs'
+    __table_args__ = (
+        db.Index('ix_blobs_ref_count_uploaded', 'ref_count', 'uploaded_at'),
+    )
+
+    name = db.Column(db.String(80), primary_key=True)  # <sha256>.<扩展名>
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)  # 订单图片、头像等引用数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # 最近一次上传相同内容的时间
+    unreferenced_since = db.Column(db.DateTime)  # 首次发现无引用的时间，被引用时清空
@@ -3,8 +3,12 @@ from datetime import datetime
 
 class Deliverer(db.Model):
     __tablename__ = 'deliverers'
+    __table_args__ = (
+        db.Index('ix_deliverers_user_id', 'user_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # 配送员本人登录使用的账号
     name = db.Column(db.String(100), nullable=False)
     avatar = db.Column(db.String(200))
     phone = db.Column(db.String(20))
@@ -13,6 +17,9 @@ class Deliverer(db.Model):
     daily_orders = db.Column(db.Integer, default=0)
     total_likes = db.Column(db.Integer, default=0)
     status = db.Column(db.String(20), default='online')  # online, offline
+    current_lat = db.Column(db.Float)  # 最近上报的位置，用于派单
+    current_lng = db.Column(db.Float)
+    location_updated_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # 关联关系
@@ -21,6 +28,7 @@ class Deliverer(db.Model):
     def to_dict(self):
         return {
             'id': self.id,
+            'user_id': self.user_id,
             'name': self.name,
             'avatar': self.avatar,
             'phone': self.phone,
@@ -29,5 +37,10 @@ class Deliverer(db.Model):
             'daily_orders': self.daily_orders,
             'total_likes': self.total_likes,
             'status': self.status,
+            'current_location': {
+                'lat': self.current_lat,
+                'lng': self.current_lng
+            } if self.current_lat is not None and self.current_lng is not None else None,
+            'location_updated_at': self.location_updated_at.isoformat() if self.location_updated_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -0,0 +1,29 @@
+from . import db
+from datetime import datetime
+
+class ImageVariant(db.Model):
+    """上传图片的派生版本：OCR 副本与各尺寸缩略图，由图片入库流水线生成"""
+    __tablename__ = 'image_variants'
+    __table_args__ = (
+        db.UniqueConstraint('source', 'variant', name='uq_image_variants_source_variant'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(255), nullable=False)  # 原始上传文件名
+    variant = db.Column(db.String(20), nullable=False)  # ocr 或缩略图长边像素，如 320
+    filename = db.Column(db.String(255), nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # jpeg, webp
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # 文件字节数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'variant': self.variant,
+            'filename': self.filename,
+            'format': self.format,
+            'width': self.width,
+            'height': self.height,
+            'size': self.size
+        }
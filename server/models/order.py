@@ -1,12 +1,18 @@
 from . import db
 from datetime import datetime
+from sqlalchemy import event
+from utils import geohash
 import os
 import uuid
 
-class Order(db.Model):
-    __tablename__ = 'orders'
+ORIGIN_GEOHASH_PRECISION = 9  # 约 5 米精度
+
+# 可归档的终态
+ARCHIVABLE_STATUSES = ('completed', 'cancelled')
+
+class OrderMixin:
+    """订单字段与序列化逻辑，热表 orders 与归档表 orders_archive 共用"""
     
-    id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     deliverer_id = db.Column(db.Integer, db.ForeignKey('deliverers.id'))
     start_address = db.Column(db.Text, nullable=False)
@@ -20,6 +26,7 @@ class Order(db.Model):
     actual_amount = db.Column(db.Float, nullable=False)
     order_status = db.Column(db.String(20), default='pending')  # 改为英文状态
     order_no = db.Column(db.String(32), unique=True, nullable=False, default=lambda: str(uuid.uuid4()).replace('-', ''))
+    version = db.Column(db.Integer, default=0, nullable=False)  # 每次状态变更加一，用于条件更新
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     accepted_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
@@ -30,6 +37,7 @@ class Order(db.Model):
     origin_lng = db.Column(db.Float)
     dest_lat = db.Column(db.Float)
     dest_lng = db.Column(db.Float)
+    origin_geohash = db.Column(db.String(12))  # 起点 geohash，写入时自动维护
     
     # 路线信息
     estimated_duration = db.Column(db.Integer)  # 预计时长(分钟)
@@ -39,36 +47,141 @@ class Order(db.Model):
     origin_detail = db.Column(db.Text)        # 起点具体地址
     destination_detail = db.Column(db.Text)   # 终点具体地址
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'order_no': self.order_no,
-            'user_id': self.user_id,
-            'deliverer_id': self.deliverer_id,
-            'start_address': self.start_address,
-            'end_address': self.end_address,
-            'order_image': self.order_image,
-            'item_description': self.item_description,
-            'pickup_code': self.pickup_code,
-            'locker_number': self.locker_number,
-            'total_amount': self.total_amount,
-            'coupon_discount': self.coupon_discount,
-            'actual_amount': self.actual_amount,
-            'order_status': self.order_status,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'accepted_at': self.accepted_at.isoformat() if self.accepted_at else None,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
-            'cancelled_at': self.cancelled_at.isoformat() if self.cancelled_at else None,
-            'origin_location': {
+    # to_dict 输出的字段（按输出顺序）；除下面列出的组合字段外，都与同名列一一对应
+    SERIALIZED_FIELDS = (
+        'id', 'order_no', 'user_id', 'deliverer_id', 'start_address', 'end_address', 'order_image',
+        'item_description', 'pickup_code', 'locker_number', 'total_amount', 'coupon_discount',
+        'actual_amount', 'order_status', 'version', 'created_at', 'accepted_at', 'completed_at',
+        'cancelled_at', 'origin_location', 'destination_location', 'estimated_duration',
+        'estimated_distance', 'origin_detail', 'destination_detail',
+    )
+    FIELD_COLUMNS = {
+        'origin_location': ('origin_lat', 'origin_lng'),
+        'destination_location': ('dest_lat', 'dest_lng'),
+    }
+
+    def to_dict(self, fields=None):
+        """序列化订单，fields 为字段名列表时只输出这些字段（未加载的列不会被访问）"""
+        return {field: self._serialize_field(field) for field in (fields or self.SERIALIZED_FIELDS)}
+
+    def _serialize_field(self, field):
+        if field == 'origin_location':
+            return {
                 'lat': self.origin_lat,
                 'lng': self.origin_lng
-            } if self.origin_lat and self.origin_lng else None,
-            'destination_location': {
+            } if self.origin_lat and self.origin_lng else None
+        if field == 'destination_location':
+            return {
                 'lat': self.dest_lat,
                 'lng': self.dest_lng
-            } if self.dest_lat and self.dest_lng else None,
-            'estimated_duration': self.estimated_duration,
-            'estimated_distance': self.estimated_distance,
-            'origin_detail': self.origin_detail,
-            'destination_detail': self.destination_detail,
-        }
+            } if self.dest_lat and self.dest_lng else None
+        value = getattr(self, field)
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    @classmethod
+    def parse_fields(cls, value):
+        """解析 fields=a,b,c 查询参数，未提供时返回 None；包含未知字段时抛出 ValueError"""
+        if not value:
+            return None
+        fields = []
+        for field in value.split(','):
+            field = field.strip()
+            if not field or field in fields:
+                continue
+            if field not in cls.SERIALIZED_FIELDS:
+                raise ValueError(f"未知字段: {field}")
+            fields.append(field)
+        return fields or None
+
+    @classmethod
+    def projection(cls, fields, *extra_columns):
+        """返回 load_only 所需的列属性：请求字段依赖的列 + 调用方额外需要的列 + 主键"""
+        names = ['id']
+        for field in list(fields) + list(extra_columns):
+            for column in cls.FIELD_COLUMNS.get(field, (field,)):
+                if column not in names:
+                    names.append(column)
+        return [getattr(cls, name) for name in names]
+
+
+class Order(OrderMixin, db.Model):
+    __tablename__ = 'orders'
+    __table_args__ = (
+        # 订单列表按用户、状态过滤后按创建时间倒序分页
+        db.Index('ix_orders_user_status_created', 'user_id', 'order_status', 'created_at'),
+        # 附近待接订单：按状态 + 起点 geohash 前缀范围扫描
+        db.Index('ix_orders_status_origin_geohash', 'order_status', 'origin_geohash'),
+        # 删除 id 最大的订单后不复用该 id，新订单不会与归档订单、历史事件重号
+        {'sqlite_autoincrement': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+
+
+class OrderArchive(OrderMixin, db.Model):
+    """已完成/已取消且超过保留期的订单，由 services/order_archive.py 从 orders 迁入，保留原 id"""
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        db.Index('ix_orders_archive_user_status_created', 'user_id', 'order_status', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def compute_origin_geohash(origin_lat, origin_lng):
+    """根据起点坐标计算 geohash，坐标缺失或无效时返回 None"""
+    try:
+        if origin_lat is None or origin_lng is None:
+            return None
+        return geohash.encode(float(origin_lat), float(origin_lng), ORIGIN_GEOHASH_PRECISION)
+    except (TypeError, ValueError):
+        return None
+
+
+@event.listens_for(Order, 'before_insert')
+@event.listens_for(Order, 'before_update')
+def _sync_origin_geohash(mapper, connection, target):
+    target.origin_geohash = compute_origin_geohash(target.origin_lat, target.origin_lng)
+
+
+def backfill_origin_geohash(batch_size=500):
+    """为旧数据补齐 origin_geohash，返回更新的订单数"""
+    total, last_id = 0, 0
+    while True:
+        orders = Order.query.filter(Order.id > last_id,
+                                    Order.origin_geohash.is_(None),
+                                    Order.origin_lat.isnot(None),
+                                    Order.origin_lng.isnot(None))\
+                            .order_by(Order.id)\
+                            .limit(batch_size).all()
+        if not orders:
+            return total
+        for order in orders:
+            order.origin_geohash = compute_origin_geohash(order.origin_lat, order.origin_lng)
+            total += 1 if order.origin_geohash else 0
+        last_id = orders[-1].id
+        db.session.commit()
+
+
+def reserve_archived_order_ids():
+    """
+    SQLite：把 orders 的自增序列推进到归档表和事件表中出现过的最大订单 id，
+    旧数据库改为 AUTOINCREMENT 之前删除、归档的 id 也不会再分配
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    from .order_event import OrderEvent
+    top = max(
+        db.session.query(db.func.max(Order.id)).scalar() or 0,
+        db.session.query(db.func.max(OrderArchive.id)).scalar() or 0,
+        db.session.query(db.func.max(OrderEvent.order_id)).scalar() or 0,
+    )
+    current = db.session.execute(
+        db.text("SELECT seq FROM sqlite_sequence WHERE name = 'orders'")
+    ).scalar()
+    if current is None:
+        db.session.execute(db.text("INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', :seq)"), {'seq': top})
+    elif current < top:
+        db.session.execute(db.text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'orders'"), {'seq': top})
+    db.session.commit()
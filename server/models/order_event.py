@@ -0,0 +1,36 @@
+from . import db
+from datetime import datetime
+import json
+
+class OrderEvent(db.Model):
+    """订单状态变更事件，只追加不修改"""
+    __tablename__ = 'order_events'
+    __table_args__ = (
+        db.Index('ix_order_events_order_id', 'order_id', 'id'),
+        db.Index('ix_order_events_user_id', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False)  # 订单删除后事件仍保留，不设外键
+    user_id = db.Column(db.Integer, nullable=False)  # 订单所属用户
+    actor_id = db.Column(db.Integer)  # 触发变更的用户，系统派单时为空
+    event = db.Column(db.String(20), nullable=False)  # create, assign, cancel, complete, delete
+    from_status = db.Column(db.String(20))
+    to_status = db.Column(db.String(20), nullable=False)
+    version = db.Column(db.Integer)  # 变更后的订单版本号
+    payload = db.Column(db.Text)  # 变更后的订单快照(JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'user_id': self.user_id,
+            'actor_id': self.actor_id,
+            'event': self.event,
+            'from_status': self.from_status,
+            'to_status': self.to_status,
+            'version': self.version,
+            'payload': json.loads(self.payload) if self.payload else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,31 @@
+from . import db
+from datetime import datetime
+
+class OrderRollup(db.Model):
+    """按小时/天、校区区域(起点 geohash 前缀)预聚合的订单统计，由订单事件增量维护"""
+    __tablename__ = 'order_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket', 'area', name='uq_order_rollups_bucket_area'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket = db.Column(db.DateTime, nullable=False)  # 时间段起点(UTC)
+    area = db.Column(db.String(12), nullable=False, default='')  # 起点 geohash 前缀，坐标未知时为空串
+    created_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    cancelled_count = db.Column(db.Integer, default=0, nullable=False)
+    created_amount = db.Column(db.Float, default=0.0, nullable=False)  # 新建订单金额合计
+    completed_amount = db.Column(db.Float, default=0.0, nullable=False)  # 已完成订单金额合计(GMV)
+    duration_sum = db.Column(db.Integer, default=0, nullable=False)  # 新建订单预计时长合计(分钟)
+    duration_count = db.Column(db.Integer, default=0, nullable=False)  # 有预计时长的新建订单数
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RollupCheckpoint(db.Model):
+    """增量任务已处理到的事件 id"""
+    __tablename__ = 'rollup_checkpoints'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,44 @@
+from . import db
+from datetime import datetime
+
+class Place(db.Model):
+    __tablename__ = 'places'
+    __table_args__ = (
+        db.UniqueConstraint('city', 'name', 'lat', 'lng', name='uq_places_city_name_location'),
+        # 按城市、热度顺序扫描，取到足够的匹配即可停止
+        db.Index('ix_places_city_usage', 'city', 'usage_count'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    address = db.Column(db.String(255))
+    lat = db.Column(db.Float, nullable=False)
+    lng = db.Column(db.Float, nullable=False)
+    adcode = db.Column(db.String(20))
+    citycode = db.Column(db.String(20))
+    usage_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_search_result(self):
+        """与 MapService.search_places 返回的地点结构一致"""
+        return {
+            'name': self.name,
+            'address': self.address,
+            'location': {
+                'lat': self.lat,
+                'lng': self.lng
+            },
+            'adcode': self.adcode,
+            'citycode': self.citycode
+        }
+    
+    def to_dict(self):
+        return dict(
+            self.to_search_result(),
+            id=self.id,
+            city=self.city,
+            usage_count=self.usage_count,
+            last_used_at=self.last_used_at.isoformat() if self.last_used_at else None
+        )
@@ -0,0 +1,68 @@
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+
+
+def ensure_schema(db):
+    """
+    create_all 不会修改已存在的表：这里为旧数据库补齐模型中新增的列和索引
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is not None:
+                    ddl += f" DEFAULT {default!r}" if isinstance(default, str) else f" DEFAULT {default}"
+                conn.execute(text(ddl))
+                print(f"已为 {table.name} 添加字段 {column.name}")
+
+    if engine.dialect.name == 'sqlite':
+        for table in db.metadata.sorted_tables:
+            if table.name in existing_tables and table.dialect_options['sqlite'].get('autoincrement'):
+                _ensure_sqlite_autoincrement(engine, table)
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _ensure_sqlite_autoincrement(engine, table):
+    """
+    SQLite 不能通过 ALTER 加上 AUTOINCREMENT：按官方步骤新建表、复制数据、删除旧表后改名，
+    索引由 ensure_schema 随后重建
+    """
+    with engine.connect() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                           {'name': table.name}).scalar()
+        if sql is None or 'AUTOINCREMENT' in sql.upper():
+            return
+        existing_columns = {row[1] for row in conn.execute(text(f'PRAGMA table_info("{table.name}")'))}
+
+    temp_name = f"{table.name}__rebuild"
+    metadata = MetaData()
+    for foreign_key in table.foreign_keys:
+        # 新表的外键需要能解析到被引用的表
+        foreign_key.column.table.to_metadata(metadata)
+    temp_table = table.to_metadata(metadata, name=temp_name)
+    columns = ', '.join(f'"{column.name}"' for column in table.columns if column.name in existing_columns)
+    with engine.connect() as conn:
+        # 外键检查（SQLite 默认关闭）需在事务外关闭，避免删除旧表时级联
+        conn.execute(text('PRAGMA foreign_keys=OFF'))
+        conn.commit()
+        with conn.begin():
+            conn.execute(text(f'DROP TABLE IF EXISTS "{temp_name}"'))
+            conn.execute(CreateTable(temp_table))
+            conn.execute(text(f'INSERT INTO "{temp_name}" ({columns}) SELECT {columns} FROM "{table.name}"'))
+            conn.execute(text(f'DROP TABLE "{table.name}"'))
+            conn.execute(text(f'ALTER TABLE "{temp_name}" RENAME TO "{table.name}"'))
+    print(f"已将 {table.name} 的主键改为 AUTOINCREMENT")
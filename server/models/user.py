@@ -18,6 +18,7 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     status = db.Column(db.String(20), default='active')
+    is_admin = db.Column(db.Boolean, default=False, nullable=False)  # 运营/管理员，可执行全局操作（清空缓存、派单等）
     
     # 关联关系
     orders = db.relationship('Order', backref='user', lazy=True)
@@ -0,0 +1,72 @@
+from flask import Blueprint, request, current_app
+from datetime import datetime
+from models import db
+from models.deliverer import Deliverer
+from services.dispatch import dispatch_engine
+from services.route_planner import plan_deliverer_route
+from utils.response import success_response, error_response
+from utils.auth_helpers import token_required, admin_required
+
+dispatch_bp = Blueprint('dispatch', __name__)
+
+@dispatch_bp.route('/rounds', methods=['POST', 'OPTIONS'])
+@admin_required
+def run_dispatch_round(current_user):
+    """立即执行一轮派单（仅管理员，日常由后台任务定时执行）"""
+    try:
+        return success_response(dispatch_engine.run_round(), "派单完成")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"派单失败: {str(e)}")
+        return error_response(f"派单失败: {str(e)}")
+
+@dispatch_bp.route('/rounds/last', methods=['GET', 'OPTIONS'])
+@token_required
+def get_last_dispatch_round(current_user):
+    """获取最近一轮派单结果"""
+    return success_response(dispatch_engine.last_round)
+
+@dispatch_bp.route('/deliverers/<int:deliverer_id>/location', methods=['PUT', 'OPTIONS'])
+@token_required
+def update_deliverer_location(current_user, deliverer_id):
+    """上报配送员当前位置及在线状态（仅配送员本人或管理员）"""
+    try:
+        data = request.get_json() or {}
+        deliverer = Deliverer.query.get(deliverer_id)
+        if not deliverer:
+            return error_response("配送员不存在", 404)
+        if deliverer.user_id != current_user.id and not current_user.is_admin:
+            return error_response("无权更新该配送员的位置", 403)
+        
+        try:
+            deliverer.current_lat = float(data['lat'])
+            deliverer.current_lng = float(data['lng'])
+        except (KeyError, TypeError, ValueError):
+            return error_response("请提供有效的 lat、lng 坐标")
+        
+        if data.get('status') in ('online', 'offline'):
+            deliverer.status = data['status']
+        deliverer.location_updated_at = datetime.utcnow()
+        db.session.commit()
+        return success_response(deliverer.to_dict(), "位置已更新")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"更新配送员位置失败: {str(e)}")
+        return error_response(f"更新配送员位置失败: {str(e)}")
+
+@dispatch_bp.route('/deliverers/<int:deliverer_id>/plan', methods=['GET', 'OPTIONS'])
+@token_required
+def get_deliverer_plan(current_user, deliverer_id):
+    """规划配送员当前承接订单的取送顺序（仅配送员本人或管理员）；exact=1 时使用真实路线时间"""
+    try:
+        deliverer = Deliverer.query.get(deliverer_id)
+        if not deliverer:
+            return error_response("配送员不存在", 404)
+        if deliverer.user_id != current_user.id and not current_user.is_admin:
+            return error_response("无权查看该配送员的路线", 403)
+        
+        exact = request.args.get('exact') in ('1', 'true')
+        return success_response(plan_deliverer_route(deliverer, exact))
+    except Exception as e:
+        current_app.logger.error(f"规划配送路线失败: {str(e)}")
+        return error_response(f"规划配送路线失败: {str(e)}")
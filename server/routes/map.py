@@ -1,10 +1,17 @@
 from flask import Blueprint, request
 from services.map_service import map_service
+from services.polyline import compact_route_info
 from utils.response import success_response, error_response
 from utils.auth_helpers import token_required
 
 map_bp = Blueprint('map', __name__)
 
+def _as_bool(value):
+    """JSON 中的开关参数：兼容 true/false、1/0 及其字符串形式"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
 @map_bp.route('/search', methods=['POST'])
 @token_required
 def search_places(current_user):
@@ -46,13 +53,45 @@ def calculate_route(current_user):
         )
         
         if result['success']:
-            return success_response(result['data'])
+            route = result['data']
+            # 精简模式：route_info 只返回一条经过简化的编码折线
+            if _as_bool(data.get('compact')):
+                try:
+                    tolerance = float(data.get('tolerance', 5))
+                except (TypeError, ValueError):
+                    return error_response("tolerance 必须是数字")
+                route = dict(route, route_info=compact_route_info(route.get('route_info'), max(tolerance, 0)))
+            return success_response(route)
         else:
             return error_response(result['message'])
             
     except Exception as e:
         return error_response(f"路线规划失败: {str(e)}")
 
+@map_bp.route('/route-matrix', methods=['POST'])
+@token_required
+def calculate_route_matrix(current_user):
+    """批量路线规划：返回 origins × destinations 的时长/距离矩阵"""
+    try:
+        data = request.get_json() or {}
+        origins = data.get('origins') or []
+        destinations = data.get('destinations') or []
+        
+        if not origins or not destinations:
+            return error_response("起点和终点列表不能为空")
+        
+        for point in origins + destinations:
+            if not isinstance(point, dict) or point.get('lat') is None or point.get('lng') is None:
+                return error_response("起点和终点坐标不能为空")
+        
+        if len(origins) * len(destinations) > map_service.matrix_max_cells:
+            return error_response(f"单次最多计算 {map_service.matrix_max_cells} 个点对")
+        
+        return success_response(map_service.route_matrix(origins, destinations))
+            
+    except Exception as e:
+        return error_response(f"批量路线规划失败: {str(e)}")
+
 @map_bp.route('/config', methods=['GET'])
 def get_map_config():
     """获取前端地图配置（无需认证）"""
@@ -60,4 +99,40 @@ def get_map_config():
         config = map_service.get_frontend_map_config()
         return success_response(config)
     except Exception as e:
-        return error_response(f"获取地图配置失败: {str(e)}")
\ No newline at end of file
+        return error_response(f"获取地图配置失败: {str(e)}")
+
+@map_bp.route('/route-cache/stats', methods=['GET'])
+@token_required
+def get_route_cache_stats(current_user):
+    """获取路线缓存命中统计"""
+    try:
+        return success_response(map_service.route_cache.stats())
+    except Exception as e:
+        return error_response(f"获取路线缓存统计失败: {str(e)}")
+
+@map_bp.route('/route-cache', methods=['DELETE'])
+@token_required
+def invalidate_route_cache(current_user):
+    """使路线缓存失效：提供起终点时只清除该条；scope=all 清空全部（仅管理员）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        origin = data.get('origin') or {}
+        destination = data.get('destination') or {}
+        
+        if all([origin.get('lat'), origin.get('lng'),
+                destination.get('lat'), destination.get('lng')]):
+            map_service.route_cache.invalidate(
+                origin['lat'], origin['lng'],
+                destination['lat'], destination['lng']
+            )
+        elif data.get('scope') == 'all':
+            # 清空后所有用户的路线都要重新调用高德接口
+            if not current_user.is_admin:
+                return error_response("需要管理员权限", 403)
+            map_service.route_cache.invalidate_all()
+        else:
+            return error_response("请提供起终点坐标，或使用 scope=all 清空全部")
+        
+        return success_response(map_service.route_cache.stats(), "路线缓存已清除")
+    except Exception as e:
+        return error_response(f"清除路线缓存失败: {str(e)}")
@@ -0,0 +1,15 @@
+from flask import Blueprint
+from services.metrics import metrics
+from utils.response import success_response, error_response
+from utils.auth_helpers import admin_required
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/', methods=['GET', 'OPTIONS'])
+@admin_required
+def get_metrics(current_user):
+    """获取服务运行指标（缓存命中、连接池等），仅管理员"""
+    try:
+        return success_response(metrics.snapshot())
+    except Exception as e:
+        return error_response(f"获取运行指标失败: {str(e)}")
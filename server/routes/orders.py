@@ -1,21 +1,35 @@
-from flask import Blueprint, request, current_app # 新增 current_app
+from flask import Blueprint, request, current_app, Response, stream_with_context # 新增 current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db
 from models.user import User
-from models.order import Order
+from models.order import Order, OrderArchive, ARCHIVABLE_STATUSES, compute_origin_geohash
 from models.address import Address
-# যেহেতু您还没有配送员后端，我们将不会从 models.deliverer 导入
-# from models.deliverer import Deliverer 
-from utils.response import success_response, error_response
-from utils.auth_helpers import token_required
+from models.order_event import OrderEvent
+from models.deliverer import Deliverer
+from models.analysis_job import AnalysisJob
+from utils.response import success_response, error_response, cursor_response
+from utils.auth_helpers import token_required, admin_required
+from utils.pagination import encode_cursor, decode_cursor, parse_limit
+from utils.http_cache import make_etag, is_not_modified, not_modified_response, with_etag
+from sqlalchemy import and_, or_, insert, func
+from sqlalchemy.orm import load_only
 from datetime import datetime
-import os 
+import json
+import time
 import uuid 
 import traceback
 from werkzeug.utils import secure_filename
 
 
-from services.ai_service import ai_service
+from services.ai_cache import ai_cache
+from services.image_pipeline import image_pipeline
+from services.storage import storage
+from services.order_state import order_state, record_created, OrderTransitionError
+from services.order_events import order_event_hub, OVERFLOW
+from services.order_archive import find_order
+from services.analysis_jobs import analysis_jobs, JobRejected, PRIORITIES
+from services.geo import haversine_km, estimate_cycling_distance_km, estimate_cycling_minutes
+from utils import geohash
 
 orders_bp = Blueprint('orders', __name__)
 
@@ -48,30 +62,19 @@ def upload_order_image(current_user):
                 current_app.logger.warning(f"Invalid file extension: {ext}")
                 return error_response(f"无效的图片类型。只允许: {', '.join(allowed_extensions)}", 400)
             
-            unique_filename = str(uuid.uuid4()) + "." + ext
-            
-            upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'server/static/uploads'))
-            current_app.logger.info(f"Upload folder: {upload_folder}")
-            
-            if not os.path.exists(upload_folder):
-                try:
-                    os.makedirs(upload_folder, exist_ok=True)
-                    current_app.logger.info(f"Created upload directory: {upload_folder}")
-                except OSError as e:
-                    current_app.logger.error(f"Failed to create upload directory: {str(e)}")
-                    return error_response(f"创建上传目录失败: {str(e)}", 500)
-
-            file_path = os.path.join(upload_folder, unique_filename)
-            current_app.logger.info(f"Saving file to: {file_path}")
-            
             try:
-                file.save(file_path)
-                current_app.logger.info(f"File saved successfully: {file_path}")
+                # 按内容哈希保存，相同图片只存一份
+                unique_filename = storage.save(file.stream, ext)
+                current_app.logger.info(f"File saved successfully: {unique_filename}")
+                # OCR 副本与缩略图在后台生成
+                image_pipeline.submit(unique_filename)
                 return success_response({
                     "filename": unique_filename,
-                    "filePath": f"/static/uploads/{unique_filename}" 
+                    "filePath": f"/static/uploads/{unique_filename}",
+                    "thumbnailSizes": list(image_pipeline.thumbnail_sizes)
                 }, "图片上传成功")
             except Exception as e:
+                db.session.rollback()
                 current_app.logger.error(f"保存图片失败: {str(e)}")
                 return error_response(f"保存图片失败: {str(e)}", 500)
                 
@@ -85,105 +88,314 @@ def upload_order_image(current_user):
 @orders_bp.route('/analyze-image', methods=['POST'])
 @token_required
 def analyze_order_image(current_user):
-    """分析订单图片，提取商品描述和取件信息"""
+    """分析订单图片，提取商品描述和取件信息：提交识别任务并在限定时间内等待结果，超时返回 202 与任务信息"""
     try:
         data = request.get_json()
         filename = data.get('filename')
         
         if not filename:
-            return success_response({}, "请提供图片文件名", success=False)
-        
-        # 构建图片完整路径
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'server/static/uploads'))
-        image_path = os.path.join(upload_folder, filename)
+            return error_response("请提供图片文件名")
         
         # 检查文件是否存在
-        if not os.path.exists(image_path):
-            return success_response({}, "图片文件不存在", success=False)
-        
-        # 执行OCR识别
-        recognized_text = ai_service.recognize_text(image_path)
+        if secure_filename(filename) != filename or not storage.exists(filename):
+            return error_response("图片文件不存在", 404)
         
-        # 解析订单信息
-        parsed_info = ai_service.parse_order_info(recognized_text)
+        # 与异步接口共用任务队列，识别不占用请求线程之外的资源
+        job_id = analysis_jobs.submit(current_user.id, filename, PRIORITIES['high']).id
+        deadline = time.monotonic() + current_app.config.get('ANALYZE_SYNC_TIMEOUT', 60)
+        while True:
+            job = db.session.get(AnalysisJob, job_id, populate_existing=True)
+            remaining = deadline - time.monotonic()
+            if job.finished or remaining <= 0:
+                break
+            db.session.close()
+            # 本进程执行的任务结束时立即唤醒，其它进程执行的任务每秒重新查询
+            analysis_jobs.wait(job_id, min(1, remaining))
         
-        return success_response({
-            'recognizedText': recognized_text,  # 原始识别文本，可用于调试
-            'description': parsed_info['description'],
-            'orderInfo': parsed_info['orderInfo']
-        })
+        if job.status == 'succeeded':
+            return success_response(json.loads(job.result))
+        if not job.finished:
+            return success_response(job.to_dict(), "识别仍在进行，请通过识别任务接口查询结果", 202)
+        return error_response(f'AI分析失败: {job.error}', 500)
         
+    except JobRejected as e:
+        return error_response(e.message, e.status_code)
     except Exception as error:
+        db.session.rollback()
         current_app.logger.error(f'AI分析错误: {str(error)}')
         # 返回正确的错误响应，避免401状态码
         return error_response(f'AI分析失败: {str(error)}', 500)
     
-# --- 创建订单 (保持您提供的版本，确保 Order 模型字段正确) ---
+# --- 异步图片识别任务 ---
+@orders_bp.route('/analyze-jobs', methods=['POST', 'OPTIONS'])
+@token_required
+def submit_analysis_job(current_user):
+    """提交图片识别任务，立即返回任务 id（202），识别在后台执行"""
+    try:
+        data = request.get_json() or {}
+        filename = data.get('filename')
+        if not filename:
+            return error_response("请提供图片文件名")
+        if secure_filename(filename) != filename or not storage.exists(filename):
+            return error_response("图片文件不存在", 404)
+        
+        priority = data.get('priority', 'normal')
+        if priority not in PRIORITIES:
+            return error_response(f"无效的优先级: {priority}")
+        
+        job = analysis_jobs.submit(current_user.id, filename, PRIORITIES[priority])
+        return success_response(job.to_dict(), "识别任务已提交", 202)
+    except JobRejected as e:
+        return error_response(e.message, e.status_code)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"提交识别任务失败: {str(e)}")
+        return error_response(f"提交识别任务失败: {str(e)}")
+
+
+@orders_bp.route('/analyze-jobs/<job_id>', methods=['GET', 'OPTIONS'])
+@token_required
+def get_analysis_job(current_user, job_id):
+    """查询识别任务状态与结果"""
+    job = AnalysisJob.query.get(job_id)
+    if not job or job.user_id != current_user.id:
+        return error_response("识别任务不存在", 404)
+    return success_response(job.to_dict())
+
+
+@orders_bp.route('/analyze-jobs/<job_id>', methods=['DELETE'])
+@token_required
+def cancel_analysis_job(current_user, job_id):
+    """取消排队中的识别任务"""
+    try:
+        job = AnalysisJob.query.get(job_id)
+        if not job or job.user_id != current_user.id:
+            return error_response("识别任务不存在", 404)
+        if not analysis_jobs.cancel(job_id):
+            return error_response("只能取消排队中的任务", 409)
+        return success_response(message="识别任务已取消")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"取消识别任务失败: {str(e)}")
+        return error_response(f"取消识别任务失败: {str(e)}")
+
+
+@orders_bp.route('/analyze-jobs/<job_id>/stream', methods=['GET', 'OPTIONS'])
+@token_required(locations=['headers', 'query_string'])
+def stream_analysis_job(current_user, job_id):
+    """以 SSE 推送任务结束时的状态，期间定期发送心跳"""
+    job = AnalysisJob.query.get(job_id)
+    if not job or job.user_id != current_user.id:
+        return error_response("识别任务不存在", 404)
+    heartbeat = current_app.config.get('SSE_HEARTBEAT', 15)
+    max_duration = current_app.config.get('SSE_MAX_DURATION', 300)
+    
+    def generate():
+        deadline = time.monotonic() + max_duration
+        while True:
+            current = db.session.get(AnalysisJob, job_id, populate_existing=True)
+            if current is None or current.finished:
+                data = json.dumps(current.to_dict() if current else None, ensure_ascii=False)
+                yield f"event: done\ndata: {data}\n\n"
+                return
+            db.session.close()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # 本进程执行的任务结束时立即唤醒，其它情况在心跳间隔后重新查询
+            if not analysis_jobs.wait(job_id, min(heartbeat, remaining)):
+                yield ": heartbeat\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@orders_bp.route('/analysis-cache', methods=['DELETE', 'OPTIONS'])
+@admin_required
+def clear_analysis_cache(current_user):
+    """清除识别结果缓存（全局共享，仅管理员），kind=ocr|parse 限定类型，stale_only=1 只清除旧版本（如修改提示词后）"""
+    try:
+        kind = request.args.get('kind') or None
+        if kind not in (None, 'ocr', 'parse'):
+            return error_response(f"无效的缓存类型: {kind}")
+        deleted = ai_cache.invalidate(kind, stale_only=request.args.get('stale_only') in ('1', 'true'))
+        return success_response({'deleted': deleted}, "识别缓存已清除")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"清除识别缓存失败: {str(e)}")
+        return error_response(f"清除识别缓存失败: {str(e)}")
+
+
+def _fill_route_estimates(requests_data):
+    """客户端未提供预计距离/时长时，按起终点直线距离批量估算"""
+    pending = []
+    for request_data in requests_data:
+        if request_data.get('estimated_distance') and request_data.get('estimated_duration'):
+            continue
+        try:
+            coords = [float(request_data[key]) for key in ('origin_lat', 'origin_lng', 'dest_lat', 'dest_lng')]
+        except (KeyError, TypeError, ValueError):
+            continue
+        pending.append((request_data, coords))
+    
+    if not pending:
+        return
+    
+    lat1, lng1, lat2, lng2 = zip(*(coords for _, coords in pending))
+    straight = haversine_km(lat1, lng1, lat2, lng2)
+    distances = estimate_cycling_distance_km(straight)
+    durations = estimate_cycling_minutes(straight)
+    for (request_data, _), distance, duration in zip(pending, distances, durations):
+        if not request_data.get('estimated_distance'):
+            request_data['estimated_distance'] = round(float(distance), 2)
+        if not request_data.get('estimated_duration'):
+            request_data['estimated_duration'] = int(duration)
+
+# 订单中可选的数值字段及其类型
+NUMERIC_ORDER_FIELDS = {
+    'origin_lat': float,
+    'origin_lng': float,
+    'dest_lat': float,
+    'dest_lng': float,
+    'estimated_duration': int,
+    'estimated_distance': float,
+}
+
+def _build_order_row(user_id, request_data, created_at):
+    """校验单个订单数据，返回 (行数据, 错误信息)"""
+    if not isinstance(request_data, dict):
+        return None, "订单数据格式错误"
+    
+    # 验证必填字段
+    required_fields = ['origin', 'destination', 'amount']
+    for field in required_fields:
+        if not request_data.get(field):
+            return None, f"缺少必填字段: {field}"
+    
+    # 验证金额
+    try:
+        amount = float(request_data['amount'])
+        if amount <= 0:
+            return None, "委托金额必须大于0"
+    except (ValueError, TypeError):
+        return None, "委托金额格式错误"
+    
+    # 可选数值字段按列类型转换，写入的行与 create 事件快照使用相同的值
+    numbers = {}
+    for field, cast in NUMERIC_ORDER_FIELDS.items():
+        value = request_data.get(field)
+        if value is None or value == '':
+            numbers[field] = None
+            continue
+        try:
+            numbers[field] = cast(float(value))
+        except (ValueError, TypeError):
+            return None, f"字段格式错误: {field}"
+    
+    return {
+        'user_id': user_id,
+        'order_no': uuid.uuid4().hex,
+        'start_address': request_data['origin'],  # 修复字段映射
+        'end_address': request_data['destination'],  # 修复字段映射
+        'origin_detail': request_data.get('origin_detail', ''),
+        'destination_detail': request_data.get('destination_detail', ''),
+        'item_description': request_data.get('description', ''),  # 修复字段映射
+        'pickup_code': request_data.get('order_info', ''),  # 修复字段映射
+        'total_amount': amount,  # 修复字段映射
+        'actual_amount': amount,  # 添加必需字段
+        'coupon_discount': 0.0,  # 添加必需字段
+        'order_status': 'pending',  # 修复字段映射（不是 status）
+        'version': 0,
+        'order_image': request_data.get('image'),  # 修复字段映射
+        'origin_lat': numbers['origin_lat'],
+        'origin_lng': numbers['origin_lng'],
+        'dest_lat': numbers['dest_lat'],
+        'dest_lng': numbers['dest_lng'],
+        'estimated_duration': numbers['estimated_duration'],
+        'estimated_distance': numbers['estimated_distance'],
+        # 批量 INSERT 不经过 ORM 事件，这里直接计算 geohash
+        'origin_geohash': compute_origin_geohash(numbers['origin_lat'], numbers['origin_lng']),
+        'created_at': created_at,
+    }, None
+
+# --- 创建订单 ---
 @orders_bp.route('/', methods=['POST', 'OPTIONS']) # 添加 OPTIONS
 @token_required
 def create_order(current_user):
+    """
+    创建订单，支持单个订单、订单列表，或 {"orders": [...], "mode": "atomic|partial"}
+    
+    整批订单先全部校验，再用一条多行 INSERT 写入：
+    - atomic（默认）：任一订单校验失败则整批拒绝，返回每个订单的错误
+    - partial：写入校验通过的订单，失败的订单在 errors 中返回
+    """
     try:
         data = request.get_json()
         
         if not data:
             return error_response("请求数据不能为空")
         
+        mode = request.args.get('mode', 'atomic')
+        if isinstance(data, dict) and isinstance(data.get('orders'), list):
+            mode = data.get('mode', mode)
+            data = data['orders']
+        if mode not in ('atomic', 'partial'):
+            return error_response(f"无效的批量模式: {mode}")
+        
         # 处理单个订单或订单列表
         requests_data = data if isinstance(data, list) else [data]
         
         if not requests_data:
             return error_response("订单数据不能为空")
         
-        created_orders = []
+        max_batch = current_app.config.get('ORDER_BATCH_MAX', 200)
+        if len(requests_data) > max_batch:
+            return error_response(f"单次最多创建 {max_batch} 个订单")
         
-        for request_data in requests_data:
-            # 验证必填字段
-            required_fields = ['origin', 'destination', 'amount']
-            for field in required_fields:
-                if not request_data.get(field):
-                    return error_response(f"缺少必填字段: {field}")
-            
-            # 验证金额
-            try:
-                amount = float(request_data['amount'])
-                if amount <= 0:
-                    return error_response("委托金额必须大于0")
-            except (ValueError, TypeError):
-                return error_response("委托金额格式错误")
-            
-            # 创建订单
-            order = Order(
-                user_id=current_user.id,
-                start_address=request_data['origin'],  # 修复字段映射
-                end_address=request_data['destination'],  # 修复字段映射
-                origin_detail=request_data.get('origin_detail', ''),
-                destination_detail=request_data.get('destination_detail', ''),
-                item_description=request_data.get('description', ''),  # 修复字段映射
-                pickup_code=request_data.get('order_info', ''),  # 修复字段映射
-                total_amount=amount,  # 修复字段映射
-                actual_amount=amount,  # 添加必需字段
-                coupon_discount=0.0,  # 添加必需字段
-                order_status='pending',  # 修复字段映射（不是 status）
-                order_image=request_data.get('image'),  # 修复字段映射
-                origin_lat=request_data.get('origin_lat'),
-                origin_lng=request_data.get('origin_lng'),
-                dest_lat=request_data.get('dest_lat'),
-                dest_lng=request_data.get('dest_lng'),
-                estimated_duration=request_data.get('estimated_duration'),
-                estimated_distance=request_data.get('estimated_distance')
-            )
-            
-            db.session.add(order)
-            db.session.flush()  # 获取订单ID
-            
-            created_orders.append(order.to_dict())
+        _fill_route_estimates([item for item in requests_data if isinstance(item, dict)])
+        
+        created_at = datetime.utcnow()
+        rows, indexes, errors = [], [], []
+        for index, request_data in enumerate(requests_data):
+            row, message = _build_order_row(current_user.id, request_data, created_at)
+            if message:
+                errors.append({'index': index, 'message': message})
+            else:
+                rows.append(row)
+                indexes.append(index)
         
+        if errors and (mode == 'atomic' or not rows):
+            first = errors[0]
+            message = first['message'] if len(requests_data) == 1 else f"第{first['index'] + 1}个订单: {first['message']}"
+            return error_response(message, errors=errors)
+        
+        # 单条多行 INSERT ... RETURNING，按 order_no 对应回生成的 id
+        orders_table = Order.__table__
+        inserted = db.session.execute(
+            insert(orders_table).returning(orders_table.c.id, orders_table.c.order_no),
+            rows
+        ).all()
+        ids = {order_no: order_id for order_id, order_no in inserted}
+        orders = [Order(id=ids[row['order_no']], **row) for row in rows]
+        record_created(orders, actor_id=current_user.id)
         db.session.commit()
         
-        return success_response({
+        created_orders = []
+        for index, order in zip(indexes, orders):
+            order_data = order.to_dict()
+            if mode == 'partial':
+                order_data['index'] = index
+            created_orders.append(order_data)
+        
+        result = {
             'orders': created_orders,
             'count': len(created_orders)
-        })
+        }
+        if mode == 'partial':
+            result['errors'] = errors
+        return success_response(result)
         
     except Exception as e:
         db.session.rollback()
@@ -194,26 +406,171 @@ def create_order(current_user):
 @orders_bp.route('/', methods=['GET', 'OPTIONS']) # 添加 OPTIONS
 @token_required
 def get_orders(current_user):
-    """获取订单列表 (只包含进行中、已完成、已取消状态)"""
+    """
+    获取订单列表 (只包含进行中、已完成、已取消状态)
+    
+    查询参数：
+    - status: 逗号分隔的状态过滤，如 pending,completed
+    - limit / cursor: 提供任一参数时按 (created_at, id) 游标分页，返回 items 与 next_cursor；
+      都不提供时保持旧行为返回全部订单
+    - fields: 逗号分隔的字段投影，只查询并返回这些字段
+    
+    响应带 ETag（由订单数、最大 id 与版本号之和及查询参数计算），
+    If-None-Match 命中时直接返回 304，不加载订单数据。
+    """
     try:
         # 确保 Order 模型中的 order_status 字段实际存储的是这些英文值
         allowed_statuses = ['pending', 'completed', 'cancelled'] 
-        orders = Order.query.filter_by(user_id=current_user.id)\
-                            .filter(Order.order_status.in_(allowed_statuses))\
-                            .order_by(Order.created_at.desc())\
-                            .all()
-        return success_response([order.to_dict() for order in orders])
+        status_param = request.args.get('status')
+        if status_param:
+            statuses = [status for status in status_param.split(',') if status in allowed_statuses]
+            if not statuses:
+                return error_response(f"无效的订单状态: {status_param}")
+        else:
+            statuses = allowed_statuses
+        
+        try:
+            fields = Order.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return error_response(str(e))
+        
+        # 终态订单可能已归档，查询时合并热表与归档表
+        models = [Order] + ([OrderArchive] if set(statuses) & set(ARCHIVABLE_STATUSES) else [])
+        
+        def filters(model):
+            return [model.user_id == current_user.id, model.order_status.in_(statuses)]
+        
+        # 任一订单新增、删除、状态变更或归档都会改变这些聚合值
+        versions = []
+        for model in models:
+            versions.extend(db.session.query(
+                func.count(model.id), func.max(model.id), func.coalesce(func.sum(model.version), 0)
+            ).filter(*filters(model)).one())
+        etag = make_etag('orders', current_user.id, *versions, request.query_string.decode())
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+        
+        def build_query(model):
+            query = model.query.filter(*filters(model)).order_by(model.created_at.desc(), model.id.desc())
+            if fields:
+                query = query.options(load_only(*model.projection(fields, 'created_at')))
+            return query
+        
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        if not paginated:
+            orders = _merge_newest_first([build_query(model).all() for model in models])
+            return with_etag(success_response([order.to_dict(fields) for order in orders]), etag)
+        
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            created_at, order_id = decode_cursor(cursor) if cursor else (None, None)
+        except ValueError as e:
+            return error_response(f"分页参数错误: {str(e)}")
+        
+        # 两张表各取一页（多取一条判断是否还有下一页），按 (created_at, id) 倒序合并
+        pages = []
+        for model in models:
+            query = build_query(model)
+            if cursor:
+                query = query.filter(or_(
+                    model.created_at < created_at,
+                    and_(model.created_at == created_at, model.id < order_id)
+                ))
+            pages.append(query.limit(limit + 1).all())
+        orders = _merge_newest_first(pages)
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+        
+        return with_etag(cursor_response([order.to_dict(fields) for order in orders], next_cursor), etag)
     except Exception as e:
         current_app.logger.error(f"获取订单列表失败: {str(e)}")
         return error_response(f"获取订单列表失败: {str(e)}")
 
+
+def _merge_newest_first(pages):
+    """合并热表与归档表的查询结果，保持 (created_at, id) 倒序"""
+    if len(pages) == 1:
+        return pages[0]
+    orders = [order for page in pages for order in page]
+    orders.sort(key=lambda order: (order.created_at or datetime.min, order.id), reverse=True)
+    return orders
+
+# 附近订单对配送员公开的字段；订单图片（含取件码）、下单用户与详细地址只对下单用户和接单配送员可见
+NEARBY_FIELDS = (
+    'id', 'start_address', 'end_address', 'origin_location', 'destination_location',
+    'actual_amount', 'estimated_duration', 'estimated_distance', 'created_at',
+)
+
+@orders_bp.route('/nearby', methods=['GET', 'OPTIONS'])
+@token_required
+def get_nearby_orders(current_user):
+    """
+    查询起点在指定半径内的待接订单，按距离升序（仅已注册的配送员或管理员）
+    
+    先用 geohash 前缀范围扫描 (order_status, origin_geohash) 索引取候选订单，再精确计算距离过滤。
+    """
+    try:
+        if not current_user.is_admin and Deliverer.query.filter_by(user_id=current_user.id).first() is None:
+            return error_response("仅配送员可以查看附近订单", 403)
+        
+        try:
+            lat = float(request.args['lat'])
+            lng = float(request.args['lng'])
+            radius = float(request.args.get('radius', 1000))  # 米
+            limit = parse_limit(request.args.get('limit'), default=20, maximum=100)
+        except (KeyError, TypeError, ValueError):
+            return error_response("请提供有效的 lat、lng 坐标")
+        
+        max_radius = current_app.config.get('NEARBY_MAX_RADIUS', 5000)
+        if radius <= 0 or radius > max_radius:
+            return error_response(f"查询半径需在 0 到 {max_radius} 米之间")
+        
+        cells = geohash.cover(lat, lng, radius)
+        # base32 字符集最大为 'z'，前缀 p 的范围即 [p, p + '{')
+        ranges = [and_(Order.origin_geohash >= cell, Order.origin_geohash < cell + '{') for cell in cells]
+        candidates = Order.query.options(load_only(*Order.projection(NEARBY_FIELDS)))\
+                                .filter(Order.order_status == 'pending',
+                                        Order.deliverer_id.is_(None),
+                                        or_(*ranges)).all()
+        if not candidates:
+            return success_response([])
+        
+        distances = haversine_km(lat, lng,
+                                 [order.origin_lat for order in candidates],
+                                 [order.origin_lng for order in candidates])
+        nearby = sorted(
+            ((distance, order) for distance, order in zip(distances.tolist(), candidates) if distance * 1000 <= radius),
+            key=lambda item: item[0]
+        )[:limit]
+        
+        results = []
+        for distance, order in nearby:
+            order_data = order.to_dict(NEARBY_FIELDS)
+            order_data['distance'] = round(distance, 3)  # 公里
+            results.append(order_data)
+        return success_response(results)
+    except Exception as e:
+        current_app.logger.error(f"查询附近订单失败: {str(e)}")
+        return error_response(f"查询附近订单失败: {str(e)}")
+
 # --- 修改后的获取订单详情函数 ---
 @orders_bp.route('/<int:order_id>', methods=['GET', 'OPTIONS']) # 添加 OPTIONS
 @token_required
 def get_order(current_user, order_id):
-    """获取订单详情，并伪造配送员信息（如果订单已分配）"""
+    """获取订单详情，并伪造配送员信息（如果订单已分配）；支持 fields 投影与 ETag 条件请求"""
     try:
-        order_instance = Order.query.get(order_id) # 使用 order_instance 避免与内部变量冲突
+        try:
+            fields = Order.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return error_response(str(e))
+        
+        options = None
+        if fields:
+            options = lambda model: [load_only(*model.projection(fields, 'user_id', 'deliverer_id', 'version'))]
+        order_instance = find_order(order_id, options) # 热表中没有时读取归档表
         if not order_instance:
             return error_response("订单不存在", 404)
         
@@ -221,8 +578,13 @@ def get_order(current_user, order_id):
         # 未来您可以扩展此逻辑以允许配送员访问其被分配的订单
         if order_instance.user_id != current_user.id:
             return error_response("无权访问该订单", 403)
+        
+        # 订单每次变更都会递增 version，ETag 可直接作为 If-Match 用于取消/完成/删除
+        etag = _order_etag(order_instance, request.args.get('fields', ''))
+        if is_not_modified(etag):
+            return not_modified_response(etag)
             
-        order_data = order_instance.to_dict() # 获取订单基本数据
+        order_data = order_instance.to_dict(fields) # 获取订单基本数据
 
         # 检查订单是否有 deliverer_id (假设您的 Order 模型有此字段)
         if hasattr(order_instance, 'deliverer_id') and order_instance.deliverer_id:
@@ -240,7 +602,7 @@ def get_order(current_user, order_id):
         else:
             order_data['deliverer'] = None # 该订单没有关联的配送员
 
-        return success_response(order_data)
+        return with_etag(success_response(order_data), etag)
         
     except Exception as e:
         current_app.logger.error(f"获取订单详情失败 (ID: {order_id}): {str(e)}")
@@ -252,20 +614,17 @@ def get_order(current_user, order_id):
 @token_required
 def cancel_order(current_user, order_id):
     """取消订单 (目标：进行中 -> 已取消)"""
+    precondition = (None, False)
     try:
-        order = Order.query.get(order_id)
-        if not order:
-            return error_response("订单不存在", 404)
-        if order.user_id != current_user.id:
-            return error_response("无权取消该订单", 403)
-        # 确保 order_status 与数据库中的值一致 ('pending' 或中文 '进行中')
-        if order.order_status != 'pending': 
-            return error_response(f"只有进行中(pending)的订单才能取消, 当前状态: {order.order_status}")
-        
-        order.order_status = 'cancelled' # 更新为 'cancelled' 或对应中文
-        order.cancelled_at = datetime.utcnow()
-        db.session.commit()
-        return success_response(order.to_dict(), message="订单已取消")
+        precondition = _precondition()
+        order = order_state.transition(order_id, 'cancel', owner_id=current_user.id, actor_id=current_user.id,
+                                       expected_version=precondition[0])
+        response = success_response(order.to_dict(), message="订单已取消")
+        response.set_etag(_order_etag(order))
+        return response
+    except OrderTransitionError as e:
+        db.session.rollback()
+        return _transition_error(e, precondition)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"取消订单失败: {str(e)}")
@@ -312,19 +671,15 @@ def review_order(current_user, order_id):
 @token_required
 def delete_order(current_user, order_id):
     """删除订单 (目标：已取消的订单)"""
+    precondition = (None, False)
     try:
-        order = Order.query.get(order_id)
-        if not order:
-            return error_response("订单不存在", 404)
-        if order.user_id != current_user.id:
-            return error_response("无权删除该订单", 403)
-        # 确保 order_status 与数据库中的值一致 ('cancelled' 或中文 '已取消')
-        if order.order_status != 'cancelled':
-            return error_response(f"只能删除已取消的订单, 当前状态: {order.order_status}", 403)
-
-        db.session.delete(order)
-        db.session.commit()
+        precondition = _precondition()
+        order_state.transition(order_id, 'delete', owner_id=current_user.id, actor_id=current_user.id,
+                               expected_version=precondition[0])
         return success_response(message="订单已删除")
+    except OrderTransitionError as e:
+        db.session.rollback()
+        return _transition_error(e, precondition)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"删除订单失败: {str(e)}")
@@ -335,23 +690,147 @@ def delete_order(current_user, order_id):
 @token_required
 def complete_order(current_user, order_id):
     """标记订单为已完成"""
+    precondition = (None, False)
     try:
-        order = Order.query.get(order_id)
-        if not order:
-            return error_response("订单不存在", 404)
-        if order.user_id != current_user.id:
-            return error_response("无权操作该订单", 403)
-        if order.order_status != 'pending':
-            return error_response(f"只有进行中的订单才能标记为已完成, 当前状态: {order.order_status}")
-            
-        order.order_status = 'completed'
-        order.completed_at = datetime.utcnow()
-        db.session.commit()
-        return success_response(order.to_dict(), message="订单已完成")
+        precondition = _precondition()
+        order = order_state.transition(order_id, 'complete', owner_id=current_user.id, actor_id=current_user.id,
+                                       expected_version=precondition[0])
+        response = success_response(order.to_dict(), message="订单已完成")
+        response.set_etag(_order_etag(order))
+        return response
+    except OrderTransitionError as e:
+        db.session.rollback()
+        return _transition_error(e, precondition)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"完成订单失败: {str(e)}")
         return error_response(f"完成订单失败: {str(e)}")
+
+
+def _order_etag(order, fields=''):
+    """单个订单的 ETag：版本号，字段投影时附加投影的摘要（"<版本号>.<摘要>"）"""
+    if not fields:
+        return str(order.version)
+    return f"{order.version}.{make_etag(fields)[:8]}"
+
+
+def _precondition():
+    """
+    客户端期望的订单版本，返回 (版本号, 是否来自 If-Match)，做比较并交换
+
+    If-Match 携带 GET 返回的 ETag，也可以在请求体 version 字段中提供版本号。
+    无法解析时拒绝请求（If-Match 返回 412，请求体返回 400），不当作没有前置条件。
+    """
+    if 'If-Match' in request.headers:
+        if request.if_match.star_tag:
+            return None, True
+        versions = set()
+        for tag in request.if_match.as_set():
+            try:
+                versions.add(int(tag.split('.', 1)[0]))
+            except ValueError:
+                raise OrderTransitionError(f"无效的 If-Match: {tag}", 412)
+        if len(versions) != 1:
+            raise OrderTransitionError("If-Match 必须且只能指定一个订单版本", 412)
+        return versions.pop(), True
     
+    value = (request.get_json(silent=True) or {}).get('version')
+    if value is None:
+        return None, False
+    try:
+        return int(value), False
+    except (TypeError, ValueError):
+        raise OrderTransitionError(f"无效的版本号: {value}", 400)
+
+
+def _transition_error(e, precondition=(None, False)):
+    """If-Match 指定的版本已过期时返回 412，其它错误使用状态机给出的状态码"""
+    version, from_header = precondition
+    if from_header and version is not None and e.current_version is not None and e.current_version != version:
+        return error_response(f"订单已被修改，当前版本: {e.current_version}", 412)
+    return error_response(e.message, e.status_code)
+
+
+# --- 订单状态变更事件流 (SSE) ---
+@orders_bp.route('/events/stream', methods=['GET', 'OPTIONS'])
+@token_required(locations=['headers', 'query_string'])
+def stream_order_events(current_user):
+    """推送当前用户所有订单的状态变更，支持 Last-Event-ID 断线续传"""
+    return _event_stream(current_user.id)
+
+
+@orders_bp.route('/<int:order_id>/events/stream', methods=['GET', 'OPTIONS'])
+@token_required(locations=['headers', 'query_string'])
+def stream_single_order_events(current_user, order_id):
+    """推送单个订单的状态变更"""
+    try:
+        owner_id = db.session.query(Order.user_id).filter(Order.id == order_id).scalar()
+        if owner_id is None:
+            # 订单可能已被删除，仍允许订阅者补齐删除前后的事件
+            owner_id = db.session.query(OrderEvent.user_id).filter(OrderEvent.order_id == order_id).limit(1).scalar()
+        if owner_id is None:
+            return error_response("订单不存在", 404)
+        if owner_id != current_user.id:
+            return error_response("无权访问该订单", 403)
+        return _event_stream(current_user.id, order_id)
+    except Exception as e:
+        current_app.logger.error(f"订阅订单事件失败 (ID: {order_id}): {str(e)}")
+        return error_response(f"订阅订单事件失败: {str(e)}")
+
+
+def _event_stream(user_id, order_id=None):
+    """
+    构建 text/event-stream 响应
+
+    先订阅事件中心，再按 Last-Event-ID 从数据库补发，之后推送实时事件并定期发送心跳；
+    已补发过的事件按 id 去重。连接保持 SSE_MAX_DURATION 秒后关闭，由浏览器自动重连。
+    """
+    heartbeat = current_app.config.get('SSE_HEARTBEAT', 15)
+    max_duration = current_app.config.get('SSE_MAX_DURATION', 300)
+    replay_max = current_app.config.get('SSE_REPLAY_MAX', 500)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id is not None else None
+    except ValueError:
+        last_id = None
+
+    def generate():
+        subscription = order_event_hub.subscribe(user_id, order_id)
+        try:
+            sent_id = last_id
+            yield "retry: 3000\n\n"
+            if last_id is not None:
+                replayed = order_event_hub.replay(user_id, last_id, order_id, replay_max)
+                for item in replayed:
+                    sent_id = item['id']
+                    yield _format_event(item)
+                if len(replayed) >= replay_max:
+                    # 积压过多：结束本次连接，客户端带着新的 Last-Event-ID 继续补齐
+                    return
+            db.session.close()  # 长连接期间不占用数据库连接
+
+            deadline = time.monotonic() + max_duration
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                item = subscription.get(min(heartbeat, remaining))
+                if item is OVERFLOW:
+                    return
+                if item is None:
+                    yield ": heartbeat\n\n"
+                elif sent_id is None or item['id'] > sent_id:
+                    sent_id = item['id']
+                    yield _format_event(item)
+        finally:
+            order_event_hub.unsubscribe(subscription)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁止 nginx 缓冲事件流
+    return response
 
 
+def _format_event(item):
+    data = json.dumps(item, ensure_ascii=False)
+    return f"id: {item['id']}\ndata: {data}\n\n"
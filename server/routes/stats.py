@@ -0,0 +1,53 @@
+from flask import Blueprint, request, current_app
+from datetime import datetime, timedelta
+from models import db
+from services.order_rollups import order_rollups, truncate, GRANULARITIES
+from utils.response import success_response, error_response
+from utils.auth_helpers import admin_required
+
+stats_bp = Blueprint('stats', __name__)
+
+@stats_bp.route('/orders', methods=['GET', 'OPTIONS'])
+@admin_required
+def get_order_stats(current_user):
+    """
+    订单统计（仅管理员；只读取预聚合表，增量由后台任务按 ROLLUP_INTERVAL 处理）
+    
+    查询参数：
+    - granularity: hour 或 day，默认 day
+    - from / to: ISO 日期或时间(UTC)，默认最近 7 天（按小时为最近 24 小时）
+    - area: 起点 geohash 前缀，按区域过滤
+    - by_area: 为 1 时按区域分别返回
+    """
+    try:
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return error_response(f"无效的统计粒度: {granularity}")
+        
+        try:
+            end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow()
+            default_span = timedelta(hours=24) if granularity == 'hour' else timedelta(days=7)
+            start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else end - default_span
+        except ValueError as e:
+            return error_response(f"时间格式错误: {str(e)}")
+        if start >= end:
+            return error_response("起始时间必须早于结束时间")
+        
+        bucket_span = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+        max_buckets = current_app.config.get('STATS_MAX_BUCKETS', 1000)
+        if (end - start) / bucket_span > max_buckets:
+            return error_response(f"查询范围过大，最多 {max_buckets} 个时间段")
+        
+        result = order_rollups.query(
+            granularity,
+            truncate(start, granularity),
+            end,
+            area=request.args.get('area') or None,
+            by_area=request.args.get('by_area') in ('1', 'true')
+        )
+        result.update({'granularity': granularity, 'from': start.isoformat(), 'to': end.isoformat()})
+        return success_response(result)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"获取订单统计失败: {str(e)}")
+        return error_response(f"获取订单统计失败: {str(e)}")
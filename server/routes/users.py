@@ -2,12 +2,13 @@ from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 import os
-import uuid
 from models import db
 from models.user import User
 from models.address import Address
 from utils.response import success_response, error_response
 from utils.auth_helpers import token_required
+from services.image_pipeline import image_pipeline
+from services.storage import storage
 
 users_bp = Blueprint('users', __name__)
 
@@ -64,32 +65,13 @@ def upload_avatar_route(current_user):
         # if file.content_length > MAX_AVATAR_SIZE:
         #     return error_response("文件过大，请上传小于2MB的图片", 400)
 
-        unique_filename = f"avatar_{current_user.id}_{uuid.uuid4().hex}{ext}"
-        
-        upload_folder = current_app.config.get('UPLOAD_FOLDER')
-        if not upload_folder:
-            current_app.logger.error("UPLOAD_FOLDER 未在配置中设置。")
-            return error_response("服务器配置错误：上传路径未设置", 500)
-
-        if not os.path.exists(upload_folder):
-            try:
-                os.makedirs(upload_folder, exist_ok=True)
-            except OSError as e:
-                current_app.logger.error(f"创建上传目录失败: {e}")
-                return error_response(f"创建上传目录失败: {str(e)}", 500)
-        
-        file_path = os.path.join(upload_folder, unique_filename)
-        
         try:
-            # 删除旧头像文件（如果存在且不是默认头像）
-            if current_user.avatar and not current_user.avatar.startswith('default'): # 假设默认头像名以 'default' 开头
-                old_avatar_path = os.path.join(upload_folder, current_user.avatar)
-                if os.path.exists(old_avatar_path):
-                    os.remove(old_avatar_path)
-            
-            file.save(file_path)
+            # 按内容哈希保存；旧头像不立即删除，无引用后由上传文件回收任务清理
+            unique_filename = storage.save(file.stream, ext)
             current_user.avatar = unique_filename  # 在数据库中存储新的文件名
             db.session.commit()
+            # 头像只需要缩略图，在后台生成
+            image_pipeline.submit(unique_filename, ocr=False)
             
             return success_response({
                 "message": "头像上传成功",
@@ -97,6 +79,7 @@ def upload_avatar_route(current_user):
                 "user": current_user.to_dict() # 返回更新后的用户信息
             })
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f"保存头像或更新数据库失败: {e}")
             return error_response(f"头像上传处理失败: {str(e)}", 500)
             
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import delete, func, or_, and_, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.ai_cache_entry import AiCacheEntry
+from services.metrics import metrics
+
+
+def content_hash(data):
+    """bytes 或 str 的 SHA-256"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+class AICache:
+    """
+    OCR / AI 解析结果的持久化缓存
+
+    键为 (类型, 输入内容 SHA-256, 服务商, 版本)，版本随接口参数或提示词变化，
+    旧版本的结果自然不再命中，并在淘汰时优先清除。
+    总字节数或条目数超过上限时按最近使用时间淘汰。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('AI_CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+        self.max_bytes = int(os.getenv('AI_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+        self.max_entries = int(os.getenv('AI_CACHE_MAX_ENTRIES', '10000'))
+        self.evict_batch = int(os.getenv('AI_CACHE_EVICT_BATCH', '200'))
+        self._current_versions = {}  # kind -> (provider, version)，淘汰时清除其它版本
+        self._lock = threading.Lock()
+
+    def register_version(self, kind, provider, version):
+        """登记某类结果当前使用的服务商与版本"""
+        with self._lock:
+            self._current_versions[kind] = (provider, version)
+
+    def get(self, kind, key, provider, version):
+        """命中时返回结果并更新最近使用时间，否则返回 None"""
+        if not self.enabled:
+            return None
+        entry = AiCacheEntry.query.filter_by(kind=kind, content_hash=key, provider=provider, version=version).first()
+        if entry is None:
+            metrics.incr(f'ai_cache.{kind}.miss')
+            return None
+        try:
+            db.session.execute(
+                update(AiCacheEntry)
+                .where(AiCacheEntry.id == entry.id)
+                .values(hits=AiCacheEntry.hits + 1, last_used_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        metrics.incr(f'ai_cache.{kind}.hit')
+        return json.loads(entry.result)
+
+    def set(self, kind, key, provider, version, result):
+        if not self.enabled:
+            return
+        payload = json.dumps(result, ensure_ascii=False)
+        now = datetime.utcnow()
+        try:
+            db.session.add(AiCacheEntry(kind=kind, content_hash=key, provider=provider, version=version,
+                                        result=payload, size=len(payload.encode('utf-8')),
+                                        created_at=now, last_used_at=now))
+            db.session.commit()
+        except IntegrityError:
+            # 并发请求已写入同一结果
+            db.session.rollback()
+            return
+        self.evict()
+
+    def evict(self):
+        """超过容量上限时，先删除非当前版本的条目，再按最近使用时间淘汰"""
+        total_bytes, total_entries = db.session.query(
+            func.coalesce(func.sum(AiCacheEntry.size), 0), func.count(AiCacheEntry.id)
+        ).one()
+        if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+            return 0
+
+        evicted = self.invalidate(stale_only=True)
+        total_bytes, total_entries = db.session.query(
+            func.coalesce(func.sum(AiCacheEntry.size), 0), func.count(AiCacheEntry.id)
+        ).one()
+        while total_bytes > self.max_bytes or total_entries > self.max_entries:
+            rows = db.session.query(AiCacheEntry.id, AiCacheEntry.size)\
+                             .order_by(AiCacheEntry.last_used_at)\
+                             .limit(self.evict_batch).all()
+            if not rows:
+                break
+            ids = []
+            for entry_id, size in rows:
+                if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+                    break
+                ids.append(entry_id)
+                total_bytes -= size
+                total_entries -= 1
+            db.session.execute(delete(AiCacheEntry).where(AiCacheEntry.id.in_(ids)))
+            db.session.commit()
+            evicted += len(ids)
+        metrics.incr('ai_cache.evicted', evicted)
+        return evicted
+
+    def invalidate(self, kind=None, stale_only=False):
+        """
+        删除缓存条目，返回删除数
+
+        stale_only=True 时只删除服务商或版本与当前登记不一致的条目（例如修改提示词之后）。
+        """
+        statement = delete(AiCacheEntry)
+        if kind is not None:
+            statement = statement.where(AiCacheEntry.kind == kind)
+        if stale_only:
+            with self._lock:
+                current = dict(self._current_versions)
+            if kind is not None:
+                current = {kind: current[kind]} if kind in current else {}
+            if not current:
+                return 0
+            statement = statement.where(or_(*[
+                and_(AiCacheEntry.kind == name,
+                     or_(AiCacheEntry.provider != provider, AiCacheEntry.version != version))
+                for name, (provider, version) in current.items()
+            ]))
+        deleted = db.session.execute(statement).rowcount
+        db.session.commit()
+        return deleted
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'max_bytes': self.max_bytes,
+            'max_entries': self.max_entries,
+            'versions': {kind: {'provider': provider, 'version': version}
+                         for kind, (provider, version) in self._current_versions.items()},
+        }
+
+
+# 创建全局实例
+ai_cache = AICache()
+metrics.register('ai_cache', ai_cache.stats)
@@ -1,13 +1,49 @@
 import os
 import re
 import json
-import requests
 from flask import current_app
+from services.http_client import http_client
+from services.ai_cache import ai_cache, content_hash
+
+# 订单解析提示词与模型参数；任何改动都会改变解析结果的缓存版本，旧缓存随之失效
+ORDER_PARSE_PROMPT = """请分析以下外卖订单截图的文字内容，提取关键信息。
+
+文字内容：
+{text}
+
+请从中提取：
+1. 商家名称和主要商品（格式：商家名 - 商品名）
+2. 取件信息（包括地址、联系人、电话等）
+
+要求：
+- 忽略广告语、优惠信息、状态提示等无关内容
+- 商品名称要选择主要的、实质性的商品，不要选配菜或赠品
+- 联系电话只显示后4位，格式：****XXXX
+- 如果信息不完整或无法确定，返回空字符串
+
+请以JSON格式返回，不要包含其他文字：
+{{"description": "商家名 - 主要商品", "orderInfo": "完整的取件信息"}}"""
+ORDER_PARSE_SYSTEM = "你是一个专门分析外卖订单信息的AI助手，能够准确识别和提取商家名称、商品信息和取件信息。请严格按照JSON格式返回结果。"
+ORDER_PARSE_PARAMS = {
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "penalty_score": 1.0,
+    "enable_system_memory": False,
+}
+
+OCR_PROVIDER = 'baidu-ocr'
+OCR_CACHE_VERSION = os.getenv('AI_OCR_CACHE_VERSION', 'basicGeneral-1')
+PARSE_PROVIDER = 'wenxin'
+PARSE_CACHE_VERSION = content_hash(
+    ORDER_PARSE_PROMPT + ORDER_PARSE_SYSTEM + json.dumps(ORDER_PARSE_PARAMS, sort_keys=True)
+)[:16] + os.getenv('AI_PARSE_CACHE_VERSION', '')  # 需要手动失效时可追加版本后缀
 
 class AIService:
     def __init__(self):
         self.client = None
         self._init_client()
+        ai_cache.register_version('ocr', OCR_PROVIDER, OCR_CACHE_VERSION)
+        ai_cache.register_version('parse', PARSE_PROVIDER, PARSE_CACHE_VERSION)
     
     def _init_client(self):
         """延迟初始化百度AI客户端"""
@@ -25,6 +61,12 @@ class AIService:
             
             # 初始化百度OCR客户端
             self.client = AipOcr(app_id, api_key, secret_key)
+            # OCR 请求复用共享连接池
+            self.client.s = http_client.session
+            self.client.setConnectionTimeoutInMillis(int(http_client.connect_timeout * 1000))
+            # SDK 默认读超时 60 秒，百度接口卡住时会长时间占用工作线程
+            read_timeout = float(os.getenv('AI_OCR_READ_TIMEOUT', str(http_client.read_timeout)))
+            self.client.setSocketTimeoutInMillis(int(read_timeout * 1000))
             print("百度AI OCR客户端初始化成功")
             
         except ImportError as e:
@@ -33,15 +75,20 @@ class AIService:
             print(f"警告：初始化百度AI客户端失败: {e}")
     
     def recognize_text(self, image_path):
-        """OCR文字识别"""
-        if not self.client:
-            raise Exception("AI服务未正确初始化，请检查配置")
-        
+        """OCR文字识别，相同图片内容直接返回缓存结果"""
         try:
             # 读取图片文件
             with open(image_path, 'rb') as fp:
                 image = fp.read()
             
+            image_hash = content_hash(image)
+            cached = ai_cache.get('ocr', image_hash, OCR_PROVIDER, OCR_CACHE_VERSION)
+            if cached is not None:
+                return cached
+            
+            if not self.client:
+                raise Exception("AI服务未正确初始化，请检查配置")
+            
             # 调用百度OCR API
             result = self.client.basicGeneral(image)
             
@@ -51,7 +98,9 @@ class AIService:
             if 'words_result' in result:
                 # 提取所有识别到的文字
                 text_lines = [item['words'] for item in result['words_result']]
-                return '\n'.join(text_lines)
+                text = '\n'.join(text_lines)
+                ai_cache.set('ocr', image_hash, OCR_PROVIDER, OCR_CACHE_VERSION, text)
+                return text
             else:
                 current_app.logger.warning(f"OCR识别结果异常: {result}")
                 return ''
@@ -60,6 +109,16 @@ class AIService:
             current_app.logger.error(f"OCR识别失败: {str(e)}")
             raise Exception(f"图片识别失败: {str(e)}")
     
+    def analyze_image(self, image_path):
+        """识别订单图片并解析出商品描述和取件信息"""
+        recognized_text = self.recognize_text(image_path)
+        parsed_info = self.parse_order_info(recognized_text)
+        return {
+            'recognizedText': recognized_text,  # 原始识别文本，可用于调试
+            'description': parsed_info['description'],
+            'orderInfo': parsed_info['orderInfo']
+        }
+    
     def parse_order_info(self, text):
         """使用AI智能解析订单信息"""
         result = {
@@ -70,6 +129,11 @@ class AIService:
         if not text.strip():
             return result
         
+        text_hash = content_hash(text)
+        cached = ai_cache.get('parse', text_hash, PARSE_PROVIDER, PARSE_CACHE_VERSION)
+        if cached is not None:
+            return cached
+        
         try:
             # 使用AI理解文本内容
             ai_result = self._ai_understand_text(text)
@@ -77,6 +141,9 @@ class AIService:
             if ai_result and isinstance(ai_result, dict):
                 result['description'] = ai_result.get('description', '')
                 result['orderInfo'] = ai_result.get('orderInfo', '')
+                # 只缓存 AI 给出的结果，规则解析的兜底结果下次仍会重试 AI
+                if result['description'] or result['orderInfo']:
+                    ai_cache.set('parse', text_hash, PARSE_PROVIDER, PARSE_CACHE_VERSION, result)
             
             # 如果AI解析失败，回退到规则解析
             if not result['description'] and not result['orderInfo']:
@@ -95,23 +162,7 @@ class AIService:
         """使用AI模型理解文本内容"""
         try:
             # 构建提示词
-            prompt = f"""请分析以下外卖订单截图的文字内容，提取关键信息。
-
-文字内容：
-{text}
-
-请从中提取：
-1. 商家名称和主要商品（格式：商家名 - 商品名）
-2. 取件信息（包括地址、联系人、电话等）
-
-要求：
-- 忽略广告语、优惠信息、状态提示等无关内容
-- 商品名称要选择主要的、实质性的商品，不要选配菜或赠品
-- 联系电话只显示后4位，格式：****XXXX
-- 如果信息不完整或无法确定，返回空字符串
-
-请以JSON格式返回，不要包含其他文字：
-{{"description": "商家名 - 主要商品", "orderInfo": "完整的取件信息"}}"""
+            prompt = ORDER_PARSE_PROMPT.format(text=text)
             
             # 调用文心一言API
             ai_response = self._call_wenxin_api(prompt)
@@ -149,18 +200,15 @@ class AIService:
                         "content": prompt
                     }
                 ],
-                "temperature": 0.1,
-                "top_p": 0.8,
-                "penalty_score": 1.0,
-                "enable_system_memory": False,
-                "system": "你是一个专门分析外卖订单信息的AI助手，能够准确识别和提取商家名称、商品信息和取件信息。请严格按照JSON格式返回结果。"
+                **ORDER_PARSE_PARAMS,
+                "system": ORDER_PARSE_SYSTEM
             }
             
             headers = {
                 'Content-Type': 'application/json'
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = http_client.post(url, json=payload, headers=headers, timeout=30)
             
             current_app.logger.info(f"文心一言API响应状态: {response.status_code}")
             current_app.logger.info(f"文心一言API响应内容: {response.text}")
@@ -192,7 +240,7 @@ class AIService:
             
             url = f"https://aip.baidubce.com/oauth/2.0/token?client_id={api_key}&client_secret={secret_key}&grant_type=client_credentials"
             
-            response = requests.post(url, timeout=10)
+            response = http_client.post(url, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -0,0 +1,282 @@
+import itertools
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+
+from models import db
+from models.analysis_job import AnalysisJob
+from services.ai_service import ai_service
+from services.background import PeriodicTask
+from services.image_pipeline import image_pipeline
+from services.metrics import metrics
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+
+class JobRejected(Exception):
+    """任务提交被拒绝：队列已满或超过用户并发上限"""
+
+    def __init__(self, message, status_code=429):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class AnalysisJobQueue:
+    """
+    图片识别任务队列
+
+    提交时写入 analysis_jobs 并立即返回任务 id，固定数量的工作线程按优先级取任务执行 OCR 与解析。
+    单个用户同时运行的任务数有上限，超出的任务暂存到该用户的等待队列，前一个任务结束后再放回。
+    任务状态以数据库为准，用条件 UPDATE 认领并记录执行进程，多个进程不会重复执行同一任务。
+    执行进程定期续约自己的 running 任务；续约超过 lease_timeout 未更新的任务视为进程已退出，重新入队，
+    其它进程仍在执行的任务不受影响。运行超过 job_timeout 的任务由后台定期标记为失败。
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv('ANALYSIS_WORKERS', '2'))  # 工作线程数
+        self.queue_max = int(os.getenv('ANALYSIS_QUEUE_MAX', '100'))  # 本进程排队任务上限
+        self.user_max_pending = int(os.getenv('ANALYSIS_USER_MAX_PENDING', '5'))  # 单个用户排队+运行中的任务上限
+        self.user_max_running = int(os.getenv('ANALYSIS_USER_MAX_RUNNING', '1'))  # 单个用户同时运行的任务数
+        self.job_timeout = float(os.getenv('ANALYSIS_JOB_TIMEOUT', '300'))  # 超过此时间仍在运行的任务视为中断(秒)
+        self.reap_interval = float(os.getenv('ANALYSIS_REAP_INTERVAL', '60'))  # 续约与检查超时任务的间隔(秒)，0 表示关闭
+        self.lease_timeout = float(os.getenv('ANALYSIS_LEASE_TIMEOUT', '180'))  # 超过此时间未续约的任务视为执行进程已退出(秒)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._running = {}  # user_id -> 本进程运行中的任务数
+        self._deferred = {}  # user_id -> 等待该用户空出名额的任务
+        self._waiters = {}  # job_id -> 等待者的 threading.Event 集合，任务结束时通知
+        self._threads = []
+        self._reaper = PeriodicTask('analysis-reaper', self.reap_interval, self.reap)
+        self._app = None
+
+    def start(self, app):
+        if self._threads or self.workers <= 0:
+            return
+        self._app = app
+        with app.app_context():
+            self._recover()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'analysis-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._reaper.start(app)
+
+    # ---------- 提交与查询 ----------
+
+    def submit(self, user_id, filename, priority=PRIORITIES['normal']):
+        """创建任务并入队，返回 AnalysisJob；超过上限时抛出 JobRejected"""
+        if not self._threads:
+            raise JobRejected("识别任务队列未启动", 503)
+        if self.depth() >= self.queue_max:
+            metrics.incr('analysis.rejected')
+            raise JobRejected("识别任务排队已满，请稍后再试", 503)
+        pending = db.session.query(func.count(AnalysisJob.id))\
+                            .filter(AnalysisJob.user_id == user_id,
+                                    AnalysisJob.status.in_(('queued', 'running'))).scalar()
+        if pending >= self.user_max_pending:
+            metrics.incr('analysis.rejected')
+            raise JobRejected(f"最多同时提交 {self.user_max_pending} 个识别任务")
+
+        job = AnalysisJob(user_id=user_id, filename=filename, priority=priority)
+        db.session.add(job)
+        db.session.commit()
+        self._enqueue(job.id, user_id, priority, filename)
+        metrics.incr('analysis.submitted')
+        return job
+
+    def cancel(self, job_id):
+        """取消排队中的任务，返回是否成功"""
+        cancelled = db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, AnalysisJob.status == 'queued')
+            .values(status='cancelled', finished_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if cancelled:
+            metrics.incr('analysis.cancelled')
+            self._signal(job_id)
+        return bool(cancelled)
+
+    def wait(self, job_id, timeout):
+        """等待任务结束（仅对本进程执行的任务有效），超时返回 False"""
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(job_id, set()).add(event)
+        try:
+            return event.wait(timeout)
+        finally:
+            with self._lock:
+                events = self._waiters.get(job_id)
+                if events is not None:
+                    events.discard(event)
+                    if not events:
+                        del self._waiters[job_id]
+
+    def depth(self):
+        with self._lock:
+            return self._queue.qsize() + sum(len(entries) for entries in self._deferred.values())
+
+    def stats(self):
+        depth = self.depth()
+        with self._lock:
+            return {
+                'workers': len(self._threads),
+                'queue_depth': depth,
+                'queue_max': self.queue_max,
+                'running': sum(self._running.values()),
+                'deferred_users': len(self._deferred),
+            }
+
+    # ---------- 执行 ----------
+
+    def _enqueue(self, job_id, user_id, priority, filename):
+        self._queue.put((priority, next(self._sequence), job_id, user_id, filename))
+
+    def _work(self):
+        while True:
+            entry = self._queue.get()
+            user_id = entry[3]
+            with self._lock:
+                if self._running.get(user_id, 0) >= self.user_max_running:
+                    self._deferred.setdefault(user_id, deque()).append(entry)
+                    continue
+                self._running[user_id] = self._running.get(user_id, 0) + 1
+            try:
+                with self._app.app_context():
+                    self._run(entry[2], entry[4])
+            except Exception as e:
+                self._app.logger.error(f"识别任务 {entry[2]} 执行异常: {str(e)}")
+            finally:
+                with self._lock:
+                    self._running[user_id] -= 1
+                    if not self._running[user_id]:
+                        del self._running[user_id]
+                    deferred = self._deferred.get(user_id)
+                    if deferred:
+                        self._queue.put(deferred.popleft())
+                        if not deferred:
+                            del self._deferred[user_id]
+
+    def _run(self, job_id, filename):
+        started_at = datetime.utcnow()
+        claimed = db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, AnalysisJob.status == 'queued')
+            .values(status='running', started_at=started_at, worker_id=self.worker_id, heartbeat_at=started_at)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return  # 已取消或已被其它进程认领
+
+        started = time.monotonic()
+        status, result, error = 'failed', None, "任务执行中断"
+        try:
+            job = db.session.get(AnalysisJob, job_id)
+            metrics.observe('analysis.wait_ms', (started_at - job.created_at).total_seconds() * 1000)
+            result = json.dumps(ai_service.analyze_image(image_pipeline.ocr_path(filename)), ensure_ascii=False)
+            status, error = 'succeeded', None
+        except Exception as e:
+            error = str(e)
+        finally:
+            # 无论识别是否抛出异常都写入结束状态，任务不会停留在 running
+            self._finish(job_id, status, result, error)
+            metrics.observe('analysis.run_ms', (time.monotonic() - started) * 1000)
+            metrics.incr(f'analysis.{status}')
+            self._signal(job_id)
+
+    def _finish(self, job_id, status, result, error):
+        """写入结束状态；已被超时回收或已转交其它进程的任务不会被覆盖"""
+        values = {'status': status, 'result': result, 'error': error, 'finished_at': datetime.utcnow()}
+        for attempt in range(2):
+            try:
+                db.session.execute(
+                    update(AnalysisJob)
+                    .where(AnalysisJob.id == job_id, AnalysisJob.status == 'running',
+                           AnalysisJob.worker_id == self.worker_id)
+                    .values(**values)
+                )
+                db.session.commit()
+                return
+            except Exception as e:
+                db.session.rollback()
+                if attempt:
+                    self._app.logger.error(f"识别任务 {job_id} 写入结果失败: {str(e)}")
+
+    def _signal(self, job_id):
+        with self._lock:
+            events = self._waiters.pop(job_id, ())
+        for event in events:
+            event.set()
+
+    def reap(self):
+        """续约本进程的任务，把运行超过 job_timeout 的任务标记为失败，把租约过期的任务重新入队；返回失败的任务数"""
+        now = datetime.utcnow()
+        db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.status == 'running', AnalysisJob.worker_id == self.worker_id)
+            .values(heartbeat_at=now)
+        )
+        db.session.commit()
+
+        stale_before = now - timedelta(seconds=self.job_timeout)
+        stale = [job_id for (job_id,) in db.session.query(AnalysisJob.id)
+                 .filter(AnalysisJob.status == 'running', AnalysisJob.started_at < stale_before)]
+        reaped = 0
+        if stale:
+            reaped = db.session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id.in_(stale), AnalysisJob.status == 'running')
+                .values(status='failed', error="任务执行超时", finished_at=now)
+            ).rowcount
+            db.session.commit()
+            metrics.incr('analysis.reaped', reaped)
+            for job_id in stale:
+                self._signal(job_id)
+
+        released = self._release_expired()
+        if released:
+            for job in AnalysisJob.query.filter(AnalysisJob.id.in_(released), AnalysisJob.status == 'queued'):
+                self._enqueue(job.id, job.user_id, job.priority, job.filename)
+        return reaped
+
+    def _release_expired(self):
+        """把租约过期的 running 任务改回排队，返回这些任务的 id"""
+        lease_before = datetime.utcnow() - timedelta(seconds=self.lease_timeout)
+        expired = (AnalysisJob.status == 'running',
+                   func.coalesce(AnalysisJob.heartbeat_at, AnalysisJob.started_at) < lease_before)
+        job_ids = [job_id for (job_id,) in db.session.query(AnalysisJob.id).filter(*expired)]
+        if not job_ids:
+            return []
+        released = db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id.in_(job_ids), *expired)
+            .values(status='queued', started_at=None, worker_id=None, heartbeat_at=None)
+        ).rowcount
+        db.session.commit()
+        metrics.incr('analysis.requeued', released)
+        return job_ids
+
+    def _recover(self):
+        """启动时把执行进程已退出的任务改回排队，与未执行的任务一起重新入队"""
+        self._release_expired()
+        queued = AnalysisJob.query.filter_by(status='queued')\
+                                  .order_by(AnalysisJob.priority, AnalysisJob.created_at).all()
+        for job in queued:
+            self._enqueue(job.id, job.user_id, job.priority, job.filename)
+
+
+# 创建全局实例
+analysis_jobs = AnalysisJobQueue()
+metrics.register('analysis_jobs', analysis_jobs.stats)
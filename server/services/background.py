@@ -0,0 +1,32 @@
+import threading
+import time
+
+
+class PeriodicTask:
+    """在后台守护线程中按固定间隔执行任务（运行于给定 Flask 应用上下文）"""
+
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, app):
+        while not self._stop.wait(self.interval):
+            started = time.monotonic()
+            with app.app_context():
+                try:
+                    self.fn()
+                except Exception as e:
+                    app.logger.error(f"后台任务 {self.name} 执行失败: {str(e)}")
+            app.logger.debug(f"后台任务 {self.name} 耗时 {time.monotonic() - started:.3f}s")
@@ -0,0 +1,239 @@
+import heapq
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180  # 每度纬度(米)
+DEFAULT_GRAPH_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'campus_graph.geojson')
+
+# OSM 中可以骑行/步行通过的道路类型
+OSM_ROUTABLE_HIGHWAYS = {
+    'primary', 'secondary', 'tertiary', 'unclassified', 'residential', 'service',
+    'living_street', 'pedestrian', 'footway', 'path', 'cycleway', 'track', 'steps',
+    'primary_link', 'secondary_link', 'tertiary_link',
+}
+
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    """两点间球面距离(米)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class CampusRouter:
+    """
+    离线校园路网路线规划
+
+    从 GeoJSON（LineString/MultiLineString）或 OSM XML 文件加载校园道路图，
+    用 A* 计算最短骑行时间。起点或终点离路网太远（不在校内）时返回 None，
+    由 MapService 交给下一个后端（高德）处理。
+    """
+
+    def __init__(self, graph_path=None):
+        self.graph_path = graph_path or os.getenv('CAMPUS_GRAPH_PATH') or DEFAULT_GRAPH_PATH
+        self.speed_kmh = float(os.getenv('CAMPUS_ROUTER_SPEED_KMH', '12'))  # 默认骑行速度
+        self.max_snap_m = float(os.getenv('CAMPUS_ROUTER_MAX_SNAP', '200'))  # 起终点吸附到路网的最大距离
+        self.grid = 0.002  # 最近节点查找用的网格大小(度)
+
+        self.nodes = []  # 节点坐标 [(lat, lng)]
+        self.adjacency = []  # 邻接表 [[(节点, 距离米, 时间秒)]]
+        self._node_index = {}
+        self._buckets = {}
+        self._max_speed_ms = self.speed_kmh / 3.6
+        self.available = False
+
+        if os.path.exists(self.graph_path):
+            try:
+                self.load(self.graph_path)
+            except Exception as e:
+                print(f"警告：校园路网加载失败，离线路线规划不可用: {e}")
+
+    # ---------- 路网加载 ----------
+
+    def load(self, path):
+        """根据扩展名加载 GeoJSON 或 OSM 路网"""
+        if path.lower().endswith('.osm'):
+            self._load_osm(path)
+        else:
+            self._load_geojson(path)
+        self.available = len(self.nodes) > 1
+        print(f"校园路网加载完成: {len(self.nodes)} 个节点")
+
+    def _load_geojson(self, path):
+        with open(path, 'r', encoding='utf-8') as fp:
+            data = json.load(fp)
+
+        features = data.get('features', []) if data.get('type') == 'FeatureCollection' else [data]
+        for feature in features:
+            geometry = feature.get('geometry') or {}
+            properties = feature.get('properties') or {}
+            if geometry.get('type') == 'LineString':
+                lines = [geometry.get('coordinates', [])]
+            elif geometry.get('type') == 'MultiLineString':
+                lines = geometry.get('coordinates', [])
+            else:
+                continue
+
+            speed = properties.get('speed_kmh')
+            oneway = properties.get('oneway') in (True, 'yes', '1', 1)
+            for line in lines:
+                # GeoJSON 坐标顺序为 [经度, 纬度]
+                self._add_line([(point[1], point[0]) for point in line], speed, oneway)
+
+    def _load_osm(self, path):
+        root = ET.parse(path).getroot()
+        coords = {}
+        for node in root.iter('node'):
+            coords[node.get('id')] = (float(node.get('lat')), float(node.get('lon')))
+
+        for way in root.iter('way'):
+            tags = {tag.get('k'): tag.get('v') for tag in way.iter('tag')}
+            if tags.get('highway') not in OSM_ROUTABLE_HIGHWAYS:
+                continue
+            points = [coords[nd.get('ref')] for nd in way.iter('nd') if nd.get('ref') in coords]
+            speed = tags.get('maxspeed')
+            try:
+                speed = min(float(speed), self.speed_kmh) if speed else None
+            except ValueError:
+                speed = None
+            self._add_line(points, speed, tags.get('oneway') == 'yes')
+
+    def _add_line(self, points, speed_kmh=None, oneway=False):
+        speed_ms = float(speed_kmh or self.speed_kmh) / 3.6
+        self._max_speed_ms = max(self._max_speed_ms, speed_ms)
+        previous = None
+        for lat, lng in points:
+            current = self._node_id(lat, lng)
+            if previous is not None and previous != current:
+                distance = _haversine_m(*self.nodes[previous], lat, lng)
+                self.adjacency[previous].append((current, distance, distance / speed_ms))
+                if not oneway:
+                    self.adjacency[current].append((previous, distance, distance / speed_ms))
+            previous = current
+
+    def _node_id(self, lat, lng):
+        key = (round(lat, 7), round(lng, 7))
+        node_id = self._node_index.get(key)
+        if node_id is None:
+            node_id = len(self.nodes)
+            self._node_index[key] = node_id
+            self.nodes.append((lat, lng))
+            self.adjacency.append([])
+            self._buckets.setdefault(self._bucket(lat, lng), []).append(node_id)
+        return node_id
+
+    def _bucket(self, lat, lng):
+        return (int(math.floor(lat / self.grid)), int(math.floor(lng / self.grid)))
+
+    # ---------- 路线计算 ----------
+
+    def _search_rings(self, lat):
+        """覆盖吸附距离所需的网格圈数 (纬度方向, 经度方向)；经度方向每格的宽度随纬度按 cos 缩小"""
+        lat_span = self.max_snap_m / METERS_PER_DEGREE
+        # 取搜索范围内离赤道最远处的纬度，保证整个吸附圆都被覆盖
+        cos_lat = max(math.cos(math.radians(min(89.9, abs(lat) + lat_span))), 1e-6)
+        return (int(math.ceil(lat_span / self.grid)),
+                int(math.ceil(lat_span / cos_lat / self.grid)))
+
+    def nearest_node(self, lat, lng):
+        """返回 (节点, 距离米)，超出吸附距离时返回 (None, None)"""
+        row, col = self._bucket(lat, lng)
+        row_rings, col_rings = self._search_rings(lat)
+        best, best_distance = None, None
+        for d_row in range(-row_rings, row_rings + 1):
+            for d_col in range(-col_rings, col_rings + 1):
+                for node_id in self._buckets.get((row + d_row, col + d_col), []):
+                    distance = _haversine_m(lat, lng, *self.nodes[node_id])
+                    if best_distance is None or distance < best_distance:
+                        best, best_distance = node_id, distance
+        if best is None or best_distance > self.max_snap_m:
+            return None, None
+        return best, best_distance
+
+    def shortest_path(self, source, target):
+        """A* 最短时间路径，返回 (节点列表, 距离米, 时间秒)，不连通时返回 None"""
+        target_lat, target_lng = self.nodes[target]
+
+        def heuristic(node_id):
+            return _haversine_m(*self.nodes[node_id], target_lat, target_lng) / self._max_speed_ms
+
+        open_heap = [(heuristic(source), 0.0, source)]
+        best_time = {source: 0.0}
+        best_distance = {source: 0.0}
+        previous = {}
+        closed = set()
+
+        while open_heap:
+            _f, elapsed, node_id = heapq.heappop(open_heap)
+            if node_id in closed:
+                continue
+            if node_id == target:
+                path = [node_id]
+                while path[-1] in previous:
+                    path.append(previous[path[-1]])
+                path.reverse()
+                return path, best_distance[target], elapsed
+            closed.add(node_id)
+
+            for neighbor, distance, duration in self.adjacency[node_id]:
+                candidate = elapsed + duration
+                if candidate < best_time.get(neighbor, float('inf')):
+                    best_time[neighbor] = candidate
+                    best_distance[neighbor] = best_distance[node_id] + distance
+                    previous[neighbor] = node_id
+                    heapq.heappush(open_heap, (candidate + heuristic(neighbor), candidate, neighbor))
+        return None
+
+    def calculate_route(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """
+        离线路线规划，返回与高德骑行规划相同结构的结果；不适用时返回 None
+        """
+        if not self.available:
+            return None
+
+        origin_lat, origin_lng, dest_lat, dest_lng = map(float, (origin_lat, origin_lng, dest_lat, dest_lng))
+        source, source_snap = self.nearest_node(origin_lat, origin_lng)
+        target, target_snap = self.nearest_node(dest_lat, dest_lng)
+        if source is None or target is None:
+            return None
+
+        found = self.shortest_path(source, target)
+        if found is None:
+            return None
+        path, distance, duration = found
+
+        # 加上起终点到路网的接驳距离
+        snap_distance = source_snap + target_snap
+        distance += snap_distance
+        duration += snap_distance / (self.speed_kmh / 3.6)
+
+        points = [(origin_lat, origin_lng)] + [self.nodes[node_id] for node_id in path] + [(dest_lat, dest_lng)]
+        polyline = ';'.join(f"{lng:.6f},{lat:.6f}" for lat, lng in points)
+
+        return {
+            'success': True,
+            'data': {
+                'duration': max(1, round(duration / 60)),  # 分钟
+                'distance': round(distance / 1000, 2),  # 公里
+                'mode': '骑行',
+                'route_info': {
+                    'source': 'campus',
+                    'distance': int(distance),
+                    'duration': int(duration),
+                    'steps': [{
+                        'polyline': polyline,
+                        'distance': int(distance),
+                        'duration': int(duration),
+                    }]
+                }
+            }
+        }
+
+
+# 创建全局实例
+campus_router = CampusRouter()
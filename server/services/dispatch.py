@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db
+from models.deliverer import Deliverer
+from models.order import Order
+from services.geo import distance_matrix_km, estimate_cycling_minutes
+from services.metrics import metrics
+from services.order_state import order_state, OrderTransitionError
+
+INFEASIBLE = 1e9
+
+
+def hungarian(cost):
+    """
+    匈牙利算法求最小代价指派，cost 为 n×m 列表且 n <= m
+
+    返回长度为 n 的列表，第 i 行分配到的列号。
+    """
+    n, m = len(cost), len(cost[0])
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)  # p[j]: 第 j 列当前匹配的行（1 起始）
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        min_v = [float('inf')] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta, j1 = float('inf'), 0
+            row = cost[i0 - 1]
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                current = row[j - 1] - u[i0] - v[j]
+                if current < min_v[j]:
+                    min_v[j] = current
+                    way[j] = j0
+                if min_v[j] < delta:
+                    delta, j1 = min_v[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_v[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = [0] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def greedy(cost):
+    """贪心指派：按代价从小到大依次匹配，适合规模较大的轮次"""
+    pairs = sorted(
+        (value, i, j)
+        for i, row in enumerate(cost)
+        for j, value in enumerate(row)
+        if value < INFEASIBLE
+    )
+    used_rows, used_cols, assignment = set(), set(), {}
+    for _value, i, j in pairs:
+        if i in used_rows or j in used_cols:
+            continue
+        used_rows.add(i)
+        used_cols.add(j)
+        assignment[i] = j
+    return assignment
+
+
+class DispatchEngine:
+    """
+    派单引擎：按轮次把待接订单分配给在线配送员
+
+    每轮收集未分配的 pending 订单和在线配送员，按「取件预计时间 + 当前负载 + 评分」
+    构建代价矩阵，小规模用匈牙利算法求最优，大规模用贪心；配送员按剩余容量展开为多个槽位。
+    分配通过订单状态机的条件更新写入，订单在此期间被取消或已被分配时跳过。
+    """
+
+    def __init__(self):
+        self.max_load = int(os.getenv('DISPATCH_MAX_LOAD', '3'))  # 配送员同时承接的最大订单数
+        self.max_pickup_eta = float(os.getenv('DISPATCH_MAX_PICKUP_ETA', '20'))  # 最大取件预计时间(分钟)
+        self.unknown_location_eta = float(os.getenv('DISPATCH_UNKNOWN_ETA', '10'))  # 位置未知时的取件时间估计
+        self.load_weight = float(os.getenv('DISPATCH_LOAD_WEIGHT', '5'))
+        self.rating_weight = float(os.getenv('DISPATCH_RATING_WEIGHT', '2'))
+        self.hungarian_max_cells = int(os.getenv('DISPATCH_HUNGARIAN_MAX_CELLS', '40000'))
+        self.batch_size = int(os.getenv('DISPATCH_BATCH_SIZE', '200'))  # 每轮最多处理的订单数
+        self.interval = float(os.getenv('DISPATCH_INTERVAL', '0'))  # 自动派单间隔(秒)，0 表示关闭
+        self._lock = threading.Lock()
+        self.last_round = None
+
+    def run_round(self):
+        """执行一轮派单，返回本轮摘要"""
+        with self._lock:
+            summary = self._run_round()
+        self.last_round = summary
+        return summary
+
+    def _run_round(self):
+        started = time.monotonic()
+        orders = Order.query.filter(Order.order_status == 'pending', Order.deliverer_id.is_(None))\
+                            .order_by(Order.created_at)\
+                            .limit(self.batch_size).all()
+        deliverers = Deliverer.query.filter_by(status='online').all()
+
+        summary = {
+            'orders': len(orders),
+            'deliverers': len(deliverers),
+            'matched': 0,
+            'conflicts': 0,
+            'algorithm': None,
+            'assignments': [],
+        }
+        slots = self._deliverer_slots(deliverers) if orders and deliverers else []
+        if not slots:
+            return self._finish(summary, started)
+
+        eta = self._pickup_eta_matrix(orders, deliverers)
+        deliverer_index = {deliverer.id: index for index, deliverer in enumerate(deliverers)}
+        cost = []
+        for i, order in enumerate(orders):
+            row = []
+            for deliverer, load in slots:
+                pickup_eta = eta[i, deliverer_index[deliverer.id]]
+                if pickup_eta > self.max_pickup_eta:
+                    row.append(INFEASIBLE)
+                else:
+                    rating_penalty = max(0.0, 5.0 - (deliverer.rating or 0.0))
+                    row.append(float(pickup_eta) + self.load_weight * load + self.rating_weight * rating_penalty)
+            cost.append(row)
+
+        matches = self._solve(cost, summary)
+
+        total_cost = total_eta = 0.0
+        for i, s in matches:
+            order, deliverer = orders[i], slots[s][0]
+            try:
+                order_state.transition(order.id, 'assign', values={'deliverer_id': deliverer.id}, commit=False)
+            except OrderTransitionError:
+                summary['conflicts'] += 1
+                continue
+            pickup_eta = float(eta[i, deliverer_index[deliverer.id]])
+            total_cost += cost[i][s]
+            total_eta += pickup_eta
+            summary['assignments'].append({
+                'order_id': order.id,
+                'deliverer_id': deliverer.id,
+                'pickup_eta': round(pickup_eta, 1),
+            })
+        db.session.commit()
+
+        matched = len(summary['assignments'])
+        summary['matched'] = matched
+        if matched:
+            summary['avg_cost'] = round(total_cost / matched, 2)
+            summary['avg_pickup_eta'] = round(total_eta / matched, 2)
+            metrics.observe('dispatch.avg_pickup_eta', summary['avg_pickup_eta'])
+            metrics.observe('dispatch.avg_cost', summary['avg_cost'])
+        return self._finish(summary, started)
+
+    def _deliverer_slots(self, deliverers):
+        """按剩余容量把配送员展开为槽位 (配送员, 该槽位对应的负载)"""
+        loads = dict(
+            db.session.query(Order.deliverer_id, func.count(Order.id))
+            .filter(Order.order_status == 'pending', Order.deliverer_id.in_([d.id for d in deliverers]))
+            .group_by(Order.deliverer_id)
+            .all()
+        )
+        slots = []
+        for deliverer in deliverers:
+            for load in range(loads.get(deliverer.id, 0), self.max_load):
+                slots.append((deliverer, load))
+        return slots
+
+    def _pickup_eta_matrix(self, orders, deliverers):
+        """配送员当前位置到订单起点的预计骑行时间(分钟)，位置未知时使用默认估计"""
+        eta = np.full((len(orders), len(deliverers)), self.unknown_location_eta)
+        order_rows = [i for i, order in enumerate(orders) if order.origin_lat is not None and order.origin_lng is not None]
+        deliverer_cols = [j for j, d in enumerate(deliverers) if d.current_lat is not None and d.current_lng is not None]
+        if order_rows and deliverer_cols:
+            distances = distance_matrix_km(
+                [(orders[i].origin_lat, orders[i].origin_lng) for i in order_rows],
+                [(deliverers[j].current_lat, deliverers[j].current_lng) for j in deliverer_cols]
+            )
+            eta[np.ix_(order_rows, deliverer_cols)] = estimate_cycling_minutes(distances)
+        return eta
+
+    def _solve(self, cost, summary):
+        """返回 [(订单行, 槽位列)]，过滤掉不可行的匹配"""
+        n, m = len(cost), len(cost[0])
+        if n * m > self.hungarian_max_cells:
+            summary['algorithm'] = 'greedy'
+            pairs = greedy(cost).items()
+        else:
+            summary['algorithm'] = 'hungarian'
+            if n <= m:
+                pairs = enumerate(hungarian(cost))
+            else:
+                transposed = [list(column) for column in zip(*cost)]
+                pairs = ((i, j) for j, i in enumerate(hungarian(transposed)))
+        return [(i, j) for i, j in pairs if cost[i][j] < INFEASIBLE]
+
+    def _finish(self, summary, started):
+        summary['duration_ms'] = round((time.monotonic() - started) * 1000, 2)
+        summary['unmatched'] = summary['orders'] - summary['matched']
+        metrics.incr('dispatch.rounds')
+        metrics.incr('dispatch.matched', summary['matched'])
+        metrics.incr('dispatch.conflicts', summary['conflicts'])
+        metrics.observe('dispatch.round_ms', summary['duration_ms'])
+        metrics.observe('dispatch.unmatched', summary['unmatched'])
+        return summary
+
+
+# 创建全局实例
+dispatch_engine = DispatchEngine()
+metrics.register('dispatch_last_round', lambda: {
+    key: value for key, value in (dispatch_engine.last_round or {}).items() if key != 'assignments'
+})
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# 直线距离到实际骑行距离的绕行系数，以及估算用的平均骑行速度
+DETOUR_FACTOR = float(os.getenv('GEO_DETOUR_FACTOR', '1.3'))
+CYCLING_SPEED_KMH = float(os.getenv('GEO_CYCLING_SPEED_KMH', '12'))
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    球面距离(公里)，参数可以是标量或 NumPy 数组，按广播规则逐元素计算
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix_km(origins, destinations):
+    """
+    origins(n×2)、destinations(m×2) 为 [lat, lng] 坐标，返回 n×m 的球面距离矩阵(公里)
+    """
+    origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+    return haversine_km(origins[:, 0:1], origins[:, 1:2], destinations[:, 0], destinations[:, 1])
+
+
+def estimate_cycling_distance_km(straight_km):
+    """按绕行系数由直线距离估算骑行距离(公里)"""
+    return np.asarray(straight_km, dtype=float) * DETOUR_FACTOR
+
+
+def estimate_cycling_minutes(straight_km):
+    """由直线距离粗略估算骑行时长(分钟)，至少 1 分钟"""
+    minutes = estimate_cycling_distance_km(straight_km) / CYCLING_SPEED_KMH * 60
+    return np.maximum(1, np.rint(minutes)).astype(int)
+
+
+def within_radius(center_lat, center_lng, lats, lngs, radius_km):
+    """返回 (是否在半径内的布尔数组, 距离数组)，用于批量初筛候选点"""
+    distances = haversine_km(center_lat, center_lng, lats, lngs)
+    return distances <= radius_km, distances
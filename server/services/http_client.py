@@ -0,0 +1,208 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.metrics import metrics
+
+# 对幂等 GET 请求重试的状态码
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class PoolExhausted(requests.exceptions.RequestException):
+    """等待主机连接池空闲名额超时；连接池已满时重试只会继续排队，因此不重试"""
+
+
+class _HostPoolStats:
+    """单个主机的连接池使用情况"""
+
+    def __init__(self, maxsize):
+        self.semaphore = threading.BoundedSemaphore(maxsize)
+        self.in_use = 0
+        self.requests = 0
+        self.errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    """在发送请求时统计每个主机的占用连接数与排队等待时间"""
+
+    def __init__(self, client, **kwargs):
+        self._client = client
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        host = urlparse(request.url).netloc
+        with self._client._acquire(host):
+            return super().send(request, **kwargs)
+
+
+class HttpClient:
+    """
+    出站 HTTP 客户端，MapService 与 AIService 共用
+
+    - 按主机维护 keep-alive 连接池，避免每次请求重新握手 TCP/TLS
+    - 默认连接/读取超时可配置，调用方也可单独指定
+    - 幂等 GET 在连接错误或 5xx/429 时按带抖动的指数退避重试；读取超时与连接池排队超时不重试，
+      所有尝试（含退避）的总耗时不超过 total_timeout
+    """
+
+    def __init__(self):
+        self.pool_connections = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))  # 缓存的主机连接池数量
+        self.pool_maxsize = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))  # 每个主机的最大连接数
+        self.pool_timeout = float(os.getenv('HTTP_POOL_TIMEOUT', '5'))  # 等待空闲连接的最长时间(秒)
+        self.connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3'))
+        self.read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+        self.max_retries = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+        self.total_timeout = float(os.getenv('HTTP_TOTAL_TIMEOUT', '15'))  # 单次 get 所有尝试的总耗时上限(秒)
+        self.backoff_base = float(os.getenv('HTTP_BACKOFF_BASE', '0.2'))
+        self.backoff_max = float(os.getenv('HTTP_BACKOFF_MAX', '2'))
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+        self.adapter = _InstrumentedAdapter(
+            self,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def get(self, url, params=None, timeout=None, retries=None, deadline=None, **kwargs):
+        """
+        幂等 GET 请求，连接失败或 5xx/429 时带抖动退避重试
+
+        deadline 为所有尝试的总耗时上限(秒)，默认 total_timeout；每次尝试的读取超时不超过剩余时间，
+        剩余时间不足以退避后再试时直接返回最后一次结果或抛出异常。
+        """
+        attempts = 1 + (self.max_retries if retries is None else retries)
+        expires = time.monotonic() + (self.total_timeout if deadline is None else deadline)
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.get(url, params=params, timeout=self._timeout(timeout, expires), **kwargs)
+            except requests.exceptions.ReadTimeout:
+                # 服务端已收到请求但响应慢，重试只会成倍占用请求线程
+                raise
+            except requests.exceptions.ConnectionError as e:
+                if last_attempt:
+                    raise
+                error, response = e, None
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    return response
+                error = None
+            backoff = self._backoff(attempt)
+            if time.monotonic() + backoff >= expires:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            metrics.incr('http.retries')
+            time.sleep(backoff)
+
+    def post(self, url, timeout=None, **kwargs):
+        """POST 请求，不自动重试"""
+        return self.session.post(url, timeout=self._timeout(timeout), **kwargs)
+
+    def stats(self):
+        """各主机连接池统计：占用、空闲、请求数与等待时间"""
+        idle = self._idle_connections()
+        with self._lock:
+            hosts = {}
+            for host, stat in self._hosts.items():
+                hosts[host] = {
+                    'in_use': stat.in_use,
+                    'idle': idle.get(host, 0),
+                    'requests': stat.requests,
+                    'errors': stat.errors,
+                    'wait_total_ms': round(stat.wait_total * 1000, 2),
+                    'wait_avg_ms': round(stat.wait_total * 1000 / stat.requests, 2) if stat.requests else 0.0,
+                    'wait_max_ms': round(stat.wait_max * 1000, 2),
+                }
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'total_timeout': self.total_timeout,
+            'hosts': hosts,
+        }
+
+    @contextmanager
+    def _acquire(self, host):
+        """占用某主机的一个连接名额，统计排队时间"""
+        with self._lock:
+            stat = self._hosts.get(host)
+            if stat is None:
+                stat = self._hosts[host] = _HostPoolStats(self.pool_maxsize)
+
+        started = time.monotonic()
+        if not stat.semaphore.acquire(timeout=self.pool_timeout):
+            with self._lock:
+                stat.errors += 1
+            raise PoolExhausted(f"等待 {host} 连接池超时")
+        waited = time.monotonic() - started
+
+        with self._lock:
+            stat.in_use += 1
+            stat.requests += 1
+            stat.wait_total += waited
+            stat.wait_max = max(stat.wait_max, waited)
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                stat.errors += 1
+            raise
+        finally:
+            with self._lock:
+                stat.in_use -= 1
+            stat.semaphore.release()
+
+    def _idle_connections(self):
+        """读取 urllib3 连接池中空闲的 keep-alive 连接数"""
+        idle = {}
+        try:
+            pools = self.adapter.poolmanager.pools
+            with pools.lock:
+                items = list(pools._container.values())
+            for pool in items:
+                host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                queue = list(pool.pool.queue) if pool.pool is not None else []
+                idle[host] = idle.get(host, 0) + sum(1 for conn in queue if conn is not None)
+        except Exception:
+            pass
+        return idle
+
+    def _timeout(self, timeout, expires=None):
+        if timeout is None:
+            connect, read = self.connect_timeout, self.read_timeout
+        elif isinstance(timeout, (tuple, list)):
+            connect, read = timeout
+        else:
+            connect, read = min(self.connect_timeout, timeout), timeout
+        if expires is not None:
+            # 不超过总耗时上限的剩余时间
+            remaining = max(0.1, expires - time.monotonic())
+            connect, read = min(connect, remaining), min(read, remaining)
+        return (connect, read)
+
+    def _backoff(self, attempt):
+        """Full jitter 指数退避时间"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+# 创建全局实例
+http_client = HttpClient()
+metrics.register('http_pools', http_client.stats)
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PIL import Image, ImageOps
+
+from models import db
+from models.image_variant import ImageVariant
+from services.metrics import metrics
+from services.storage import storage
+
+OCR_VARIANT = 'ocr'
+VARIANT_VERSION = 1  # 派生图处理方式变化时加一，派生图文件名随之变化
+FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'jpeg': ('JPEG', '.jpg'),
+}
+
+
+def _flatten(image):
+    """透明背景铺白并转换为 RGB，JPEG 不支持透明通道"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+class ImagePipeline:
+    """
+    上传图片入库流水线
+
+    上传接口保存原图后提交到线程池，在请求线程之外按 EXIF 方向摆正、去除 EXIF，
+    生成限制长边的 OCR 副本和几种固定尺寸的缩略图，并记录到 image_variants。
+    原图保持不变；OCR 使用副本，客户端通过 ?size= 取缩略图，处理完成前均回退到原图。
+    派生图文件名为 <原图哈希>_<变体>_<参数摘要>.<扩展名>，尺寸、格式或质量配置变化后文件名随之变化，
+    长期缓存的旧文件不会被当作新版本；再次处理时按新配置重新生成并删除旧文件。
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv('IMAGE_PIPELINE_WORKERS', '2'))  # 0 表示不生成派生图
+        self.ocr_max_edge = int(os.getenv('IMAGE_OCR_MAX_EDGE', '2048'))  # OCR 副本最长边(像素)
+        self.ocr_quality = int(os.getenv('IMAGE_OCR_QUALITY', '85'))
+        self.thumbnail_sizes = tuple(sorted(
+            int(size) for size in os.getenv('IMAGE_THUMBNAIL_SIZES', '128,320,640').split(',') if size.strip()
+        ))
+        self.thumbnail_format = os.getenv('IMAGE_THUMBNAIL_FORMAT', 'webp')  # webp 或 jpeg
+        self.thumbnail_quality = int(os.getenv('IMAGE_THUMBNAIL_QUALITY', '80'))
+        self.ocr_wait = float(os.getenv('IMAGE_OCR_WAIT', '5'))  # OCR 前等待入库处理完成的最长时间(秒)
+
+        if self.thumbnail_format not in FORMATS:
+            self.thumbnail_format = 'webp'
+        self._executor = None
+        self._pending = {}  # 原图文件名 -> Future
+        self._lock = threading.Lock()
+        self._app = None
+
+    def start(self, app):
+        if self._executor is not None or self.workers <= 0:
+            return
+        self._app = app
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image')
+
+    # ---------- 提交 ----------
+
+    def submit(self, filename, ocr=True):
+        """提交原图处理，ocr=False 时只生成缩略图（如头像）"""
+        if self._executor is None:
+            return None
+        with self._lock:
+            future = self._pending.get(filename)
+            if future is not None:
+                return future
+            future = self._pending[filename] = self._executor.submit(self._run, filename, ocr)
+        future.add_done_callback(lambda _future: self._done(filename))
+        return future
+
+    def _done(self, filename):
+        with self._lock:
+            self._pending.pop(filename, None)
+
+    def _run(self, filename, ocr):
+        with self._app.app_context():
+            try:
+                # 内容相同的文件已按当前配置处理过
+                existing = {name for (name,) in
+                            db.session.query(ImageVariant.filename).filter(ImageVariant.source == filename)}
+                if existing >= {self._variant_filename(filename, target) for target in self._targets(ocr)}:
+                    return
+                self.process(filename, ocr)
+            except Exception as e:
+                db.session.rollback()
+                metrics.incr('image_pipeline.failed')
+                self._app.logger.error(f"图片 {filename} 处理失败: {str(e)}")
+
+    # ---------- 处理 ----------
+
+    def _targets(self, ocr):
+        """当前配置下要生成的派生图 [(变体名, 长边, 格式, 质量)]，按长边从大到小"""
+        targets = [(str(size), size, self.thumbnail_format, self.thumbnail_quality) for size in self.thumbnail_sizes]
+        if ocr:
+            targets.append((OCR_VARIANT, self.ocr_max_edge, 'jpeg', self.ocr_quality))
+        # 从大到小依次缩小，每个尺寸都在上一个结果上缩放
+        targets.sort(key=lambda target: target[1], reverse=True)
+        return targets
+
+    @staticmethod
+    def _variant_filename(source, target):
+        name, edge, image_format, quality = target
+        digest = hashlib.sha256(f"{VARIANT_VERSION}:{edge}:{image_format}:{quality}".encode()).hexdigest()[:8]
+        return f"{os.path.splitext(source)[0]}_{name}_{digest}{FORMATS[image_format][1]}"
+
+    def process(self, filename, ocr=True):
+        """生成并记录派生图（替换按旧配置生成的派生图），返回 ImageVariant 列表"""
+        started = time.monotonic()
+        targets = self._targets(ocr)
+
+        variants = []
+        with Image.open(storage.path(filename)) as source:
+            # JPEG 解码时直接按 2 的幂缩小，避免完整解码大图
+            source.draft('RGB', (targets[0][1], targets[0][1]))
+            image = _flatten(ImageOps.exif_transpose(source))
+            for target in targets:
+                edge = target[1]
+                image = image.copy() if max(image.size) <= edge else self._resize(image, edge)
+                variants.append(self._save(filename, image, target))
+
+        current = {variant.filename for variant in variants}
+        stale = [variant.filename for variant in ImageVariant.query.filter_by(source=filename)
+                 if variant.filename not in current]
+        ImageVariant.query.filter_by(source=filename).delete()
+        db.session.add_all(variants)
+        db.session.commit()
+        for name in stale:
+            storage.delete(name)
+        metrics.incr('image_pipeline.processed')
+        metrics.observe('image_pipeline.process_ms', (time.monotonic() - started) * 1000)
+        return variants
+
+    @staticmethod
+    def _resize(image, edge):
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        return resized
+
+    def _save(self, source, image, target):
+        name, _edge, image_format, quality = target
+        pil_format = FORMATS[image_format][0]
+        variant_filename = self._variant_filename(source, target)
+        path = storage.path(variant_filename)
+        # 同一原图可能被并发处理（重复上传、OCR 补生成），临时文件名不能冲突
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # 不传 exif 参数，保存结果不含 EXIF
+        image.save(temp_path, pil_format, quality=quality, optimize=image_format == 'jpeg')
+        os.replace(temp_path, path)
+        return ImageVariant(source=source, variant=name, filename=variant_filename, format=image_format,
+                            width=image.width, height=image.height, size=os.path.getsize(path))
+
+    def remove(self, filename):
+        """删除原图的所有派生图（文件与记录），不提交事务"""
+        for variant in ImageVariant.query.filter_by(source=filename).all():
+            storage.delete(variant.filename)
+            db.session.delete(variant)
+
+    # ---------- 读取 ----------
+
+    def ocr_path(self, filename):
+        """
+        OCR 使用的文件路径
+
+        原图仍在处理中时最多等待 ocr_wait 秒；没有 OCR 副本的旧图片在当前线程补生成，失败时使用原图。
+        """
+        with self._lock:
+            future = self._pending.get(filename)
+        if future is not None:
+            wait([future], timeout=self.ocr_wait)
+        variant = ImageVariant.query.filter_by(source=filename, variant=OCR_VARIANT).first()
+        if variant is None and future is None and self.workers > 0:
+            try:
+                self.process(filename)
+                variant = ImageVariant.query.filter_by(source=filename, variant=OCR_VARIANT).first()
+            except Exception as e:
+                db.session.rollback()
+                metrics.incr('image_pipeline.failed')
+                if self._app is not None:
+                    self._app.logger.warning(f"图片 {filename} 生成 OCR 副本失败，使用原图: {str(e)}")
+        if variant is not None and storage.exists(variant.filename):
+            return storage.path(variant.filename)
+        return storage.path(filename)
+
+    def thumbnail_for(self, filename, size):
+        """不小于 size 的最小缩略图文件名，都小于 size 时取最大的；没有缩略图时返回 None"""
+        variants = ImageVariant.query.filter(ImageVariant.source == filename,
+                                             ImageVariant.variant != OCR_VARIANT).all()
+        if not variants:
+            return None
+        variants.sort(key=lambda variant: max(variant.width, variant.height))
+        for variant in variants:
+            if max(variant.width, variant.height) >= size:
+                return variant.filename
+        return variants[-1].filename
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'workers': self.workers if self._executor is not None else 0,
+            'pending': pending,
+            'ocr_max_edge': self.ocr_max_edge,
+            'thumbnail_sizes': list(self.thumbnail_sizes),
+            'thumbnail_format': self.thumbnail_format,
+        }
+
+
+# 创建全局实例
+image_pipeline = ImagePipeline()
+metrics.register('image_pipeline', image_pipeline.stats)
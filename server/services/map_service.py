@@ -1,18 +1,99 @@
-import requests
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from flask import current_app
+from services.http_client import http_client
+from services.metrics import metrics
+from services.route_cache import RouteCache
+from services.place_index import PlaceTipIndex
+from services.campus_router import campus_router
+from services.place_store import lookup_places, record_places
+from services.single_flight import SingleFlight
+from utils.app_context import with_app_context
 
 class MapService:
     def __init__(self):
         self.amap_key = os.getenv('AMAP_KEY')
         if not self.amap_key:
             raise ValueError("AMAP_KEY not found in environment variables")
+        self.route_cache = RouteCache()
+        self.place_index = PlaceTipIndex()
+        metrics.register('route_cache', self.route_cache.stats)
+        metrics.register('place_index', self.place_index.stats)
+        self._route_flight = SingleFlight()
+        self._search_flight = SingleFlight()
+        metrics.register('single_flight', lambda: {
+            'route': self._route_flight.stats(),
+            'search': self._search_flight.stats()
+        })
+        self.route_backends = []
+        self._init_route_backends()
+        
+        # 骑行/步行对冲请求：off - 骑行失败后再请求步行；delay - 骑行超过延迟仍未返回时发出步行请求；
+        # parallel - 同时发出两个请求
+        self.hedge_mode = os.getenv('ROUTE_HEDGE_MODE', 'delay').lower()
+        self.hedge_delay = float(os.getenv('ROUTE_HEDGE_DELAY', '1.5'))  # 秒
+        self.hedge_workers = int(os.getenv('ROUTE_HEDGE_WORKERS', '8'))
+        # 对冲请求的单次尝试总耗时上限(秒)，落败请求无法中途取消，需尽快释放工作线程
+        self.hedge_attempt_timeout = float(os.getenv('ROUTE_HEDGE_ATTEMPT_TIMEOUT', '5'))
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=self.hedge_workers,
+            thread_name_prefix='route-hedge'
+        )
+        # 已提交到对冲线程池、尚未结束的请求数，不超过工作线程数，避免新请求排在落败请求之后
+        self._hedge_outstanding = 0
+        self._hedge_lock = threading.Lock()
+        metrics.register('route_hedge', self.hedge_stats)
+        self.matrix_max_cells = int(os.getenv('ROUTE_MATRIX_MAX_CELLS', '100'))
+        self._matrix_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('ROUTE_MATRIX_WORKERS', '4')),
+            thread_name_prefix='route-matrix'
+        )
+    
+    def _init_route_backends(self):
+        """
+        按 ROUTE_BACKEND 配置路线规划后端：
+        auto - 校园离线路网优先，不适用时使用高德；campus - 仅离线路网；amap - 仅高德
+        """
+        mode = os.getenv('ROUTE_BACKEND', 'auto').lower()
+        if mode in ('auto', 'campus') and campus_router.available:
+            self.register_route_backend('campus', campus_router.calculate_route)
+        if mode in ('auto', 'amap'):
+            self.register_route_backend('amap', self._calculate_bicycling_route)
+    
+    def register_route_backend(self, name, handler, first=False):
+        """
+        注册路线规划后端。handler(origin_lat, origin_lng, dest_lat, dest_lng) 返回
+        {'success', 'data'/'message'}，不适用于该起终点时返回 None
+        """
+        self.route_backends = [item for item in self.route_backends if item[0] != name]
+        if first:
+            self.route_backends.insert(0, (name, handler))
+        else:
+            self.route_backends.append((name, handler))
     
     def search_places(self, keyword, city="杭州", page_size=10):
         """
-        高德地图地点搜索API (输入提示)
+        高德地图地点搜索API (输入提示)，优先从本地前缀索引返回
         """
+        cached = self.place_index.lookup(keyword, city, page_size)
+        if cached is not None:
+            return {'success': True, 'data': cached}
+        
+        # 相同城市+关键词的并发请求只执行一次
+        flight_key = (city, PlaceTipIndex.normalize(keyword), page_size)
+        return self._search_flight.do(flight_key, self._search_places_uncached, keyword, city, page_size)
+    
+    def _search_places_uncached(self, keyword, city, page_size):
+        """本地地点表 -> 高德 inputtips"""
+        # 其次查询本地地点表（所有进程共享，重启后仍保留）
+        local = lookup_places(keyword, city, page_size)
+        if local is not None:
+            self.place_index.store(keyword, city, local)
+            return {'success': True, 'data': local}
+        
         url = "https://restapi.amap.com/v3/assistant/inputtips"
         params = {
             'keywords': keyword,
@@ -23,7 +104,7 @@ class MapService:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = http_client.get(url, params=params, timeout=10)
             data = response.json()
             
             current_app.logger.info(f"高德地图搜索响应: {data}")
@@ -51,6 +132,10 @@ class MapService:
                             current_app.logger.warning(f"解析坐标失败: {location}, 错误: {e}")
                             continue
                 
+                # 完整结果写入本地索引，供后续更长的关键词过滤使用
+                self.place_index.store(keyword, city, results)
+                record_places(city, results)
+                
                 # 限制返回数量
                 results = results[:page_size]
                 return {'success': True, 'data': results}
@@ -66,7 +151,203 @@ class MapService:
     
     def calculate_route(self, origin_lat, origin_lng, dest_lat, dest_lng):
         """
-        高德地图路线规划API - 骑行路径规划
+        路线规划，优先读取路线缓存，未命中时依次尝试各路线规划后端
+        """
+        cached = self.route_cache.get(origin_lat, origin_lng, dest_lat, dest_lng)
+        if cached is not None:
+            return {'success': True, 'data': cached}
+        return self._compute_route_shared(origin_lat, origin_lng, dest_lat, dest_lng)
+    
+    def _compute_route_shared(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """按吸附后的起终点合并并发的相同路线请求"""
+        key = self.route_cache.make_key(origin_lat, origin_lng, dest_lat, dest_lng)
+        return self._route_flight.do(key, self._compute_route, origin_lat, origin_lng, dest_lat, dest_lng)
+    
+    def _compute_route(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """不查缓存直接规划路线，成功后写入缓存"""
+        result = self._route_from_backends(origin_lat, origin_lng, dest_lat, dest_lng)
+        if result.get('success'):
+            self.route_cache.set(origin_lat, origin_lng, dest_lat, dest_lng, result['data'])
+        return result
+    
+    def route_matrix(self, origins, destinations):
+        """
+        批量路线规划：origins × destinations 的时长(分钟)/距离(公里)矩阵
+
+        起终点按路线缓存网格吸附后去重，A→B 与 B→A 视为同一对只计算一次；
+        缓存未命中的点对提交到有界线程池并发计算。
+        """
+        snap = self.route_cache.make_key
+        pairs = {}  # 规范化点对 -> (起点, 终点)
+        cells = {}  # (i, j) -> 规范化点对
+        for i, origin in enumerate(origins):
+            for j, destination in enumerate(destinations):
+                forward = snap(origin['lat'], origin['lng'], destination['lat'], destination['lng'])
+                backward = snap(destination['lat'], destination['lng'], origin['lat'], origin['lng'])
+                if forward == backward:
+                    cells[(i, j)] = None  # 起终点相同
+                    continue
+                key = min(forward, backward)
+                cells[(i, j)] = key
+                if key not in pairs:
+                    pairs[key] = (origin, destination) if key == forward else (destination, origin)
+        
+        results = {}
+        pending = {}
+        task = with_app_context(self._compute_route_shared)
+        for key, (start, end) in pairs.items():
+            cached = self.route_cache.get(start['lat'], start['lng'], end['lat'], end['lng'])
+            if cached is not None:
+                results[key] = {'success': True, 'data': cached}
+            else:
+                pending[key] = self._matrix_executor.submit(task, start['lat'], start['lng'], end['lat'], end['lng'])
+        cache_hits = len(results)
+        for key, future in pending.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = {'success': False, 'message': f"路线规划异常: {str(e)}"}
+        
+        durations = [[None] * len(destinations) for _ in origins]
+        distances = [[None] * len(destinations) for _ in origins]
+        errors = []
+        for (i, j), key in cells.items():
+            if key is None:
+                durations[i][j], distances[i][j] = 0, 0.0
+                continue
+            result = results[key]
+            if result.get('success'):
+                durations[i][j] = result['data']['duration']
+                distances[i][j] = result['data']['distance']
+            else:
+                errors.append({'origin': i, 'destination': j, 'message': result.get('message')})
+        
+        metrics.incr('route.matrix.cells', len(cells))
+        metrics.incr('route.matrix.computed', len(pending))
+        return {
+            'durations': durations,
+            'distances': distances,
+            'errors': errors,
+            'stats': {
+                'cells': len(cells),
+                'unique_pairs': len(pairs),
+                'cache_hits': cache_hits,
+                'computed': len(pending)
+            }
+        }
+    
+    def _route_from_backends(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """按顺序调用路线规划后端，返回第一个成功的结果"""
+        result = {'success': False, 'message': "没有可用的路线规划后端"}
+        for name, handler in self.route_backends:
+            backend_result = handler(origin_lat, origin_lng, dest_lat, dest_lng)
+            if backend_result is None:
+                continue
+            if backend_result.get('success'):
+                metrics.incr(f'route.backend.{name}')
+                return backend_result
+            result = backend_result
+        return result
+    
+    def _calculate_bicycling_route(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """
+        高德骑行路径规划，失败时以步行路径规划估算；按 ROUTE_HEDGE_MODE 顺序或对冲请求
+        """
+        if self.hedge_mode in ('delay', 'parallel'):
+            primary = self._submit_hedge(self._request_bicycling_route, origin_lat, origin_lng, dest_lat, dest_lng)
+            if primary is not None:
+                return self._hedged_route(primary, origin_lat, origin_lng, dest_lat, dest_lng)
+            # 对冲线程池已满：在当前线程顺序请求
+            metrics.incr('route.hedge.skipped')
+        result = self._request_bicycling_route(origin_lat, origin_lng, dest_lat, dest_lng)
+        if result.get('success'):
+            return result
+        return self._calculate_walking_route_fallback(origin_lat, origin_lng, dest_lat, dest_lng)
+    
+    def _submit_hedge(self, fn, *args):
+        """有空闲对冲线程时提交请求（带单次尝试时限），返回 Future；已满时返回 None"""
+        with self._hedge_lock:
+            if self._hedge_outstanding >= self.hedge_workers:
+                return None
+            self._hedge_outstanding += 1
+        future = self._hedge_executor.submit(with_app_context(self._timed_call), fn, *args,
+                                             deadline=self.hedge_attempt_timeout)
+        future.add_done_callback(self._release_hedge)
+        return future
+    
+    def _release_hedge(self, _future):
+        with self._hedge_lock:
+            self._hedge_outstanding -= 1
+    
+    def hedge_stats(self):
+        with self._hedge_lock:
+            return {'outstanding': self._hedge_outstanding, 'workers': self.hedge_workers}
+    
+    def _hedged_route(self, primary, origin_lat, origin_lng, dest_lat, dest_lng):
+        """
+        对冲请求：骑行请求先发出，超过 hedge_delay 未成功（parallel 模式下立即）再发出步行请求，
+        先返回有效结果者胜出。落败请求若尚未开始则取消，已在进行中的结果直接丢弃。
+        对冲线程池已满时不发出步行对冲，等骑行结束后按需在当前线程请求步行。
+        """
+        args = (origin_lat, origin_lng, dest_lat, dest_lng)
+        started = time.monotonic()
+        
+        futures = {primary: 'bicycling'}
+        delay = 0 if self.hedge_mode == 'parallel' else self.hedge_delay
+        done, _ = wait(futures, timeout=delay)
+        
+        if done:
+            result, _elapsed = primary.result()
+            if result.get('success'):
+                metrics.incr('route.hedge.winner.bicycling')
+                return result
+            # 骑行已失败，不需要对冲
+            return self._calculate_walking_route_fallback(*args)
+        
+        hedge = self._submit_hedge(self._calculate_walking_route_fallback, *args)
+        if hedge is None:
+            metrics.incr('route.hedge.skipped')
+            result, _elapsed = primary.result()
+            if result.get('success'):
+                metrics.incr('route.hedge.winner.bicycling')
+                return result
+            return self._calculate_walking_route_fallback(*args)
+        metrics.incr('route.hedge.fired')
+        futures[hedge] = 'walking'
+        
+        elapsed_by_mode = {}
+        last_result = None
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                mode = futures.pop(future)
+                result, elapsed = future.result()
+                elapsed_by_mode[mode] = elapsed
+                if not result.get('success'):
+                    last_result = last_result or result
+                    continue
+                
+                for loser in futures:
+                    loser.cancel()
+                total = time.monotonic() - started
+                metrics.incr(f'route.hedge.winner.{mode}')
+                if mode == 'walking':
+                    # 顺序降级至少需要：骑行已耗时（未返回则按当前耗时计）+ 步行耗时
+                    sequential = elapsed_by_mode.get('bicycling', total) + elapsed
+                    metrics.observe('route.hedge.saved_ms', max(0.0, sequential - total) * 1000)
+                return result
+        
+        return last_result
+    
+    @staticmethod
+    def _timed_call(fn, *args, **kwargs):
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        return result, time.monotonic() - started
+    
+    def _request_bicycling_route(self, origin_lat, origin_lng, dest_lat, dest_lng, deadline=None):
+        """
+        高德地图路线规划API - 骑行路径规划，deadline 为所有重试的总耗时上限(秒)
         """
         url = "https://restapi.amap.com/v4/direction/bicycling"
         params = {
@@ -80,7 +361,7 @@ class MapService:
             current_app.logger.info(f"高德地图路线规划请求: {url}")
             current_app.logger.info(f"请求参数: {params}")
             
-            response = requests.get(url, params=params, timeout=10)
+            response = http_client.get(url, params=params, timeout=10, deadline=deadline)
             data = response.json()
             
             current_app.logger.info(f"高德地图路线规划响应: {data}")
@@ -113,18 +394,18 @@ class MapService:
                 else:
                     return {'success': False, 'message': "未找到骑行路径"}
             else:
-                # 如果骑行路径规划失败，尝试步行路径规划作为备选
-                current_app.logger.warning(f"骑行路径规划失败: errcode={data.get('errcode')}, errmsg={data.get('errmsg')}")
-                return self._calculate_walking_route_fallback(origin_lat, origin_lng, dest_lat, dest_lng)
+                error_msg = f"骑行路径规划失败: errcode={data.get('errcode')}, errmsg={data.get('errmsg')}"
+                current_app.logger.warning(error_msg)
+                return {'success': False, 'message': error_msg}
                 
         except Exception as e:
             error_msg = f"骑行路径规划异常: {str(e)}"
             current_app.logger.error(error_msg)
             return {'success': False, 'message': error_msg}
     
-    def _calculate_walking_route_fallback(self, origin_lat, origin_lng, dest_lat, dest_lng):
+    def _calculate_walking_route_fallback(self, origin_lat, origin_lng, dest_lat, dest_lng, deadline=None):
         """
-        备选方案：使用步行路径规划，然后估算骑行时间
+        备选方案：使用步行路径规划，然后估算骑行时间，deadline 为所有重试的总耗时上限(秒)
         """
         url = "https://restapi.amap.com/v3/direction/walking"
         params = {
@@ -138,7 +419,7 @@ class MapService:
             current_app.logger.info(f"高德地图步行路径规划请求: {url}")
             current_app.logger.info(f"请求参数: {params}")
             
-            response = requests.get(url, params=params, timeout=10)
+            response = http_client.get(url, params=params, timeout=10, deadline=deadline)
             data = response.json()
             
             current_app.logger.info(f"高德地图步行路径规划响应: {data}")
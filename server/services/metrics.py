@@ -0,0 +1,55 @@
+import threading
+
+
+class Metrics:
+    """
+    进程内的简单指标注册表
+
+    - incr: 计数器
+    - observe: 数值分布（次数/总和/最小/最大）
+    - register: 注册一个返回 dict 的回调，快照时调用（例如缓存、连接池统计）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._observations = {}
+        self._providers = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            stat = self._observations.get(name)
+            if stat is None:
+                stat = self._observations[name] = {'count': 0, 'sum': 0.0, 'min': value, 'max': value}
+            stat['count'] += 1
+            stat['sum'] += value
+            stat['min'] = min(stat['min'], value)
+            stat['max'] = max(stat['max'], value)
+
+    def register(self, name, provider):
+        with self._lock:
+            self._providers[name] = provider
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            observations = {}
+            for name, stat in self._observations.items():
+                observations[name] = dict(stat, avg=round(stat['sum'] / stat['count'], 3))
+            providers = dict(self._providers)
+
+        result = {'counters': counters, 'observations': observations}
+        for name, provider in providers.items():
+            try:
+                result[name] = provider()
+            except Exception as e:
+                result[name] = {'error': str(e)}
+        return result
+
+
+# 创建全局实例
+metrics = Metrics()
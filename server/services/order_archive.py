@@ -0,0 +1,108 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, literal, select
+
+from models import db
+from models.order import ARCHIVABLE_STATUSES, Order, OrderArchive
+from services.metrics import metrics
+
+
+class OrderArchiver:
+    """
+    冷热分离：把超过保留期的已完成/已取消订单分批迁入 orders_archive
+
+    每批在一个事务中 INSERT ... SELECT 后 DELETE，单批行数有上限，避免长时间持有写锁。
+    orders 使用 AUTOINCREMENT，迁出的 id 不会再分配给新订单。
+    """
+
+    def __init__(self):
+        self.retention_days = float(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', '30'))  # 终态订单在热表中的保留天数
+        self.batch_size = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', '500'))
+        self.max_batches = int(os.getenv('ORDER_ARCHIVE_MAX_BATCHES', '20'))  # 每次运行最多处理的批数
+        self.interval = float(os.getenv('ORDER_ARCHIVE_INTERVAL', '0'))  # 自动归档间隔(秒)，0 表示关闭
+        self.last_run = None
+
+        self._columns = [column.name for column in Order.__table__.columns]
+
+    def run(self, retention_days=None, max_batches=None):
+        """归档直到没有符合条件的订单或达到批数上限，返回本次摘要"""
+        started = time.monotonic()
+        retention_days = self.retention_days if retention_days is None else retention_days
+        max_batches = self.max_batches if max_batches is None else max_batches
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+        archived = batches = 0
+        while batches < max_batches:
+            moved = self.archive_batch(cutoff)
+            archived += moved
+            batches += 1
+            if moved < self.batch_size:
+                break
+
+        summary = {
+            'archived': archived,
+            'batches': batches,
+            'cutoff': cutoff.isoformat(),
+            'duration_ms': round((time.monotonic() - started) * 1000, 2),
+        }
+        self.last_run = summary
+        metrics.incr('order_archive.archived', archived)
+        metrics.observe('order_archive.run_ms', summary['duration_ms'])
+        return summary
+
+    def archive_batch(self, cutoff):
+        """迁移一批订单，返回迁移的行数"""
+        finished_at = func.coalesce(Order.completed_at, Order.cancelled_at, Order.created_at)
+        ids = db.session.execute(
+            select(Order.id)
+            .where(Order.order_status.in_(ARCHIVABLE_STATUSES), finished_at < cutoff)
+            .order_by(Order.id)
+            .limit(self.batch_size)
+        ).scalars().all()
+        if not ids:
+            return 0
+
+        try:
+            source = Order.__table__
+            columns = [source.c[name] for name in self._columns]
+            db.session.execute(
+                insert(OrderArchive.__table__).from_select(
+                    self._columns + ['archived_at'],
+                    select(*columns, literal(datetime.utcnow(), db.DateTime))
+                    .where(source.c.id.in_(ids), source.c.order_status.in_(ARCHIVABLE_STATUSES))
+                )
+            )
+            # 与 INSERT 使用相同条件，期间被删除的订单两边都不会处理
+            result = db.session.execute(
+                delete(Order).where(Order.id.in_(ids), Order.order_status.in_(ARCHIVABLE_STATUSES))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result.rowcount
+
+    def stats(self):
+        return {
+            'retention_days': self.retention_days,
+            'interval': self.interval,
+            'last_run': self.last_run,
+        }
+
+
+def find_order(order_id, options=None):
+    """按 id 查询订单，热表没有时读归档表"""
+    for model in (Order, OrderArchive):
+        query = model.query.options(*options(model)) if options else model.query
+        order = query.get(order_id)
+        if order is not None:
+            return order
+    return None
+
+
+# 创建全局实例
+order_archiver = OrderArchiver()
+metrics.register('order_archive', order_archiver.stats)
@@ -0,0 +1,175 @@
+import os
+import queue
+import threading
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import db
+from models.order_event import OrderEvent
+from services.metrics import metrics
+
+# 会话中写入了订单事件的标记，提交后唤醒轮询线程
+PENDING_KEY = 'order_events_pending'
+
+# 订阅队列满时放入的结束标记，客户端据此断开并用 Last-Event-ID 重连补齐
+OVERFLOW = object()
+
+
+class Subscription:
+    """单个 SSE 连接的订阅，按用户（可选再按订单）过滤事件"""
+
+    def __init__(self, user_id, order_id=None, maxsize=100):
+        self.user_id = user_id
+        self.order_id = order_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def matches(self, event):
+        return event['user_id'] == self.user_id and (self.order_id is None or event['order_id'] == self.order_id)
+
+    def get(self, timeout):
+        """等待下一条事件，超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class OrderEventHub:
+    """
+    进程内订单事件发布/订阅中心
+
+    order_events 表作为 outbox：每个进程的轮询线程按自增 id 读取新提交的事件，
+    再分发给本进程的订阅者，因此多个 worker 进程都能推送同一批事件。
+    本进程内的提交通过 notify() 立即唤醒轮询，其它进程的提交最迟一个轮询间隔后送达。
+    没有订阅者时不查询数据库。
+    """
+
+    def __init__(self):
+        self.poll_interval = float(os.getenv('ORDER_EVENTS_POLL_INTERVAL', '1'))  # 轮询间隔(秒)
+        self.batch_size = int(os.getenv('ORDER_EVENTS_BATCH_SIZE', '200'))
+        self.queue_size = int(os.getenv('ORDER_EVENTS_QUEUE_SIZE', '100'))  # 单个订阅者的缓冲事件数
+        self._subscribers = {}  # user_id -> set(Subscription)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._cursor = None  # 已分发的最大事件 id，无订阅者时为 None
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None or self.poll_interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,), name='order-events', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """本进程提交了新事件，唤醒轮询线程"""
+        self._wake.set()
+
+    def subscribe(self, user_id, order_id=None):
+        """注册订阅（需在应用上下文中调用），首个订阅者会把轮询游标定位到当前最大事件 id"""
+        subscription = Subscription(user_id, order_id, self.queue_size)
+        with self._lock:
+            if self._cursor is None:
+                self._cursor = self.latest_event_id()
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        metrics.incr('order_events.subscribed')
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+            if not self._subscribers:
+                self._cursor = None
+
+    def publish(self, event):
+        """把一条事件（OrderEvent.to_dict()）分发给匹配的订阅者"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(event['user_id'], ()))
+        for subscription in subscribers:
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # 消费过慢：清空缓冲并通知连接关闭，客户端重连后从数据库补齐
+                metrics.incr('order_events.overflow')
+                self._drain(subscription)
+                subscription.queue.put_nowait(OVERFLOW)
+        metrics.incr('order_events.published')
+
+    def poll(self):
+        """读取游标之后的新事件并分发，返回分发的事件数"""
+        with self._lock:
+            cursor = self._cursor
+        if cursor is None:
+            return 0
+        events = OrderEvent.query.filter(OrderEvent.id > cursor)\
+                                 .order_by(OrderEvent.id)\
+                                 .limit(self.batch_size).all()
+        for order_event in events:
+            self.publish(order_event.to_dict())
+        if events:
+            with self._lock:
+                if self._cursor is not None:
+                    self._cursor = max(self._cursor, events[-1].id)
+        return len(events)
+
+    @staticmethod
+    def latest_event_id():
+        return db.session.query(func.max(OrderEvent.id)).scalar() or 0
+
+    @staticmethod
+    def replay(user_id, after_id, order_id=None, limit=500):
+        """断线重连时从数据库补发 after_id 之后的事件"""
+        query = OrderEvent.query.filter(OrderEvent.user_id == user_id, OrderEvent.id > after_id)
+        if order_id is not None:
+            query = query.filter(OrderEvent.order_id == order_id)
+        return [event.to_dict() for event in query.order_by(OrderEvent.id).limit(limit).all()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                'users': len(self._subscribers),
+                'cursor': self._cursor,
+            }
+
+    @staticmethod
+    def _drain(subscription):
+        while True:
+            try:
+                subscription.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self, app):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with app.app_context():
+                try:
+                    # 一批读满时继续读，直到追上最新事件
+                    while self.poll() >= self.batch_size:
+                        pass
+                except Exception as e:
+                    app.logger.error(f"订单事件轮询失败: {str(e)}")
+
+
+# 创建全局实例
+order_event_hub = OrderEventHub()
+metrics.register('order_events', order_event_hub.stats)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_after_commit(session):
+    if session.info.pop(PENDING_KEY, False):
+        order_event_hub.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import func, update
+
+from models import db
+from models.order import Order, OrderArchive
+from models.order_event import OrderEvent
+from models.order_rollup import OrderRollup, RollupCheckpoint
+from services.metrics import metrics
+
+GRANULARITIES = ('hour', 'day')
+METRIC_COLUMNS = (
+    'created_count', 'completed_count', 'cancelled_count',
+    'created_amount', 'completed_amount', 'duration_sum', 'duration_count',
+)
+CHECKPOINT_NAME = 'order_rollups'
+
+
+def _number(value):
+    """事件快照中的数值，早期事件可能以字符串记录；无法转换时返回 None"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def truncate(moment, granularity):
+    """把时间截断到所属小时/天的起点"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class OrderRollupService:
+    """
+    订单统计预聚合
+
+    只读取 order_events 中检查点之后的新事件，把增量累加到 order_rollups（按小时、按天 × 区域），
+    检查点与增量在同一事务中提交。检查点用条件 UPDATE 推进，多个进程同时处理时只有一个生效。
+    首次运行时用订单表（含归档表）的当前状态建立基线，之后完全由事件驱动。
+    """
+
+    def __init__(self):
+        self.area_precision = int(os.getenv('ROLLUP_AREA_PRECISION', '6'))  # 区域 geohash 位数，6 位约 1.2km×0.6km
+        self.batch_size = int(os.getenv('ROLLUP_BATCH_SIZE', '1000'))
+        self.interval = float(os.getenv('ROLLUP_INTERVAL', '60'))  # 后台增量处理间隔(秒)，0 表示关闭
+        self._lock = threading.Lock()
+        self.last_run = None
+
+    # ---------- 增量处理 ----------
+
+    def process(self, max_batches=None):
+        """处理新事件，返回本次摘要"""
+        started = time.monotonic()
+        processed = batches = 0
+        with self._lock:
+            self._ensure_checkpoint()
+            while max_batches is None or batches < max_batches:
+                count = self._process_batch()
+                processed += count
+                batches += 1
+                if count < self.batch_size:
+                    break
+
+        summary = {
+            'processed': processed,
+            'batches': batches,
+            'duration_ms': round((time.monotonic() - started) * 1000, 2),
+        }
+        self.last_run = summary
+        metrics.incr('rollups.events', processed)
+        metrics.observe('rollups.process_ms', summary['duration_ms'])
+        return summary
+
+    def _process_batch(self):
+        last_id = db.session.query(RollupCheckpoint.last_event_id)\
+                            .filter(RollupCheckpoint.name == CHECKPOINT_NAME).scalar()
+        events = db.session.query(OrderEvent.id, OrderEvent.event, OrderEvent.payload, OrderEvent.created_at)\
+                           .filter(OrderEvent.id > last_id)\
+                           .order_by(OrderEvent.id)\
+                           .limit(self.batch_size).all()
+        if not events:
+            return 0
+
+        deltas = self._new_deltas()
+        for _id, kind, payload, created_at in events:
+            snapshot = json.loads(payload) if payload else {}
+            self._accumulate(deltas, kind, created_at, snapshot.get('actual_amount'),
+                             snapshot.get('estimated_duration'), snapshot.get('origin_geohash'))
+
+        try:
+            # 先推进检查点（同时取得写锁），失败说明其它进程已处理过这批事件
+            claimed = db.session.execute(
+                update(RollupCheckpoint)
+                .where(RollupCheckpoint.name == CHECKPOINT_NAME, RollupCheckpoint.last_event_id == last_id)
+                .values(last_event_id=events[-1].id, updated_at=datetime.utcnow())
+            ).rowcount
+            if claimed != 1:
+                db.session.rollback()
+                return 0
+            self._apply(deltas)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(events)
+
+    def _ensure_checkpoint(self):
+        """首次运行时建立检查点，并用订单当前状态填充基线"""
+        if db.session.get(RollupCheckpoint, CHECKPOINT_NAME) is not None:
+            return
+        try:
+            # 先写入检查点取得写锁，保证基线与检查点对应同一时刻的数据
+            checkpoint = RollupCheckpoint(name=CHECKPOINT_NAME, last_event_id=0)
+            db.session.add(checkpoint)
+            db.session.flush()
+            checkpoint.last_event_id = db.session.query(func.max(OrderEvent.id)).scalar() or 0
+
+            deltas = self._new_deltas()
+            for model in (Order, OrderArchive):
+                rows = db.session.query(
+                    model.order_status, model.created_at, model.completed_at, model.cancelled_at,
+                    model.actual_amount, model.estimated_duration, model.origin_geohash
+                ).yield_per(1000)
+                for status, created_at, completed_at, cancelled_at, amount, duration, area in rows:
+                    if created_at:
+                        self._accumulate(deltas, 'create', created_at, amount, duration, area)
+                    if status == 'completed' and completed_at:
+                        self._accumulate(deltas, 'complete', completed_at, amount, duration, area)
+                    if status == 'cancelled' and cancelled_at:
+                        self._accumulate(deltas, 'cancel', cancelled_at, amount, duration, area)
+            self._apply(deltas)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # 其它进程可能同时建立了检查点
+            if db.session.get(RollupCheckpoint, CHECKPOINT_NAME) is None:
+                raise
+
+    @staticmethod
+    def _new_deltas():
+        return defaultdict(lambda: dict.fromkeys(METRIC_COLUMNS, 0))
+
+    def _accumulate(self, deltas, kind, moment, amount, duration, origin_geohash):
+        if kind not in ('create', 'complete', 'cancel') or moment is None:
+            return
+        area = (origin_geohash or '')[:self.area_precision]
+        amount, duration = _number(amount), _number(duration)
+        for granularity in GRANULARITIES:
+            delta = deltas[(granularity, truncate(moment, granularity), area)]
+            if kind == 'create':
+                delta['created_count'] += 1
+                delta['created_amount'] += amount or 0
+                if duration is not None:
+                    delta['duration_sum'] += duration
+                    delta['duration_count'] += 1
+            elif kind == 'complete':
+                delta['completed_count'] += 1
+                delta['completed_amount'] += amount or 0
+            else:
+                delta['cancelled_count'] += 1
+
+    @staticmethod
+    def _apply(deltas):
+        """把增量累加到统计行，不存在的行新建"""
+        if not deltas:
+            return
+        buckets = {bucket for _granularity, bucket, _area in deltas}
+        areas = {area for _granularity, _bucket, area in deltas}
+        existing = OrderRollup.query.filter(OrderRollup.bucket.in_(buckets), OrderRollup.area.in_(areas)).all()
+        rows = {(row.granularity, row.bucket, row.area): row for row in existing}
+        for key, delta in deltas.items():
+            row = rows.get(key)
+            if row is None:
+                granularity, bucket, area = key
+                row = OrderRollup(granularity=granularity, bucket=bucket, area=area,
+                                  **dict.fromkeys(METRIC_COLUMNS, 0))
+                db.session.add(row)
+            for column, value in delta.items():
+                setattr(row, column, getattr(row, column) + value)
+
+    # ---------- 查询 ----------
+
+    def query(self, granularity, start, end, area=None, by_area=False):
+        """读取 [start, end) 内的统计，area 为 geohash 前缀；by_area 为 False 时合并所有区域"""
+        group_columns = [OrderRollup.bucket] + ([OrderRollup.area] if by_area else [])
+        sums = [func.sum(getattr(OrderRollup, column)).label(column) for column in METRIC_COLUMNS]
+        query = db.session.query(*group_columns, *sums)\
+                          .filter(OrderRollup.granularity == granularity,
+                                  OrderRollup.bucket >= start,
+                                  OrderRollup.bucket < end)
+        if area:
+            query = query.filter(OrderRollup.area.like(f"{area}%"))
+        rows = query.group_by(*group_columns).order_by(*group_columns).all()
+
+        buckets = []
+        totals = dict.fromkeys(METRIC_COLUMNS, 0)
+        for row in rows:
+            values = {column: getattr(row, column) or 0 for column in METRIC_COLUMNS}
+            for column, value in values.items():
+                totals[column] += value
+            item = {'bucket': row.bucket.isoformat()}
+            if by_area:
+                item['area'] = row.area
+            item.update(self._describe(values))
+            buckets.append(item)
+        return {'buckets': buckets, 'totals': self._describe(totals)}
+
+    @staticmethod
+    def _describe(values):
+        """计算对外展示的指标"""
+        created = values['created_count']
+        return {
+            'orders': created,
+            'completed': values['completed_count'],
+            'cancelled': values['cancelled_count'],
+            'gmv': round(values['completed_amount'], 2),
+            'created_amount': round(values['created_amount'], 2),
+            'cancellation_rate': round(values['cancelled_count'] / created, 4) if created else None,
+            'avg_estimated_duration': round(values['duration_sum'] / values['duration_count'], 1)
+                                      if values['duration_count'] else None,
+        }
+
+    def stats(self):
+        return {'interval': self.interval, 'last_run': self.last_run}
+
+
+# 创建全局实例
+order_rollups = OrderRollupService()
+metrics.register('order_rollups', order_rollups.stats)
@@ -0,0 +1,165 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import delete, insert, update
+
+from models import db
+from models.order import Order, OrderArchive
+from models.order_event import OrderEvent
+from services.metrics import metrics
+from services.order_events import PENDING_KEY
+
+# 状态迁移表：事件 -> 允许的源状态、目标状态、需要写入的时间戳字段与各类错误提示
+TRANSITIONS = {
+    'assign': {
+        'from': 'pending', 'to': 'pending', 'timestamp': 'accepted_at',
+        'conflict': "订单已被接单或状态已变更",
+    },
+    'cancel': {
+        'from': 'pending', 'to': 'cancelled', 'timestamp': 'cancelled_at',
+        'forbidden': "无权取消该订单",
+        'conflict': "只有进行中(pending)的订单才能取消",
+    },
+    'complete': {
+        'from': 'pending', 'to': 'completed', 'timestamp': 'completed_at',
+        'forbidden': "无权操作该订单",
+        'conflict': "只有进行中的订单才能标记为已完成",
+    },
+    'delete': {
+        'from': 'cancelled', 'to': 'deleted',
+        'forbidden': "无权删除该订单",
+        'conflict': "只能删除已取消的订单",
+    },
+}
+
+# 事件快照中保存的订单字段，供变更订阅与统计使用
+SNAPSHOT_FIELDS = ('deliverer_id', 'actual_amount', 'estimated_duration', 'origin_geohash', 'created_at')
+
+
+class OrderTransitionError(Exception):
+    """状态迁移失败：订单不存在、无权限或状态/版本冲突"""
+
+    def __init__(self, message, status_code=409, current_status=None, current_version=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.current_status = current_status
+        self.current_version = current_version
+
+
+class OrderStateMachine:
+    """
+    订单状态机
+
+    每次迁移是一条带条件的 UPDATE/DELETE ... WHERE id=? AND order_status=? [AND version=?] RETURNING，
+    并发请求中只有一个能匹配成功，不再需要先 SELECT 再在 Python 中判断。
+    匹配 0 行时再查询一次定位原因（不存在 / 无权限 / 状态或版本冲突）。
+    每次成功迁移都在同一事务中追加一条 order_events 记录。
+    """
+
+    def transition(self, order_id, event, owner_id=None, actor_id=None, expected_version=None,
+                   values=None, commit=True):
+        """
+        执行状态迁移，返回迁移后的订单（delete 返回删除前的订单快照）
+
+        owner_id: 限定订单所属用户；expected_version: 客户端持有的版本号，不一致时视为冲突；
+        values: 随迁移一起写入的其它字段（如派单时的 deliverer_id）。
+        """
+        spec = TRANSITIONS[event]
+        now = datetime.utcnow()
+
+        # 已归档的订单只允许删除
+        for model in ((Order, OrderArchive) if event == 'delete' else (Order,)):
+            order = db.session.execute(
+                self._statement(model, order_id, event, owner_id, expected_version, values, now)
+                .returning(model)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            ).scalars().first()
+            if order is not None:
+                break
+            error = self._diagnose(model, order_id, event, owner_id, expected_version)
+            if error.status_code != 404:
+                break
+        if order is None:
+            metrics.incr(f'order_state.{event}.rejected')
+            raise error
+
+        record_events([self._event_row(order, event, spec['from'], spec['to'], actor_id, now)])
+        if commit:
+            db.session.commit()
+        metrics.incr(f'order_state.{event}')
+        return order
+
+    @staticmethod
+    def _statement(model, order_id, event, owner_id, expected_version, values, now):
+        """构建带条件的 UPDATE/DELETE 语句"""
+        spec = TRANSITIONS[event]
+        conditions = [model.id == order_id, model.order_status == spec['from']]
+        if owner_id is not None:
+            conditions.append(model.user_id == owner_id)
+        if expected_version is not None:
+            conditions.append(model.version == expected_version)
+        if event == 'assign':
+            conditions.append(model.deliverer_id.is_(None))
+
+        if event == 'delete':
+            return delete(model).where(*conditions)
+        changes = dict(values or {}, order_status=spec['to'], version=model.version + 1)
+        if spec.get('timestamp'):
+            changes[spec['timestamp']] = now
+        return update(model).where(*conditions).values(**changes)
+
+    def _diagnose(self, model, order_id, event, owner_id, expected_version):
+        """条件更新未命中时查明原因"""
+        spec = TRANSITIONS[event]
+        row = db.session.query(model.user_id, model.order_status, model.version, model.deliverer_id)\
+                        .filter(model.id == order_id).first()
+        if row is None:
+            return OrderTransitionError("订单不存在", 404)
+        user_id, status, version, deliverer_id = row
+        if owner_id is not None and user_id != owner_id:
+            return OrderTransitionError(spec.get('forbidden', "无权操作该订单"), 403, status)
+        if expected_version is not None and version != expected_version:
+            return OrderTransitionError(f"订单已被修改，当前版本: {version}", 409, status, version)
+        if status != spec['from'] or (event == 'assign' and deliverer_id is not None):
+            return OrderTransitionError(f"{spec['conflict']}, 当前状态: {status}", 409, status, version)
+        # 查询时条件已经满足，说明期间被其它请求改过，交由调用方重试
+        return OrderTransitionError("订单状态已变更，请重试", 409, status, version)
+
+    @staticmethod
+    def _event_row(order, event, from_status, to_status, actor_id, now):
+        snapshot = {}
+        for field in SNAPSHOT_FIELDS:
+            value = getattr(order, field)
+            snapshot[field] = value.isoformat() if isinstance(value, datetime) else value
+        return {
+            'order_id': order.id,
+            'user_id': order.user_id,
+            'actor_id': actor_id,
+            'event': event,
+            'from_status': from_status,
+            'to_status': to_status,
+            'version': order.version,
+            'payload': json.dumps(snapshot, ensure_ascii=False),
+            'created_at': now,
+        }
+
+
+def record_created(orders, actor_id=None):
+    """为新建订单追加 create 事件，需与订单写入在同一事务中"""
+    now = datetime.utcnow()
+    record_events([
+        OrderStateMachine._event_row(order, 'create', None, order.order_status, actor_id, now)
+        for order in orders
+    ])
+
+
+def record_events(rows):
+    """批量追加事件，提交后由事件中心推送给订阅者"""
+    if rows:
+        db.session.execute(insert(OrderEvent.__table__), rows)
+        db.session.info[PENDING_KEY] = True
+
+
+# 创建全局实例
+order_state = OrderStateMachine()
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class _TrieNode:
+    __slots__ = ('children', 'entry')
+
+    def __init__(self):
+        self.children = {}
+        self.entry = None  # (expires_at, results)
+
+
+class PlaceTipIndex:
+    """
+    地点输入提示的本地前缀索引
+
+    按城市维护一棵关键词前缀树，节点上保存该关键词的历史搜索结果。
+    用户继续输入时，若较短前缀的缓存结果中已有足够多的匹配项，直接过滤返回，
+    不再请求高德 inputtips 接口。
+    """
+
+    def __init__(self, ttl=None, max_entries=None, min_matches=None):
+        self.ttl = int(ttl or os.getenv('PLACE_TIP_TTL', str(24 * 3600)))
+        self.max_entries = int(max_entries or os.getenv('PLACE_TIP_MAX_ENTRIES', '5000'))
+        self.min_matches = int(min_matches or os.getenv('PLACE_TIP_MIN_MATCHES', '5'))
+
+        self._roots = {}  # city -> _TrieNode
+        self._order = OrderedDict()  # (city, keyword) -> _TrieNode，用于 LRU 淘汰
+        self._lock = threading.Lock()
+        self._stats = {'exact_hits': 0, 'prefix_hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def normalize(keyword):
+        return ' '.join(keyword.strip().lower().split())
+
+    def lookup(self, keyword, city, page_size=10):
+        """
+        查询本地索引，返回结果列表；无法从本地满足时返回 None
+        """
+        keyword = self.normalize(keyword)
+        if not keyword:
+            return None
+        now = time.time()
+        need = min(page_size, self.min_matches)
+
+        with self._lock:
+            node = self._roots.get(city)
+            candidates = []  # 沿路径收集的 (前缀长度, 节点)
+            depth = 0
+            while node is not None:
+                if node.entry is not None:
+                    candidates.append((depth, node))
+                if depth == len(keyword):
+                    break
+                node = node.children.get(keyword[depth])
+                depth += 1
+
+            for prefix_len, node in reversed(candidates):
+                expires_at, results = node.entry
+                if expires_at <= now:
+                    continue
+                self._order.move_to_end((city, keyword[:prefix_len]))
+                if prefix_len == len(keyword):
+                    self._stats['exact_hits'] += 1
+                    return results[:page_size]
+                matched = [item for item in results if self._matches(item, keyword)]
+                if len(matched) >= need:
+                    self._stats['prefix_hits'] += 1
+                    return matched[:page_size]
+
+            self._stats['misses'] += 1
+            return None
+
+    def store(self, keyword, city, results):
+        """保存一次高德搜索的完整结果"""
+        keyword = self.normalize(keyword)
+        if not keyword:
+            return
+
+        with self._lock:
+            node = self._roots.setdefault(city, _TrieNode())
+            for char in keyword:
+                node = node.children.setdefault(char, _TrieNode())
+            node.entry = (time.time() + self.ttl, list(results))
+
+            key = (city, keyword)
+            self._order[key] = node
+            self._order.move_to_end(key)
+            while len(self._order) > self.max_entries:
+                _key, evicted = self._order.popitem(last=False)
+                evicted.entry = None
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._roots.clear()
+            self._order.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._order)
+        lookups = stats['exact_hits'] + stats['prefix_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['exact_hits'] + stats['prefix_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def _matches(item, keyword):
+        """判断缓存的地点是否匹配更长的关键词"""
+        name = (item.get('name') or '').lower()
+        address = (item.get('address') or '').lower()
+        return all(part in name or part in address for part in keyword.split(' '))
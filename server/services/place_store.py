@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from models import db
+from models.place import Place
+
+
+class PlaceUsageBuffer:
+    """
+    本地地点命中后的使用次数先在内存中累加，按间隔批量写回
+
+    每次按键搜索都会命中本地表，逐次 UPDATE + COMMIT 会给 SQLite 带来大量写入；
+    使用次数只用于排序，进程退出时丢失少量计数可以接受。
+    """
+
+    def __init__(self):
+        self.flush_interval = float(os.getenv('PLACE_USAGE_FLUSH_INTERVAL', '30'))  # 写回间隔(秒)，0 表示每次写回
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._last_used_at = None
+        self._last_flush = time.monotonic()
+
+    def add(self, place_ids):
+        with self._lock:
+            self._counts.update(place_ids)
+            self._last_used_at = datetime.utcnow()
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            try:
+                self.flush()
+            except Exception as e:
+                current_app.logger.warning(f"写回地点使用次数失败: {str(e)}")
+
+    def flush(self):
+        """写回累计的使用次数，返回涉及的地点数"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            last_used_at = self._last_used_at
+            self._last_flush = time.monotonic()
+        if not counts:
+            return 0
+        
+        # 增量相同的地点合并为一条 UPDATE
+        ids_by_count = defaultdict(list)
+        for place_id, count in counts.items():
+            ids_by_count[count].append(place_id)
+        try:
+            for count, ids in ids_by_count.items():
+                Place.query.filter(Place.id.in_(ids))\
+                           .update({'usage_count': Place.usage_count + count, 'last_used_at': last_used_at},
+                                   synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # 保留计数，下次写回时重试
+            with self._lock:
+                self._counts.update(counts)
+            raise
+        return len(counts)
+
+
+# 创建全局实例
+place_usage = PlaceUsageBuffer()
+
+
+def _like_pattern(keyword):
+    """转义 LIKE 通配符，用户输入的 % 和 _ 按字面匹配"""
+    escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def lookup_places(keyword, city, limit=10):
+    """
+    从本地地点表中查找匹配关键词的地点，按使用次数排序；
+    命中数量不足 PLACE_LOCAL_MIN_RESULTS 时返回 None，交给高德查询
+    """
+    keyword = keyword.strip()
+    if not keyword:
+        return None
+    min_results = min(limit, int(os.getenv('PLACE_LOCAL_MIN_RESULTS', '5')))
+    
+    try:
+        pattern = _like_pattern(keyword)
+        places = Place.query.filter(Place.city == city)\
+                            .filter(or_(Place.name.like(pattern, escape='\\'),
+                                        Place.address.like(pattern, escape='\\')))\
+                            .order_by(Place.usage_count.desc())\
+                            .limit(limit)\
+                            .all()
+        if len(places) < min_results:
+            return None
+        
+        results = [place.to_search_result() for place in places]
+        place_usage.add(place.id for place in places)
+        return results
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"本地地点查询失败: {str(e)}")
+        return None
+
+
+def record_places(city, results):
+    """将高德返回的地点写入本地地点表，已存在的地点累加使用次数"""
+    if not results:
+        return
+    
+    try:
+        names = {item['name'] for item in results if item.get('name')}
+        existing = {
+            (place.name, round(place.lat, 6), round(place.lng, 6)): place
+            for place in Place.query.filter(Place.city == city, Place.name.in_(names)).all()
+        }
+        now = datetime.utcnow()
+        
+        for item in results:
+            if not item.get('name'):
+                continue
+            lat, lng = item['location']['lat'], item['location']['lng']
+            key = (item['name'], round(lat, 6), round(lng, 6))
+            place = existing.get(key)
+            if place is None:
+                place = Place(
+                    city=city,
+                    name=item['name'],
+                    address=item.get('address') if isinstance(item.get('address'), str) else '',
+                    lat=lat,
+                    lng=lng,
+                    adcode=item.get('adcode') if isinstance(item.get('adcode'), str) else None,
+                    citycode=item.get('citycode') if isinstance(item.get('citycode'), str) else None,
+                    usage_count=0
+                )
+                db.session.add(place)
+                existing[key] = place
+            place.usage_count = (place.usage_count or 0) + 1
+            place.last_used_at = now
+        
+        db.session.commit()
+    except IntegrityError:
+        # 其他进程同时写入了相同地点，忽略本次记录
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"记录地点失败: {str(e)}")
@@ -0,0 +1,124 @@
+import math
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def parse_route_points(route_info):
+    """
+    从高德 path 对象（或离线路网结果）中提取路线坐标点 [(lat, lng)]
+
+    每个 step 的 polyline 形如 "lng,lat;lng,lat"，相邻 step 首尾重复的点只保留一个。
+    """
+    points = []
+    for step in (route_info or {}).get('steps', []) or []:
+        polyline = step.get('polyline') if isinstance(step, dict) else None
+        if not polyline or not isinstance(polyline, str):
+            continue
+        for pair in polyline.split(';'):
+            try:
+                lng, lat = pair.split(',')
+                point = (float(lat), float(lng))
+            except ValueError:
+                continue
+            if not points or points[-1] != point:
+                points.append(point)
+    return points
+
+
+def simplify(points, tolerance_m):
+    """Douglas–Peucker 折线简化，tolerance_m 为允许的最大偏离(米)"""
+    if tolerance_m <= 0 or len(points) < 3:
+        return list(points)
+
+    # 在局部等距投影平面上计算（校园尺度下误差可忽略）
+    lat0 = math.radians(sum(lat for lat, _ in points) / len(points))
+    scale = math.pi / 180 * EARTH_RADIUS_M
+    projected = [(lng * scale * math.cos(lat0), lat * scale) for lat, lng in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        max_distance, index = 0.0, None
+        for i in range(start + 1, end):
+            distance = _segment_distance(projected[i], projected[start], projected[end])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance_m:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def encode(points, precision=5):
+    """Google Encoded Polyline 编码，points 为 [(lat, lng)]"""
+    factor = 10 ** precision
+    result = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat_i, lng_i = int(round(lat * factor)), int(round(lng * factor))
+        result.append(_encode_value(lat_i - prev_lat))
+        result.append(_encode_value(lng_i - prev_lng))
+        prev_lat, prev_lng = lat_i, lng_i
+    return ''.join(result)
+
+
+def decode(encoded, precision=5):
+    """解码 Google Encoded Polyline，返回 [(lat, lng)]"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        values = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += values[0]
+        lng += values[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+
+def compact_route_info(route_info, tolerance_m=5.0, precision=5):
+    """将完整的路线信息压缩为单条编码折线，去掉逐段导航等冗余字段"""
+    points = parse_route_points(route_info)
+    simplified = simplify(points, tolerance_m)
+    return {
+        'polyline': encode(simplified, precision),
+        'precision': precision,
+        'points': len(simplified),
+        'original_points': len(points),
+        'distance': (route_info or {}).get('distance'),
+        'duration': (route_info or {}).get('duration'),
+    }
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def _segment_distance(point, start, end):
+    """点到线段的距离（平面坐标）"""
+    px, py = point
+    ax, ay = start
+    bx, by = end
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
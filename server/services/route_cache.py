@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'route_cache.db')
+
+
+class RouteCache:
+    """
+    路线规划结果的两级缓存：进程内 LRU + SQLite 持久化
+
+    起终点坐标会先按网格吸附（默认约 50 米），校园内同一宿舍楼/食堂/快递柜
+    附近的请求会命中同一条缓存。
+    """
+
+    def __init__(self, db_path=None, grid=None, ttl=None, max_entries=None):
+        self.db_path = db_path or os.getenv('ROUTE_CACHE_DB') or DEFAULT_CACHE_DB
+        self.grid = float(grid or os.getenv('ROUTE_CACHE_GRID', '0.0005'))  # 网格大小(度)
+        self.ttl = int(ttl or os.getenv('ROUTE_CACHE_TTL', str(7 * 24 * 3600)))  # 默认有效期(秒)
+        self.max_entries = int(max_entries or os.getenv('ROUTE_CACHE_MAX_ENTRIES', '2048'))
+
+        self._memory = OrderedDict()  # key -> (expires_at, data)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+        self._disk_enabled = self._init_db()
+
+    # ---------- 持久化层 ----------
+
+    def _init_db(self):
+        """初始化 SQLite 缓存表，失败时仅使用内存缓存"""
+        try:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+
+            conn = self._connection()
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS route_cache ('
+                ' cache_key TEXT PRIMARY KEY,'
+                ' data TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_route_cache_expires_at ON route_cache (expires_at)')
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"警告：路线缓存数据库初始化失败，仅使用内存缓存: {e}")
+            return False
+
+    def _connection(self):
+        """每个线程复用一个 SQLite 连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key, now):
+        if not self._disk_enabled:
+            return None
+        try:
+            row = self._connection().execute(
+                'SELECT data, expires_at FROM route_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+
+        if not row:
+            return None
+        data, expires_at = row
+        if expires_at <= now:
+            self._disk_delete(key)
+            return None
+        return expires_at, json.loads(data)
+
+    def _disk_set(self, key, data, expires_at, now):
+        if not self._disk_enabled:
+            return
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO route_cache (cache_key, data, expires_at, created_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(data, ensure_ascii=False), expires_at, now)
+            )
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def _disk_delete(self, key=None):
+        if not self._disk_enabled:
+            return
+        try:
+            conn = self._connection()
+            if key is None:
+                conn.execute('DELETE FROM route_cache')
+            else:
+                conn.execute('DELETE FROM route_cache WHERE cache_key = ?', (key,))
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    # ---------- 对外接口 ----------
+
+    def make_key(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """将起终点吸附到网格后生成缓存键"""
+        cells = [round(float(value) / self.grid) for value in (origin_lat, origin_lng, dest_lat, dest_lng)]
+        return f"{self.grid}|" + '|'.join(str(cell) for cell in cells)
+
+    def get(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """查询缓存，先查内存再查 SQLite，未命中返回 None"""
+        key = self.make_key(origin_lat, origin_lng, dest_lat, dest_lng)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return dict(data)
+                del self._memory[key]
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._memory_put(key, entry)
+        return dict(entry[1])
+
+    def set(self, origin_lat, origin_lng, dest_lat, dest_lng, data, ttl=None):
+        """写入缓存，ttl 为该条目的有效期(秒)"""
+        key = self.make_key(origin_lat, origin_lng, dest_lat, dest_lng)
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._memory_put(key, (expires_at, data))
+            self._stats['sets'] += 1
+        self._disk_set(key, data, expires_at, now)
+
+    def invalidate(self, origin_lat, origin_lng, dest_lat, dest_lng):
+        """使某一对起终点的缓存失效"""
+        key = self.make_key(origin_lat, origin_lng, dest_lat, dest_lng)
+        with self._lock:
+            self._memory.pop(key, None)
+            self._stats['invalidations'] += 1
+        self._disk_delete(key)
+
+    def invalidate_all(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._stats['invalidations'] += 1
+        self._disk_delete()
+
+    def purge_expired(self):
+        """清理已过期的持久化条目，返回删除的条数"""
+        if not self._disk_enabled:
+            return 0
+        try:
+            conn = self._connection()
+            cursor = conn.execute('DELETE FROM route_cache WHERE expires_at <= ?', (time.time(),))
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error:
+            return 0
+
+    def stats(self):
+        """命中率等统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_size'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['grid'] = self.grid
+        stats['ttl'] = self.ttl
+        stats['max_entries'] = self.max_entries
+        stats['persistent'] = self._disk_enabled
+        return stats
+
+    def _memory_put(self, key, entry):
+        """写入内存 LRU，调用方需持有锁"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
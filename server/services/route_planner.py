@@ -0,0 +1,186 @@
+import os
+
+import numpy as np
+
+from models.order import Order
+from services.geo import CYCLING_SPEED_KMH, distance_matrix_km, estimate_cycling_distance_km
+from services.map_service import map_service
+
+MAX_IMPROVE_ROUNDS = int(os.getenv('PLANNER_MAX_IMPROVE_ROUNDS', '50'))
+
+
+class MultiStopPlan:
+    """
+    单个配送员的多单取送顺序规划
+
+    停靠点为每个订单的取件点(起点)与送达点(终点)，要求取件在送达之前。
+    先用最近插入法构造初始路线，再用 2-opt 与 Or-opt 局部优化，目标为总骑行时间最短。
+    """
+
+    def __init__(self, stops, durations, distances, start_index=None):
+        self.stops = stops  # [{'order_id', 'type', 'lat', 'lng', ...}]
+        self.durations = durations  # 节点间骑行时间矩阵(分钟)，最后一个节点可能为起点
+        self.distances = distances
+        self.start_index = start_index
+        self._pair = {}  # 停靠点 -> 对应的取件/送达点
+        for index, stop in enumerate(stops):
+            for other, candidate in enumerate(stops):
+                if candidate['order_id'] == stop['order_id'] and other != index:
+                    self._pair[index] = other
+
+    # ---------- 代价与可行性 ----------
+
+    def cost(self, route):
+        total = 0.0
+        previous = self.start_index
+        for node in route:
+            if previous is not None:
+                total += self.durations[previous][node]
+            previous = node
+        return total
+
+    def feasible(self, route):
+        position = {node: index for index, node in enumerate(route)}
+        return all(
+            position[node] < position[self._pair[node]]
+            for node in route
+            if self.stops[node]['type'] == 'pickup'
+        )
+
+    # ---------- 构造与优化 ----------
+
+    def solve(self):
+        pickups = [index for index, stop in enumerate(self.stops) if stop['type'] == 'pickup']
+        route = self._nearest_insertion(pickups)
+        route = self._improve(route)
+        return route
+
+    def _nearest_insertion(self, pickups):
+        route = []
+        remaining = set(pickups)
+        while remaining:
+            # 选取距离当前路线（或起点）最近的取件点
+            anchors = route + ([self.start_index] if self.start_index is not None else [])
+            if anchors:
+                pickup = min(remaining, key=lambda p: min(self.durations[a][p] for a in anchors))
+            else:
+                pickup = min(remaining)
+            remaining.discard(pickup)
+            dropoff = self._pair[pickup]
+
+            best_route, best_cost = None, None
+            for i in range(len(route) + 1):
+                with_pickup = route[:i] + [pickup] + route[i:]
+                for j in range(i + 1, len(with_pickup) + 1):
+                    candidate = with_pickup[:j] + [dropoff] + with_pickup[j:]
+                    candidate_cost = self.cost(candidate)
+                    if best_cost is None or candidate_cost < best_cost:
+                        best_route, best_cost = candidate, candidate_cost
+            route = best_route
+        return route
+
+    def _improve(self, route):
+        best_cost = self.cost(route)
+        for _ in range(MAX_IMPROVE_ROUNDS):
+            improved = False
+            for candidate in self._two_opt_moves(route):
+                candidate_cost = self.cost(candidate)
+                if candidate_cost < best_cost - 1e-9 and self.feasible(candidate):
+                    route, best_cost, improved = candidate, candidate_cost, True
+                    break
+            if not improved:
+                for candidate in self._or_opt_moves(route):
+                    candidate_cost = self.cost(candidate)
+                    if candidate_cost < best_cost - 1e-9 and self.feasible(candidate):
+                        route, best_cost, improved = candidate, candidate_cost, True
+                        break
+            if not improved:
+                break
+        return route
+
+    @staticmethod
+    def _two_opt_moves(route):
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                yield route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+
+    @staticmethod
+    def _or_opt_moves(route):
+        for length in (1, 2, 3):
+            for i in range(len(route) - length + 1):
+                segment = route[i:i + length]
+                rest = route[:i] + route[i + length:]
+                for j in range(len(rest) + 1):
+                    if j == i:
+                        continue
+                    yield rest[:j] + segment + rest[j:]
+
+
+def plan_deliverer_route(deliverer, exact=False):
+    """
+    规划配送员当前承接订单的取送顺序，返回有序停靠点与总预计时间
+
+    exact=True 时使用 MapService.route_matrix（走路线缓存）获取真实骑行时间，
+    否则用球面距离快速估算；停靠点过多（矩阵超过 ROUTE_MATRIX_MAX_CELLS）时也使用估算。
+    """
+    orders = Order.query.filter(Order.deliverer_id == deliverer.id, Order.order_status == 'pending')\
+                        .order_by(Order.accepted_at).all()
+
+    stops, skipped = [], []
+    for order in orders:
+        if None in (order.origin_lat, order.origin_lng, order.dest_lat, order.dest_lng):
+            skipped.append(order.id)
+            continue
+        stops.append({'order_id': order.id, 'type': 'pickup', 'lat': order.origin_lat, 'lng': order.origin_lng,
+                      'address': order.start_address})
+        stops.append({'order_id': order.id, 'type': 'dropoff', 'lat': order.dest_lat, 'lng': order.dest_lng,
+                      'address': order.end_address})
+
+    points = [(stop['lat'], stop['lng']) for stop in stops]
+    start_index = None
+    if deliverer.current_lat is not None and deliverer.current_lng is not None:
+        points.append((deliverer.current_lat, deliverer.current_lng))
+        start_index = len(points) - 1
+    exact = exact and len(points) ** 2 <= map_service.matrix_max_cells
+
+    result = {'deliverer_id': deliverer.id, 'stops': [], 'total_eta': 0, 'total_distance': 0.0,
+              'skipped_orders': skipped, 'source': 'route' if exact else 'estimate'}
+    if not stops:
+        return result
+
+    durations, distances = _travel_matrix(points, exact)
+    plan = MultiStopPlan(stops, durations, distances, start_index)
+    route = plan.solve()
+
+    elapsed = distance = 0.0
+    previous = start_index
+    for node in route:
+        leg_minutes = durations[previous][node] if previous is not None else 0.0
+        elapsed += leg_minutes
+        distance += distances[previous][node] if previous is not None else 0.0
+        result['stops'].append(dict(stops[node], leg_minutes=round(leg_minutes, 1), eta=round(elapsed, 1)))
+        previous = node
+
+    result['total_eta'] = round(elapsed)
+    result['total_distance'] = round(distance, 2)
+    return result
+
+
+def _travel_matrix(points, exact):
+    """返回 (时间矩阵 分钟, 距离矩阵 公里)，精确模式下失败的点对退回估算"""
+    straight = distance_matrix_km(points, points)
+    distances = estimate_cycling_distance_km(straight)
+    durations = distances / CYCLING_SPEED_KMH * 60
+
+    if exact:
+        coords = [{'lat': lat, 'lng': lng} for lat, lng in points]
+        matrix = map_service.route_matrix(coords, coords)
+        for i, row in enumerate(matrix['durations']):
+            for j, value in enumerate(row):
+                if value is not None and matrix['distances'][i][j] is not None:
+                    durations[i, j] = value
+                    distances[i, j] = matrix['distances'][i][j]
+
+    np.fill_diagonal(durations, 0)
+    np.fill_diagonal(distances, 0)
+    return durations.tolist(), distances.tolist()
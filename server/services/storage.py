@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.blob import Blob
+from services.metrics import metrics
+from utils.uploads import upload_folder
+
+# 内容寻址文件名：<sha256>.<扩展名>，派生图为 <sha256>_<变体>_<参数摘要>.<扩展名>
+HASHED_NAME = re.compile(r'^([0-9a-f]{64})(?:_[0-9a-z]+){0,2}\.[0-9a-z]+$')
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}\.[0-9a-z]+$')
+CHUNK_SIZE = 64 * 1024
+
+
+def is_content_addressed(name):
+    """文件名是否由内容哈希生成（内容不会变化）"""
+    return HASHED_NAME.match(name) is not None
+
+
+def blob_name(value):
+    """从订单图片、头像等字段值（文件名或 /static/uploads/ 路径）中取出 blob 名，不是 blob 时返回 None"""
+    if not value:
+        return None
+    name = value.split('?', 1)[0].rsplit('/', 1)[-1]
+    return name if BLOB_NAME.match(name) else None
+
+
+class StorageBackend(ABC):
+    """上传文件存储接口，name 为对外使用的文件名"""
+
+    @abstractmethod
+    def save(self, stream, ext):
+        """保存文件流，返回文件名"""
+
+    @abstractmethod
+    def path(self, name):
+        """本地文件路径（OCR、生成缩略图、发送文件时使用）"""
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    @abstractmethod
+    def delete(self, name):
+        """删除文件"""
+
+    @abstractmethod
+    def detach(self, name):
+        """把文件移出对外路径（upload_gc 回收时使用），返回移动后的路径"""
+
+    @abstractmethod
+    def restore(self, name, detached):
+        """放回 detach 移出的文件"""
+
+
+class LocalHashedStorage(StorageBackend):
+    """
+    本地内容寻址存储
+
+    文件以内容 SHA-256 命名，保存在 ab/cd/ 两级子目录中，相同内容只保存一份；
+    每次保存都会在 blobs 中登记或刷新上传时间，由 upload_gc 按引用回收。
+    此前平铺在上传目录中的 UUID 文件名仍按原路径读取。
+    """
+
+    def path(self, name):
+        match = HASHED_NAME.match(name)
+        if match is None:
+            return os.path.join(upload_folder(), name)
+        digest = match.group(1)
+        return os.path.join(upload_folder(), digest[:2], digest[2:4], name)
+
+    def save(self, stream, ext):
+        ext = ext.lower().lstrip('.')
+        temp_dir = os.path.join(upload_folder(), '.tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as fp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    fp.write(chunk)
+                    size += len(chunk)
+            name = f"{digest.hexdigest()}.{ext}"
+
+            # 先登记（刷新上传时间），回收任务不会删除宽限期内上传过的文件
+            self._register(name, size)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temp_path)
+                metrics.incr('storage.deduplicated')
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+                metrics.incr('storage.saved')
+            return name
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _register(name, size):
+        now = datetime.utcnow()
+        for _attempt in range(2):
+            touched = db.session.execute(
+                update(Blob).where(Blob.name == name).values(uploaded_at=now)
+            ).rowcount
+            if not touched:
+                db.session.add(Blob(name=name, size=size, created_at=now, uploaded_at=now))
+            try:
+                db.session.commit()
+                return
+            except IntegrityError:
+                # 并发上传了相同内容，改为刷新上传时间
+                db.session.rollback()
+        raise RuntimeError(f"登记上传文件失败: {name}")
+
+    def delete(self, name):
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def detach(self, name):
+        """把文件移出对外路径，返回移动后的路径（文件不存在时返回 None），之后由调用方 restore 或删除"""
+        path = self.path(name)
+        detached = f"{path}.deleting"
+        try:
+            os.replace(path, detached)
+        except FileNotFoundError:
+            return None
+        return detached
+
+    def restore(self, name, detached):
+        """放回 detach 移出的文件"""
+        os.replace(detached, self.path(name))
+
+
+# 创建全局实例
+storage = LocalHashedStorage()
@@ -0,0 +1,146 @@
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, update
+
+from models import db
+from models.analysis_job import AnalysisJob
+from models.blob import Blob
+from models.order import Order, OrderArchive
+from models.user import User
+from services.image_pipeline import image_pipeline
+from services.metrics import metrics
+from services.storage import blob_name, storage
+
+
+class UploadCollector:
+    """
+    上传文件的标记-清除回收
+
+    标记：扫描订单（含归档表）图片、用户头像和未结束识别任务引用的文件，重算 blobs.ref_count；
+    清除：删除无引用且超过宽限期的 blob 及其派生图，例如上传后未下单的订单图片、被替换的旧头像。
+    宽限期同时从最近一次上传和首次发现无引用起算，删除前在同一事务中再次确认没有引用。
+    """
+
+    def __init__(self):
+        self.grace_hours = float(os.getenv('UPLOAD_GC_GRACE_HOURS', '24'))  # 无引用文件的保留时间(小时)
+        self.batch_size = int(os.getenv('UPLOAD_GC_BATCH_SIZE', '500'))  # 每次运行最多删除的文件数
+        self.interval = float(os.getenv('UPLOAD_GC_INTERVAL', '0'))  # 自动回收间隔(秒)，0 表示关闭
+        self.last_run = None
+
+    def run(self, grace_hours=None):
+        """执行一次标记与清除，返回本次摘要"""
+        started = time.monotonic()
+        grace_hours = self.grace_hours if grace_hours is None else grace_hours
+        now = datetime.utcnow()
+        cutoff = now - timedelta(hours=grace_hours)
+
+        references = self._mark()
+        updated = self._update_counts(references, now)
+        removed = self._sweep(cutoff)
+
+        summary = {
+            'blobs_referenced': len(references),
+            'counts_updated': updated,
+            'removed': removed,
+            'cutoff': cutoff.isoformat(),
+            'duration_ms': round((time.monotonic() - started) * 1000, 2),
+        }
+        self.last_run = summary
+        metrics.incr('upload_gc.removed', removed)
+        metrics.observe('upload_gc.run_ms', summary['duration_ms'])
+        return summary
+
+    @staticmethod
+    def _reference_columns():
+        return [
+            (Order.order_image, None),
+            (OrderArchive.order_image, None),
+            (User.avatar, None),
+            (AnalysisJob.filename, AnalysisJob.status.in_(('queued', 'running'))),
+        ]
+
+    def _mark(self):
+        """统计每个 blob 的引用数"""
+        references = Counter()
+        for column, condition in self._reference_columns():
+            query = db.session.query(column).filter(column.isnot(None))
+            if condition is not None:
+                query = query.filter(condition)
+            for (value,) in query.yield_per(1000):
+                name = blob_name(value)
+                if name:
+                    references[name] += 1
+        return references
+
+    @staticmethod
+    def _update_counts(references, now):
+        changes = []
+        for name, ref_count, unreferenced_since in db.session.query(
+                Blob.name, Blob.ref_count, Blob.unreferenced_since).yield_per(1000):
+            count = references.get(name, 0)
+            if count:
+                if count != ref_count or unreferenced_since is not None:
+                    changes.append({'name': name, 'ref_count': count, 'unreferenced_since': None})
+            elif ref_count or unreferenced_since is None:
+                changes.append({'name': name, 'ref_count': 0, 'unreferenced_since': now})
+        if changes:
+            db.session.execute(update(Blob), changes)
+            db.session.commit()
+        return len(changes)
+
+    def _sweep(self, cutoff):
+        names = [name for (name,) in db.session.query(Blob.name)
+                 .filter(Blob.ref_count == 0, Blob.uploaded_at < cutoff, Blob.unreferenced_since < cutoff)
+                 .limit(self.batch_size)]
+        removed = 0
+        for name in names:
+            try:
+                # 先删除记录取得写锁，再确认标记之后没有新的引用
+                deleted = db.session.execute(
+                    delete(Blob).where(Blob.name == name, Blob.ref_count == 0, Blob.uploaded_at < cutoff)
+                ).rowcount
+                if not deleted or self._is_referenced(name):
+                    db.session.rollback()
+                    continue
+                db.session.commit()
+                # 上传先登记再检查文件是否存在：先把文件移走再确认没有重新登记，
+                # 重新上传的请求要么看到文件已移走而重新写入，要么已登记、在这里把文件放回
+                detached = storage.detach(name)
+                if db.session.query(Blob.name).filter(Blob.name == name).first() is not None:
+                    if detached is not None:
+                        storage.restore(name, detached)
+                    db.session.rollback()
+                    continue
+                image_pipeline.remove(name)
+                db.session.commit()
+                if detached is not None:
+                    os.remove(detached)
+                removed += 1
+            except Exception:
+                db.session.rollback()
+                raise
+        return removed
+
+    def _is_referenced(self, name):
+        for column, condition in self._reference_columns():
+            query = db.session.query(column).filter(or_(column == name, column.like(f"%/{name}")))
+            if condition is not None:
+                query = query.filter(condition)
+            if query.first() is not None:
+                return True
+        return False
+
+    def stats(self):
+        return {
+            'grace_hours': self.grace_hours,
+            'interval': self.interval,
+            'last_run': self.last_run,
+        }
+
+
+# 创建全局实例
+upload_collector = UploadCollector()
+metrics.register('upload_gc', upload_collector.stats)
@@ -1,5 +1,6 @@
 import requests
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -62,6 +63,903 @@ def test_route_parsing():
         print(f"❌ API请求失败: errcode={data.get('errcode')}, errmsg={data.get('errmsg')}")
         return {'success': False, 'message': f"API请求失败: {data.get('errmsg')}"}
 
+
+# ---------- 接口行为测试：Flask 测试客户端 + 临时数据库，不访问外部服务 ----------
+
+_test_env = {}
+
+
+def _test_app():
+    """创建使用临时数据库与上传目录的应用（整个模块共用一个）"""
+    if 'app' not in _test_env:
+        tmp_dir = tempfile.mkdtemp(prefix='zjulast1km-test-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'test.db')
+        os.environ['ROUTE_CACHE_DB'] = os.path.join(tmp_dir, 'route_cache.db')
+        os.environ.setdefault('AMAP_KEY', 'test-key')
+        from app import create_app
+        app = create_app()
+        app.config.update(TESTING=True, UPLOAD_FOLDER=os.path.join(tmp_dir, 'uploads'))
+        _test_env['app'] = app
+    return _test_env['app']
+
+
+def _auth_headers(username, is_admin=False):
+    """创建（或更新）测试用户，返回带 token 的请求头"""
+    from flask_jwt_extended import create_access_token
+    from models import db
+    from models.user import User
+
+    with _test_app().app_context():
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            user = User(username=username, nickname=username)
+            user.set_password('123456')
+            db.session.add(user)
+        user.is_admin = is_admin
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_route_cache_full_flush_requires_admin():
+    """不带起终点的清除请求不会清空全部缓存；scope=all 仅管理员可用"""
+    client = _test_app().test_client()
+    user = _auth_headers('cache-user')
+    admin = _auth_headers('cache-admin', is_admin=True)
+
+    assert client.delete('/api/map/route-cache', headers=user).status_code == 400
+    assert client.delete('/api/map/route-cache', headers=user, json={'scope': 'all'}).status_code == 403
+    assert client.delete('/api/map/route-cache', headers=admin, json={'scope': 'all'}).status_code == 200
+
+
+def test_ocr_client_read_timeout(monkeypatch):
+    """OCR 客户端同时设置连接超时与读超时，不使用 SDK 默认的 60 秒"""
+    from services.ai_service import AIService
+    from services.http_client import http_client
+
+    for name in ('BAIDU_AI_APP_ID', 'BAIDU_AI_API_KEY', 'BAIDU_AI_SECRET_KEY'):
+        monkeypatch.setenv(name, 'test')
+    monkeypatch.setenv('AI_OCR_READ_TIMEOUT', '7.5')
+    client = AIService().client
+    assert client._AipBase__connectTimeout == http_client.connect_timeout
+    assert client._AipBase__socketTimeout == 7.5
+
+
+def test_http_client_retries_only_connect_errors(monkeypatch):
+    """连接错误重试；读取超时与连接池排队超时不重试；总耗时受 deadline 限制"""
+    import pytest
+    import requests
+    from services.http_client import HttpClient, PoolExhausted
+
+    client = HttpClient()
+    client.max_retries, client.backoff_base = 2, 0.001
+    calls = []
+
+    def failing(error):
+        def get(url, params=None, timeout=None, **kwargs):
+            calls.append(timeout)
+            raise error
+        return get
+
+    for error, expected_calls in ((requests.exceptions.ConnectionError('refused'), 3),
+                                  (requests.exceptions.ReadTimeout('slow'), 1),
+                                  (PoolExhausted('full'), 1)):
+        calls.clear()
+        monkeypatch.setattr(client.session, 'get', failing(error))
+        with pytest.raises(type(error)):
+            client.get('http://example.invalid/')
+        assert len(calls) == expected_calls
+
+    # 剩余时间不足时不再退避重试，每次尝试的读取超时不超过剩余时间
+    calls.clear()
+    monkeypatch.setattr(client, '_backoff', lambda attempt: 5)
+    monkeypatch.setattr(client.session, 'get', failing(requests.exceptions.ConnectionError('refused')))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('http://example.invalid/', deadline=1)
+    assert len(calls) == 1 and calls[0][1] <= 1
+
+
+def test_campus_router_snaps_across_grid_cells(tmp_path):
+    """经度方向相隔两个网格、但在吸附距离内的节点也能找到，并按路网规划路线"""
+    import json
+    from services.campus_router import CampusRouter
+
+    graph = tmp_path / 'campus.geojson'
+    graph.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {},
+         'geometry': {'type': 'LineString', 'coordinates': [[120.08201, 30.30], [120.086, 30.30], [120.09, 30.30]]}},
+    ]}), encoding='utf-8')
+    router = CampusRouter(graph_path=str(graph))
+    assert router.available
+
+    # 查询点与最近节点约 194 米，位于经度方向相隔两格的网格中
+    node, distance = router.nearest_node(30.30, 120.07999)
+    assert node == 0 and 190 < distance < router.max_snap_m
+    assert router.nearest_node(30.30, 120.0770) == (None, None)
+
+    route = router.calculate_route(30.30, 120.07999, 30.30, 120.09)
+    assert route['data']['route_info']['source'] == 'campus'
+    assert 0.9 < route['data']['distance'] < 1.0
+    assert router.calculate_route(30.40, 120.08, 30.30, 120.09) is None
+
+
+def test_route_hedge_caps_outstanding_requests(monkeypatch):
+    """对冲请求带单次时限；对冲线程全部占用时不再提交，在当前线程顺序请求并计数"""
+    import threading
+    import time
+    from services.map_service import map_service
+    from services.metrics import metrics
+
+    release = threading.Event()
+    calls = []
+
+    def bicycling(*args, deadline=None):
+        calls.append(('bicycling', deadline, threading.current_thread().name))
+        release.wait(5)
+        return {'success': True, 'data': {'mode': '骑行'}}
+
+    def walking(*args, deadline=None):
+        calls.append(('walking', deadline, threading.current_thread().name))
+        return {'success': True, 'data': {'mode': '估算骑行'}}
+
+    monkeypatch.setattr(map_service, 'hedge_mode', 'delay')
+    monkeypatch.setattr(map_service, 'hedge_delay', 0.01)
+    monkeypatch.setattr(map_service, 'hedge_workers', 1)
+    monkeypatch.setattr(map_service, '_request_bicycling_route', bicycling)
+    monkeypatch.setattr(map_service, '_calculate_walking_route_fallback', walking)
+
+    skipped = metrics.snapshot()['counters'].get('route.hedge.skipped', 0)
+    with _test_app().app_context():
+        # 唯一的对冲线程被骑行请求占用：不发出步行对冲，等待骑行结果
+        waiter = threading.Timer(0.2, release.set)
+        waiter.start()
+        assert map_service._calculate_bicycling_route(30.3, 120.08, 30.31, 120.09)['data']['mode'] == '骑行'
+        assert calls == [('bicycling', map_service.hedge_attempt_timeout, calls[0][2])]
+        assert calls[0][2].startswith('route-hedge')
+
+        # 对冲线程已满：骑行也在当前线程请求，不带对冲时限
+        calls.clear()
+        release.set()
+        deadline = time.monotonic() + 2
+        while map_service.hedge_stats()['outstanding'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        monkeypatch.setattr(map_service, '_hedge_outstanding', 1)
+        map_service._calculate_bicycling_route(30.3, 120.08, 30.31, 120.09)
+        assert calls == [('bicycling', None, threading.current_thread().name)]
+    assert metrics.snapshot()['counters']['route.hedge.skipped'] == skipped + 2
+
+
+def test_single_flight_stats_hide_keys():
+    """合并请求的统计只输出数量，不输出含搜索词、坐标的 key；运行指标仅管理员可见"""
+    import json
+    import threading
+    from services.single_flight import SingleFlight
+
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'ok'
+
+    key = ('紫金港西区', 30.3, 120.08)
+    threads = [threading.Thread(target=flight.do, args=(key, slow))]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=flight.do, args=(key, slow)))
+    threads[1].start()
+    for _ in range(100):
+        if flight.stats()['waiters']:
+            break
+        threading.Event().wait(0.01)
+    stats = flight.stats()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert stats['in_flight'] == 1 and stats['waiters'] == 1
+    assert '紫金港' not in json.dumps(stats, ensure_ascii=False)
+
+    client = _test_app().test_client()
+    assert client.get('/api/metrics/', headers=_auth_headers('metrics-user')).status_code == 403
+    assert client.get('/api/metrics/', headers=_auth_headers('metrics-admin', is_admin=True)).status_code == 200
+
+
+def test_route_compact_flag_parses_strings(monkeypatch):
+    """compact 为字符串 "false" 时返回完整路线信息"""
+    from services.map_service import map_service
+
+    route = {'duration': 10, 'distance': 2.5, 'mode': '骑行', 'route_info': {'steps': [{'path': '120.1,30.2'}]}}
+    monkeypatch.setattr(map_service, 'calculate_route', lambda *args: {'success': True, 'data': route})
+    client = _test_app().test_client()
+    response = client.post('/api/map/route', headers=_auth_headers('route-user'), json={
+        'origin': {'lat': 30.2, 'lng': 120.1}, 'destination': {'lat': 30.3, 'lng': 120.2}, 'compact': 'false',
+    })
+    assert response.get_json()['data']['route_info'] == route['route_info']
+
+
+def test_place_lookup_escapes_like_and_buffers_usage(monkeypatch):
+    """搜索词中的 % 和 _ 按字面匹配；命中后的使用次数批量写回"""
+    from models import db
+    from models.place import Place
+    from services.place_store import lookup_places, place_usage
+
+    monkeypatch.setenv('PLACE_LOCAL_MIN_RESULTS', '1')
+    monkeypatch.setattr(place_usage, 'flush_interval', 3600)
+    with _test_app().app_context():
+        for name in ('100%纯果汁', '1000纯果汁', 'a_b 快递柜', 'axb 快递柜'):
+            db.session.add(Place(city='测试市', name=name, address='', lat=30.0, lng=120.0, usage_count=0))
+        db.session.commit()
+
+        assert [item['name'] for item in lookup_places('0%', '测试市')] == ['100%纯果汁']
+        assert [item['name'] for item in lookup_places('a_b', '测试市')] == ['a_b 快递柜']
+        assert Place.query.filter_by(name='a_b 快递柜').one().usage_count == 0
+
+        assert place_usage.flush() == 2
+        assert Place.query.filter_by(name='a_b 快递柜').one().usage_count == 1
+
+
+def test_dispatch_requires_deliverer_or_admin(monkeypatch):
+    """只有配送员本人或管理员能上报位置；只有管理员能手动触发派单"""
+    from models import db
+    from models.deliverer import Deliverer
+    from models.user import User
+    from services.dispatch import dispatch_engine
+
+    client = _test_app().test_client()
+    rider = _auth_headers('rider')
+    other = _auth_headers('not-the-rider')
+    admin = _auth_headers('dispatch-admin', is_admin=True)
+    with _test_app().app_context():
+        deliverer = Deliverer(name='骑手', user_id=User.query.filter_by(username='rider').one().id)
+        db.session.add(deliverer)
+        db.session.commit()
+        url = f'/api/dispatch/deliverers/{deliverer.id}/location'
+
+    location = {'lat': 30.3, 'lng': 120.1, 'status': 'offline'}
+    assert client.put(url, headers=other, json=location).status_code == 403
+    assert client.put(url, headers=rider, json=location).status_code == 200
+    assert client.put(url, headers=admin, json=location).status_code == 200
+
+    monkeypatch.setattr(dispatch_engine, 'run_round', lambda: {'matched': 0})
+    assert client.post('/api/dispatch/rounds', headers=rider).status_code == 403
+    assert client.post('/api/dispatch/rounds', headers=admin).status_code == 200
+
+
+def _create_order(headers, **fields):
+    """通过接口创建订单，返回订单数据"""
+    payload = {'origin': '紫金港西区', 'destination': '蓝田宿舍', 'amount': 5}
+    payload.update(fields)
+    response = _test_app().test_client().post('/api/orders/', headers=headers, json=payload)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']['orders'][0]
+
+
+def test_order_if_match_uses_get_etag():
+    """GET 返回的 ETag 可作为 If-Match；过期返回 412，无法解析的前置条件不会被忽略"""
+    from models import db
+    from models.order import Order
+
+    client = _test_app().test_client()
+    headers = _auth_headers('if-match-user')
+    order = _create_order(headers)
+    url = f"/api/orders/{order['id']}"
+
+    etag = client.get(url, headers=headers).headers['ETag']
+    with _test_app().app_context():
+        Order.query.filter_by(id=order['id']).update({'version': Order.version + 1})
+        db.session.commit()
+    assert client.post(f'{url}/cancel', headers=dict(headers, **{'If-Match': etag})).status_code == 412
+    assert client.post(f'{url}/cancel', headers=dict(headers, **{'If-Match': '"abc"'})).status_code == 412
+    assert client.post(f'{url}/cancel', headers=headers, json={'version': 'abc'}).status_code == 400
+
+    etag = client.get(url, headers=headers).headers['ETag']
+    response = client.post(f'{url}/cancel', headers=dict(headers, **{'If-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    # 字段投影的 ETag 同样可用
+    fields_etag = client.get(f'{url}?fields=id,order_status', headers=headers).headers['ETag']
+    assert client.delete(url, headers=dict(headers, **{'If-Match': fields_etag})).status_code == 200
+
+
+def test_order_ids_are_not_reused():
+    """删除 id 最大的订单后新订单使用新的 id；旧库的 orders 表启动时迁移为 AUTOINCREMENT"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.schema import CreateTable
+    from models.order import Order
+    from models.schema import _ensure_sqlite_autoincrement
+
+    client = _test_app().test_client()
+    headers = _auth_headers('order-id-user')
+    order = _create_order(headers)
+    url = f"/api/orders/{order['id']}"
+    assert client.post(f'{url}/cancel', headers=headers).status_code == 200
+    assert client.delete(url, headers=headers).status_code == 200
+    assert _create_order(headers)['id'] > order['id']
+
+    engine = create_engine('sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='zjulast1km-test-'), 'old.db'))
+    insert = text("INSERT INTO orders (id, user_id, start_address, end_address, total_amount, actual_amount, order_no, "
+                  "version) VALUES (:id, 1, 'a', 'b', 1, 1, :order_no, 0)")
+    with engine.begin() as conn:
+        ddl = str(CreateTable(Order.__table__).compile(dialect=engine.dialect))
+        conn.execute(text(ddl.replace(' AUTOINCREMENT', '')))
+        for order_id in (1, 2, 3):
+            conn.execute(insert, {'id': order_id, 'order_no': f'old-{order_id}'})
+        conn.execute(text("DELETE FROM orders WHERE id = 3"))
+        conn.execute(insert, {'id': None, 'order_no': 'reused'})
+        assert conn.execute(text("SELECT MAX(id) FROM orders")).scalar() == 3  # 迁移前 id 被复用
+        conn.execute(text("DELETE FROM orders WHERE id = 3"))
+    _ensure_sqlite_autoincrement(engine, Order.__table__)
+    with engine.begin() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM orders")).scalar() == 2
+        conn.execute(insert, {'id': None, 'order_no': 'new-1'})
+        conn.execute(text("DELETE FROM orders WHERE order_no = 'new-1'"))
+        conn.execute(insert, {'id': None, 'order_no': 'new-2'})
+        assert conn.execute(text("SELECT MAX(id) FROM orders")).scalar() > 3
+
+
+def test_order_stats_tolerate_string_numbers():
+    """字符串形式的预计时长按列类型写入事件快照；已记录的字符串快照不会阻塞统计检查点"""
+    import json
+    from datetime import datetime
+    from models import db
+    from models.order_event import OrderEvent
+    from models.order_rollup import RollupCheckpoint
+    from services.order_rollups import CHECKPOINT_NAME, order_rollups
+    from services.order_state import record_events
+
+    client = _test_app().test_client()
+    headers = _auth_headers('stats-user')
+    order = _create_order(headers, estimated_duration='15', origin_lat='30.30', origin_lng='120.08')
+    assert order['estimated_duration'] == 15
+    response = client.post('/api/orders/', headers=headers,
+                           json={'origin': 'a', 'destination': 'b', 'amount': 5, 'estimated_duration': 'abc'})
+    assert response.status_code == 400
+
+    with _test_app().app_context():
+        event = OrderEvent.query.filter_by(order_id=order['id'], event='create').one()
+        assert json.loads(event.payload)['estimated_duration'] == 15
+        # 修复前写入的事件
+        record_events([{'order_id': order['id'], 'user_id': order['user_id'], 'actor_id': None, 'event': 'create',
+                        'from_status': None, 'to_status': 'pending', 'version': 0, 'created_at': datetime.utcnow(),
+                        'payload': json.dumps({'actual_amount': '5', 'estimated_duration': 'abc'})}])
+        db.session.commit()
+        last_id = db.session.query(db.func.max(OrderEvent.id)).scalar()
+
+    with _test_app().app_context():
+        order_rollups.process()
+        assert db.session.get(RollupCheckpoint, CHECKPOINT_NAME).last_event_id == last_id
+    assert client.get('/api/stats/orders', headers=headers).status_code == 403
+    response = client.get('/api/stats/orders', headers=_auth_headers('stats-admin', is_admin=True))
+    assert response.status_code == 200, response.get_json()
+
+
+def test_analysis_jobs_recover_reap_and_finish(monkeypatch):
+    """启动时租约过期的 running 任务重新入队；超时任务被回收；识别中断时任务仍写入结束状态；等待者结束后被移除"""
+    import pytest
+    from datetime import datetime, timedelta
+    from models import db
+    from models.analysis_job import AnalysisJob
+    from models.user import User
+    from services import analysis_jobs as analysis_jobs_module
+    from services.analysis_jobs import AnalysisJobQueue
+
+    app = _test_app()
+    _auth_headers('analysis-user')
+    jobs = AnalysisJobQueue()
+    jobs._app = app
+    with app.app_context():
+        user_id = User.query.filter_by(username='analysis-user').one().id
+        recent = AnalysisJob(user_id=user_id, filename='a.jpg', status='running', worker_id='gone',
+                             started_at=datetime.utcnow() - timedelta(seconds=jobs.lease_timeout + 1))
+        db.session.add(recent)
+        db.session.commit()
+        jobs._recover()
+        assert db.session.get(AnalysisJob, recent.id, populate_existing=True).status == 'queued'
+        assert recent.id in [entry[2] for entry in jobs._queue.queue]
+
+        stale = AnalysisJob(user_id=user_id, filename='b.jpg', status='running',
+                            started_at=datetime.utcnow() - timedelta(seconds=jobs.job_timeout + 1))
+        db.session.add(stale)
+        db.session.commit()
+        assert jobs.reap() == 1
+        assert db.session.get(AnalysisJob, stale.id, populate_existing=True).status == 'failed'
+
+        def interrupted(path):
+            raise KeyboardInterrupt
+        monkeypatch.setattr(analysis_jobs_module.image_pipeline, 'ocr_path', lambda filename: filename)
+        monkeypatch.setattr(analysis_jobs_module.ai_service, 'analyze_image', interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            jobs._run(recent.id, recent.filename)
+        assert db.session.get(AnalysisJob, recent.id, populate_existing=True).status == 'failed'
+
+    assert jobs.wait('missing-job', 0.01) is False
+    assert jobs._waiters == {}
+
+
+def test_analysis_jobs_two_queues_share_one_database(monkeypatch):
+    """另一进程仍在续约的任务不会被重新入队；租约过期后由存活的进程接手，原进程的结果不会覆盖"""
+    from datetime import datetime, timedelta
+    from models import db
+    from models.analysis_job import AnalysisJob
+    from models.user import User
+    from services import analysis_jobs as analysis_jobs_module
+    from services.analysis_jobs import AnalysisJobQueue
+
+    app = _test_app()
+    _auth_headers('analysis-lease-user')
+    first, second = AnalysisJobQueue(), AnalysisJobQueue()
+    first._app = second._app = app
+    assert first.worker_id != second.worker_id
+    monkeypatch.setattr(analysis_jobs_module.image_pipeline, 'ocr_path', lambda filename: filename)
+    monkeypatch.setattr(analysis_jobs_module.ai_service, 'analyze_image', lambda path: {'worker': 'second'})
+    with app.app_context():
+        user_id = User.query.filter_by(username='analysis-lease-user').one().id
+        job = AnalysisJob(user_id=user_id, filename='lease.jpg')
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        # 第一个队列认领任务，第二个队列随后启动
+        claimed_at = datetime.utcnow() - timedelta(seconds=first.lease_timeout + 1)
+        db.session.execute(db.update(AnalysisJob).where(AnalysisJob.id == job_id).values(
+            status='running', worker_id=first.worker_id, started_at=claimed_at, heartbeat_at=claimed_at))
+        db.session.commit()
+        first.reap()  # 续约
+        second._recover()
+        assert db.session.get(AnalysisJob, job_id, populate_existing=True).status == 'running'
+        assert job_id not in [entry[2] for entry in second._queue.queue]
+        second.reap()
+        assert db.session.get(AnalysisJob, job_id, populate_existing=True).worker_id == first.worker_id
+
+        # 第一个队列停止续约：租约过期后第二个队列接手执行
+        db.session.execute(db.update(AnalysisJob).where(AnalysisJob.id == job_id).values(
+            heartbeat_at=datetime.utcnow() - timedelta(seconds=second.lease_timeout + 1)))
+        db.session.commit()
+        assert second.reap() == 0
+        assert [entry[2] for entry in second._queue.queue] == [job_id]
+        entry = second._queue.get_nowait()
+        second._run(entry[2], entry[4])
+        first._finish(job_id, 'failed', None, "进程被挂起")
+        finished = db.session.get(AnalysisJob, job_id, populate_existing=True)
+        assert finished.status == 'succeeded'
+        assert finished.worker_id == second.worker_id
+        assert finished.to_dict()['result'] == {'worker': 'second'}
+
+
+def test_analyze_image_waits_on_job_queue(monkeypatch):
+    """同步识别接口通过任务队列执行：完成时直接返回结果，失败返回 500，超时返回 202 与任务信息"""
+    import io
+    import threading
+    from PIL import Image
+    from services import analysis_jobs as analysis_jobs_module
+    from services.analysis_jobs import analysis_jobs
+    from services.image_pipeline import image_pipeline
+
+    app = _test_app()
+    client = app.test_client()
+    headers = _auth_headers('analyze-sync-user')
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (30, 120, 30)).save(buffer, 'PNG')
+    response = client.post('/api/orders/upload_image', headers=headers,
+                           data={'image': (io.BytesIO(buffer.getvalue()), 'sync.png')},
+                           content_type='multipart/form-data')
+    filename = response.get_json()['data']['filePath'].rsplit('/', 1)[-1]
+    with app.app_context():
+        image_pipeline.submit(filename).result(timeout=10)
+    monkeypatch.setattr(analysis_jobs_module.image_pipeline, 'ocr_path', lambda name: name)
+
+    monkeypatch.setattr(analysis_jobs_module.ai_service, 'analyze_image', lambda path: {'description': path})
+    response = client.post('/api/orders/analyze-image', headers=headers, json={'filename': filename})
+    assert response.status_code == 200
+    assert response.get_json()['data'] == {'description': filename}
+
+    def broken(path):
+        raise RuntimeError('ocr down')
+    monkeypatch.setattr(analysis_jobs_module.ai_service, 'analyze_image', broken)
+    response = client.post('/api/orders/analyze-image', headers=headers, json={'filename': filename})
+    assert response.status_code == 500
+    assert 'ocr down' in response.get_json()['message']
+
+    release = threading.Event()
+    monkeypatch.setattr(analysis_jobs_module.ai_service, 'analyze_image', lambda path: release.wait(10) and {})
+    monkeypatch.setitem(app.config, 'ANALYZE_SYNC_TIMEOUT', 0.2)
+    response = client.post('/api/orders/analyze-image', headers=headers, json={'filename': filename})
+    release.set()
+    assert response.status_code == 202
+    job = response.get_json()['data']
+    assert job['status'] in ('queued', 'running')
+    for _ in range(100):
+        status = client.get(f"/api/orders/analyze-jobs/{job['id']}", headers=headers).get_json()['data']['status']
+        if status not in ('queued', 'running'):
+            break
+        analysis_jobs.wait(job['id'], 0.1)
+    assert status == 'succeeded'
+
+    assert client.post('/api/orders/analyze-image', headers=headers, json={}).status_code == 400
+
+
+def test_analysis_cache_clear_requires_admin(monkeypatch):
+    """识别缓存为全局共享，只有管理员可以清除"""
+    from services.ai_cache import ai_cache
+
+    cleared = []
+    monkeypatch.setattr(ai_cache, 'invalidate', lambda kind, stale_only=False: cleared.append(kind) or 0)
+    client = _test_app().test_client()
+    user = _auth_headers('ai-cache-user')
+    admin = _auth_headers('ai-cache-admin', is_admin=True)
+
+    assert client.delete('/api/orders/analysis-cache', headers=user).status_code == 403
+    assert cleared == []
+    assert client.delete('/api/orders/analysis-cache?kind=ocr', headers=admin).status_code == 200
+    assert cleared == ['ocr']
+
+
+def test_upload_gc_keeps_files_reuploaded_during_sweep(monkeypatch):
+    """回收删除记录后若相同内容被重新上传，文件被放回；无人上传时文件被删除"""
+    import io
+    from datetime import datetime, timedelta
+    from models import db
+    from models.blob import Blob
+    from services.storage import storage
+    from services.upload_gc import upload_collector
+
+    def old_blob(content):
+        name = storage.save(io.BytesIO(content), 'jpg')
+        long_ago = datetime.utcnow() - timedelta(days=2)
+        Blob.query.filter_by(name=name).update({'ref_count': 0, 'uploaded_at': long_ago,
+                                                'unreferenced_since': long_ago})
+        db.session.commit()
+        return name
+
+    with _test_app().app_context():
+        reuploaded = old_blob(b'gc-race')
+        detach = storage.detach
+
+        def detach_during_upload(name):
+            # 模拟并发上传：在回收删除记录之后、移走文件之前重新登记
+            if name == reuploaded:
+                storage._register(name, 7)
+            return detach(name)
+        monkeypatch.setattr(storage, 'detach', detach_during_upload)
+        upload_collector.run(grace_hours=1)
+        assert storage.exists(reuploaded)
+        assert db.session.get(Blob, reuploaded) is not None
+
+        monkeypatch.setattr(storage, 'detach', detach)
+        orphan = old_blob(b'gc-orphan')
+        assert upload_collector.run(grace_hours=1)['removed'] == 1
+        assert not storage.exists(orphan)
+        assert not os.path.exists(storage.path(orphan) + '.deleting')
+
+
+def test_storage_backend_requires_full_interface():
+    """存储后端必须实现全部接口，缺少方法时无法实例化"""
+    import pytest
+    from services.storage import LocalHashedStorage, StorageBackend
+
+    class ReadOnlyStorage(StorageBackend):
+        def path(self, name):
+            return name
+
+    with pytest.raises(TypeError):
+        ReadOnlyStorage()
+    with pytest.raises(TypeError):
+        StorageBackend()
+    assert isinstance(LocalHashedStorage(), StorageBackend)
+
+
+def test_uploaded_images_cache_privately(monkeypatch):
+    """上传图片只允许私有缓存：内容寻址原图支持 304 与 Range，?size= 重定向到缩略图自己的地址"""
+    import io
+    from PIL import Image
+    from services.image_pipeline import image_pipeline
+
+    client = _test_app().test_client()
+    headers = _auth_headers('upload-user')
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300), (200, 30, 30)).save(buffer, 'PNG')
+    response = client.post('/api/orders/upload_image', headers=headers,
+                           data={'image': (io.BytesIO(buffer.getvalue()), 'order.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    url = response.get_json()['data']['filePath']
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == buffer.getvalue()
+    assert response.cache_control.private and response.cache_control.immutable
+    assert not response.cache_control.public
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    partial = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206
+    assert partial.data == buffer.getvalue()[:10]
+
+    # 缩略图未生成：返回原图，不能长期缓存
+    monkeypatch.setattr(image_pipeline, 'thumbnail_for', lambda filename, size: None)
+    response = client.get(f'{url}?size=128')
+    assert response.status_code == 200
+    assert not response.cache_control.immutable and not response.cache_control.public
+    monkeypatch.undo()
+
+    with _test_app().app_context():
+        # 等待上传时提交的后台处理完成
+        image_pipeline.submit(url.rsplit('/', 1)[-1]).result(timeout=10)
+    response = client.get(f'{url}?size=128')
+    assert response.status_code == 302
+    thumbnail = client.get(response.headers['Location'])
+    assert thumbnail.status_code == 200
+    assert thumbnail.cache_control.private and thumbnail.cache_control.immutable
+    with Image.open(io.BytesIO(thumbnail.data)) as image:
+        assert max(image.size) == 128
+
+
+def _deliverer_headers(username):
+    """创建绑定到测试用户的配送员，返回 (请求头, 配送员 id)"""
+    from models import db
+    from models.deliverer import Deliverer
+    from models.user import User
+
+    headers = _auth_headers(username)
+    with _test_app().app_context():
+        user_id = User.query.filter_by(username=username).one().id
+        deliverer = Deliverer.query.filter_by(user_id=user_id).first()
+        if deliverer is None:
+            deliverer = Deliverer(name=username, user_id=user_id)
+            db.session.add(deliverer)
+            db.session.commit()
+        return headers, deliverer.id
+
+
+def test_nearby_orders_for_deliverers_only():
+    """附近订单仅配送员和管理员可查，只返回公开字段，不含订单图片、取件码和下单用户"""
+    client = _test_app().test_client()
+    owner = _auth_headers('nearby-owner')
+    _create_order(owner, origin_lat=30.2601, origin_lng=120.1201, dest_lat=30.27, dest_lng=120.13,
+                  image='secret.png', order_info='取件码 1234', origin_detail='3 号楼 201')
+    rider, _deliverer_id = _deliverer_headers('nearby-rider')
+    url = '/api/orders/nearby?lat=30.26&lng=120.12&radius=500'
+
+    assert client.get(url, headers=_auth_headers('nearby-other')).status_code == 403
+    response = client.get(url, headers=rider)
+    assert response.status_code == 200
+    orders = response.get_json()['data']
+    assert orders and 'distance' in orders[0]
+    for order in orders:
+        assert not {'order_image', 'pickup_code', 'user_id', 'origin_detail', 'item_description'} & set(order)
+    assert client.get(url, headers=_auth_headers('nearby-admin', is_admin=True)).status_code == 200
+
+
+def test_multi_stop_plan_picks_up_before_dropoff():
+    """取送顺序始终先取件后送达，即使先去送达点更近"""
+    import numpy as np
+    from services.route_planner import MultiStopPlan
+
+    def stops_for(count):
+        stops = []
+        for order_id in range(count):
+            stops.append({'order_id': order_id, 'type': 'pickup'})
+            stops.append({'order_id': order_id, 'type': 'dropoff'})
+        return stops
+
+    # 起点(索引 2)紧挨送达点，取件点很远：时间最短但不可行的顺序是先送达
+    durations = [[0, 10, 10], [10, 0, 1], [10, 1, 0]]
+    plan = MultiStopPlan(stops_for(1), durations, durations, start_index=2)
+    assert plan.solve() == [0, 1]
+
+    random = np.random.RandomState(7)
+    for count in (2, 3, 5):
+        points = random.rand(2 * count + 1, 2)
+        matrix = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)).tolist()
+        plan = MultiStopPlan(stops_for(count), matrix, matrix, start_index=2 * count)
+        route = plan.solve()
+        assert sorted(route) == list(range(2 * count))
+        assert plan.feasible(route)
+
+
+def test_deliverer_plan_requires_deliverer_or_admin(monkeypatch):
+    """配送路线仅配送员本人或管理员可查；停靠点过多时 exact 退回估算，不发出路线矩阵请求"""
+    from models import db
+    from models.order import Order
+    from services.map_service import map_service
+
+    client = _test_app().test_client()
+    rider, deliverer_id = _deliverer_headers('plan-rider')
+    owner = _auth_headers('plan-owner')
+    order = _create_order(owner, origin_lat=30.30, origin_lng=120.08, dest_lat=30.31, dest_lng=120.09)
+    with _test_app().app_context():
+        Order.query.filter_by(id=order['id']).update({'deliverer_id': deliverer_id})
+        db.session.commit()
+    url = f'/api/dispatch/deliverers/{deliverer_id}/plan'
+
+    assert client.get(url, headers=owner).status_code == 403
+    response = client.get(url, headers=rider)
+    assert response.status_code == 200
+    assert [stop['type'] for stop in response.get_json()['data']['stops']] == ['pickup', 'dropoff']
+    assert client.get(url, headers=_auth_headers('plan-admin', is_admin=True)).status_code == 200
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError('不应请求路线矩阵')
+    monkeypatch.setattr(map_service, 'route_matrix', unexpected)
+    monkeypatch.setattr(map_service, 'matrix_max_cells', 1)
+    response = client.get(f'{url}?exact=1', headers=rider)
+    assert response.status_code == 200
+    assert response.get_json()['data']['source'] == 'estimate'
+
+
+def test_image_variant_names_follow_settings(monkeypatch):
+    """派生图文件名包含参数摘要：质量配置变化后重新生成新文件名的缩略图，并删除旧文件"""
+    import io
+    from PIL import Image
+    from services.image_pipeline import ImagePipeline
+    from services.storage import is_content_addressed, storage
+
+    pipeline = ImagePipeline()
+    pipeline.thumbnail_sizes = (64,)
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 100), (20, 120, 20)).save(buffer, 'PNG')
+    with _test_app().app_context():
+        source = storage.save(io.BytesIO(buffer.getvalue()), 'png')
+        first = {variant.variant: variant.filename for variant in pipeline.process(source)}
+        assert all(is_content_addressed(name) and storage.exists(name) for name in first.values())
+
+        # 配置未变：文件名不变
+        assert {variant.variant: variant.filename for variant in pipeline.process(source)} == first
+
+        pipeline.thumbnail_quality -= 10
+        second = {variant.variant: variant.filename for variant in pipeline.process(source)}
+        assert second['64'] != first['64'] and second['ocr'] == first['ocr']
+        assert storage.exists(second['64']) and not storage.exists(first['64'])
+        assert pipeline.thumbnail_for(source, 64) == second['64']
+
+
+def test_order_state_machine_conflicts():
+    """状态迁移的冲突判定：并发接单只有一个成功，权限、状态、版本冲突分别返回 403/409，失败不记事件"""
+    import threading
+    import pytest
+    from models import db
+    from models.order_event import OrderEvent
+    from models.user import User
+    from services.order_state import OrderTransitionError, order_state
+
+    owner = _auth_headers('state-owner')
+    _rider, deliverer_id = _deliverer_headers('state-rider')
+    order_id = _create_order(owner)['id']
+    app = _test_app()
+    with app.app_context():
+        owner_id = User.query.filter_by(username='state-owner').one().id
+
+    outcomes = []
+    barrier = threading.Barrier(4)
+
+    def assign():
+        with app.app_context():
+            barrier.wait()
+            try:
+                order_state.transition(order_id, 'assign', values={'deliverer_id': deliverer_id})
+                outcomes.append('ok')
+            except OrderTransitionError as e:
+                db.session.rollback()
+                outcomes.append(e.status_code)
+
+    threads = [threading.Thread(target=assign) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(outcomes, key=str) == [409, 409, 409, 'ok']
+
+    with app.app_context():
+        def rejected(event, **kwargs):
+            with pytest.raises(OrderTransitionError) as info:
+                order_state.transition(order_id, event, **kwargs)
+            db.session.rollback()
+            return info.value
+
+        events = OrderEvent.query.filter_by(order_id=order_id).count()
+        assert rejected('cancel', owner_id=owner_id + 1000).status_code == 403
+        stale = rejected('cancel', owner_id=owner_id, expected_version=0)
+        assert (stale.status_code, stale.current_version) == (409, 1)
+        assert rejected('delete', owner_id=owner_id).status_code == 409
+        assert OrderEvent.query.filter_by(order_id=order_id).count() == events
+
+        order = order_state.transition(order_id, 'cancel', owner_id=owner_id, expected_version=1)
+        assert (order.order_status, order.version) == ('cancelled', 2)
+        conflict = rejected('complete', owner_id=owner_id)
+        assert (conflict.status_code, conflict.current_status) == (409, 'cancelled')
+        assert rejected('cancel', owner_id=owner_id).status_code == 409
+        assert [event.event for event in OrderEvent.query.filter_by(order_id=order_id).order_by(OrderEvent.id)] \
+            == ['create', 'assign', 'cancel']
+
+        with pytest.raises(OrderTransitionError) as info:
+            order_state.transition(order_id + 100000, 'cancel')
+        assert info.value.status_code == 404
+
+
+def test_order_listing_reads_through_archive():
+    """归档后的订单仍出现在分页列表中，跨热表与归档表的游标分页不重不漏；详情接口读取归档表"""
+    from datetime import datetime, timedelta
+    from models import db
+    from models.order import Order, OrderArchive
+    from services.order_archive import order_archiver
+
+    client = _test_app().test_client()
+    headers = _auth_headers('archive-user')
+    ids = [_create_order(headers)['id'] for _ in range(5)]
+    for order_id in ids:
+        assert client.post(f'/api/orders/{order_id}/cancel', headers=headers).status_code == 200
+    with _test_app().app_context():
+        # 交替把订单移到 40 天前，归档后两张表的订单交错排列
+        for offset, order_id in enumerate(ids):
+            moment = datetime.utcnow() - timedelta(days=40 + offset) if offset % 2 == 0 \
+                else datetime.utcnow() - timedelta(minutes=offset)
+            Order.query.filter_by(id=order_id).update({'created_at': moment, 'cancelled_at': moment})
+        db.session.commit()
+        assert order_archiver.run(retention_days=30)['archived'] >= 3
+        archived = {order.id for order in OrderArchive.query.filter(OrderArchive.id.in_(ids))}
+    assert archived == {ids[0], ids[2], ids[4]}
+
+    seen, cursor = [], None
+    while True:
+        url = '/api/orders/?limit=2&status=cancelled' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(url, headers=headers).get_json()['data']
+        seen.extend(order['id'] for order in data['items'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert seen == [ids[1], ids[3], ids[0], ids[2], ids[4]]
+
+    response = client.get(f'/api/orders/{ids[2]}', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['data']['order_status'] == 'cancelled'
+
+
+def test_order_rollups_catch_up_incrementally():
+    """统计只处理检查点之后的新事件，分批补处理；统计接口只读，不触发处理"""
+    from datetime import datetime, timedelta
+    from models import db
+    from models.order_rollup import RollupCheckpoint
+    from services.order_rollups import CHECKPOINT_NAME, order_rollups
+
+    client = _test_app().test_client()
+    headers = _auth_headers('rollup-user')
+    admin = _auth_headers('rollup-admin', is_admin=True)
+    now = datetime.utcnow()
+    start, end = now - timedelta(days=1), now + timedelta(days=1)
+    with _test_app().app_context():
+        order_rollups.process()
+        before = order_rollups.query('day', start, end)['totals']
+        checkpoint = db.session.get(RollupCheckpoint, CHECKPOINT_NAME).last_event_id
+
+    ids = [_create_order(headers, amount=10, estimated_duration=20)['id'] for _ in range(3)]
+    assert client.post(f'/api/orders/{ids[0]}/complete', headers=headers).status_code == 200
+    assert client.post(f'/api/orders/{ids[1]}/cancel', headers=headers).status_code == 200
+
+    # 统计接口不处理积压事件
+    stats_url = f'/api/stats/orders?from={start.isoformat()}&to={end.isoformat()}'
+    assert client.get(stats_url, headers=admin).get_json()['data']['totals'] == before
+
+    with _test_app().app_context():
+        batch_size = order_rollups.batch_size
+        order_rollups.batch_size = 2
+        try:
+            summary = order_rollups.process(max_batches=1)
+            assert summary['processed'] == 2
+            assert db.session.get(RollupCheckpoint, CHECKPOINT_NAME, populate_existing=True).last_event_id \
+                > checkpoint
+            assert order_rollups.process()['processed'] == 3
+            assert order_rollups.process()['processed'] == 0
+        finally:
+            order_rollups.batch_size = batch_size
+
+    totals = client.get(stats_url, headers=admin).get_json()['data']['totals']
+    assert totals['orders'] == before['orders'] + 3
+    assert totals['completed'] == before['completed'] + 1
+    assert totals['cancelled'] == before['cancelled'] + 1
+    assert totals['gmv'] == before['gmv'] + 10
+
+
 if __name__ == "__main__":
     result = test_route_parsing()
     print(f"\n最终结果: {result}")
\ No newline at end of file
@@ -0,0 +1,14 @@
+from functools import wraps
+from flask import current_app
+
+
+def with_app_context(fn):
+    """包装函数，使其在后台线程中也运行于当前 Flask 应用上下文"""
+    app = current_app._get_current_object()
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return wrapper
@@ -4,15 +4,23 @@ from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request, exceptio
 from models.user import User
 from utils.response import error_response
 
-def token_required(f):
-    """JWT token验证装饰器"""
+def token_required(f=None, locations=None):
+    """
+    JWT token验证装饰器
+
+    locations 指定 token 的来源，例如 EventSource 无法设置请求头，
+    事件流接口使用 @token_required(locations=['headers', 'query_string'])
+    """
+    if f is None:
+        return lambda func: token_required(func, locations)
+
     @wraps(f)
     def decorated(*args, **kwargs):
         # Handle OPTIONS request for CORS preflight
         if request.method == 'OPTIONS':
             return Response(status=200) # Allow preflight
         try:
-            verify_jwt_in_request()
+            verify_jwt_in_request(locations=locations)
             current_user_id = get_jwt_identity()
             current_user = User.query.get(current_user_id)
             if not current_user:
@@ -38,3 +46,14 @@ def token_required(f):
             current_app.logger.error(f"An unexpected error occurred during token verification: {str(e)}")
             return error_response("token验证失败", 401)
     return decorated
+
+
+def admin_required(f):
+    """管理员权限验证装饰器（包含 token 验证），用于影响所有用户的全局操作"""
+    @wraps(f)
+    @token_required
+    def decorated(current_user, *args, **kwargs):
+        if not current_user.is_admin:
+            return error_response("需要管理员权限", 403)
+        return f(current_user, *args, **kwargs)
+    return decorated
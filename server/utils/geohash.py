@@ -0,0 +1,92 @@
+import math
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {char: index for index, char in enumerate(_BASE32)}
+METERS_PER_DEGREE = 111320.0
+
+
+def encode(lat, lng, precision=9):
+    """将经纬度编码为 geohash 字符串"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def decode_bbox(geohash):
+    """返回 geohash 单元的 (最小纬度, 最小经度, 最大纬度, 最大经度)"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lng_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            target[1 - bit] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size_deg(precision):
+    """某精度下单元的 (纬度跨度, 经度跨度)，单位度"""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def neighbors(geohash):
+    """返回包含自身在内的 3×3 邻近单元"""
+    min_lat, min_lng, max_lat, max_lng = decode_bbox(geohash)
+    height, width = max_lat - min_lat, max_lng - min_lng
+    center_lat, center_lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    cells = []
+    for d_lat in (-1, 0, 1):
+        for d_lng in (-1, 0, 1):
+            lat = center_lat + d_lat * height
+            if not -90 <= lat <= 90:
+                continue
+            lng = (center_lng + d_lng * width + 180) % 360 - 180
+            cell = encode(lat, lng, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def cover(lat, lng, radius_m, max_precision=9):
+    """
+    返回覆盖以 (lat, lng) 为圆心、radius_m 为半径的圆的 geohash 前缀列表
+
+    选择单元边长不小于半径的最大精度，此时中心单元及其 8 个邻居必然覆盖整个圆。
+    """
+    precision = 1
+    for candidate in range(max_precision, 0, -1):
+        height_deg, width_deg = cell_size_deg(candidate)
+        height_m = height_deg * METERS_PER_DEGREE
+        width_m = width_deg * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        if min(height_m, width_m) >= radius_m:
+            precision = candidate
+            break
+    return neighbors(encode(lat, lng, precision))
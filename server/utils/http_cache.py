@@ -0,0 +1,27 @@
+import hashlib
+
+from flask import request, Response
+
+
+def make_etag(*parts):
+    """由若干版本信息计算 ETag 值（不含引号）"""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return digest[:20]
+
+
+def is_not_modified(etag):
+    """请求的 If-None-Match 是否已包含该 ETag（按弱比较）"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified_response(etag):
+    """304 响应，不含响应体"""
+    response = Response(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    """为响应附加 ETag，并要求客户端每次使用前重新验证"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,28 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(created_at, record_id):
+    """将 (created_at, id) 编码为不透明的游标字符串"""
+    payload = json.dumps({'t': created_at.isoformat() if created_at else None, 'i': record_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (created_at, id)；格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        created_at = datetime.fromisoformat(payload['t']) if payload.get('t') else None
+        return created_at, int(payload['i'])
+    except (ValueError, KeyError, TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+
+def parse_limit(value, default=20, maximum=100):
+    """解析分页大小参数，限制在 1..maximum 之间"""
+    if value in (None, ''):
+        return default
+    limit = int(value)
+    return max(1, min(limit, maximum))
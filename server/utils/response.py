@@ -14,7 +14,7 @@ def success_response(data=None, message="操作成功", status_code=200):
     response.status_code = status_code
     return response
 
-def error_response(message="操作失败", status_code=400, error_code=None):
+def error_response(message="操作失败", status_code=400, error_code=None, errors=None):
     """错误响应格式化"""
     response_data = {
         'success': False,
@@ -24,6 +24,9 @@ def error_response(message="操作失败", status_code=400, error_code=None):
     if error_code:
         response_data['error_code'] = error_code
     
+    if errors:
+        response_data['errors'] = errors
+    
     response = jsonify(response_data)
     response.status_code = status_code
     return response
@@ -41,3 +44,11 @@ def paginated_response(items, pagination, message="获取成功"):
             'has_prev': pagination.has_prev
         }
     }, message)
+
+def cursor_response(items, next_cursor=None, message="获取成功"):
+    """游标分页响应格式化"""
+    return success_response({
+        'items': items,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }, message)
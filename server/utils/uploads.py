@@ -0,0 +1,54 @@
+import mimetypes
+import os
+from flask import abort, current_app, request, send_file
+
+
+def upload_folder():
+    """上传目录（需在应用上下文中调用）"""
+    return current_app.config.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'server/static/uploads'))
+
+
+def send_upload(filename, path, immutable=False):
+    """
+    发送上传文件，支持 If-None-Match 与 Range
+
+    immutable 为 True 时（内容寻址文件名，内容不会变化）以文件名中的哈希作强 ETag，并允许客户端长期缓存；
+    其它文件按修改时间生成 ETag，每次使用前重新验证。
+    上传文件包含订单图片（取件码等），一律只允许浏览器缓存（private），不允许 CDN 等共享缓存保存。
+    配置 UPLOAD_ACCEL_REDIRECT 时只返回 X-Accel-Redirect 头，由 nginx 发送文件；
+    开启 USE_X_SENDFILE 时由 send_file 返回 X-Sendfile 头。
+    """
+    if not os.path.isfile(path):
+        abort(404)
+    etag = os.path.splitext(filename)[0] if immutable else True
+    max_age = current_app.config.get('UPLOAD_CACHE_MAX_AGE', 31536000) if immutable else None
+
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT')
+    if accel_prefix:
+        response = _accel_redirect(accel_prefix, filename, path, etag, max_age)
+    else:
+        response = send_file(path, conditional=True, etag=etag, max_age=max_age)
+        response.cache_control.public = False
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+def _accel_redirect(prefix, filename, path, etag, max_age):
+    """交给 nginx internal location 发送文件，Range 由 nginx 处理；可缓存的文件在这里直接响应 304"""
+    response = current_app.response_class(
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    relative = os.path.relpath(path, upload_folder()).replace(os.sep, '/')
+    response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{relative}"
+    if max_age is None:
+        response.cache_control.no_cache = True
+        return response
+
+    response.set_etag(etag)
+    response.cache_control.max_age = max_age
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        response.headers.pop('X-Accel-Redirect', None)
+    return response